@@ -14,6 +14,7 @@ from requests.utils import dict_from_cookiejar
 # Import configs
 from config import guess_mime
 from db_utils import to_num, map_header
+from llm_client import complete, LLMUnavailable
 
 try:
     from openpyxl import load_workbook
@@ -216,13 +217,12 @@ def parse_ai_json(text_response: str) -> dict:
 
 # In ai_utils.py
 
-def _call_pollinations(prompt: str, data_context: str = "", model: str = "openai") -> dict:
+def _call_pollinations(prompt: str, data_context: str = "", model: str = "openai", cache: bool = True) -> dict:
     """
     Sends the request to Pollinations.ai.
     Models: 'openai' (GPT-4o-mini equivalent), 'qwen' (Qwen 2.5), 'searchgpt'.
+    cache=False skips llm_client's response cache (a fresh answer is wanted).
     """
-    url = "https://text.pollinations.ai/"
-    
     # Construct a strong system message
     full_prompt = f"{prompt}\n\nDATA:\n{data_context}" if data_context else prompt
     
@@ -230,21 +230,18 @@ def _call_pollinations(prompt: str, data_context: str = "", model: str = "openai
     # 'openai' is usually the most stable for JSON. 'qwen' is good for logic.
     selected_model = model if model in ["openai", "qwen", "searchgpt"] else "openai"
     
-    payload = {
-        "messages": [
-            {"role": "system", "content": "You are a strict JSON data processing engine. You only output valid JSON. No conversational text."},
-            {"role": "user", "content": full_prompt}
-        ],
-        "model": selected_model,
-        "jsonMode": True
-    }
+    messages = [
+        {"role": "system", "content": "You are a strict JSON data processing engine. You only output valid JSON. No conversational text."},
+        {"role": "user", "content": full_prompt}
+    ]
     
-    # Increased timeout to 60s and retries
+    # Pooling, timeouts, caching and the circuit breaker live in llm_client.
+    # Retry once here as well, so an unparseable reply gets a second call.
     for attempt in range(2):
         try:
-            r = requests.post(url, json=payload, timeout=60)
-            if r.status_code == 200:
-                return parse_ai_json(r.text)
+            return complete(messages, model=selected_model, json_mode=True, parse=parse_ai_json, cache=cache)
+        except LLMUnavailable:
+            raise
         except Exception as e:
             print(f"[Pollinations] Attempt {attempt+1} Error: {e}")
             time.sleep(2)
@@ -835,10 +832,11 @@ def normalize_functionality(raw_bullets, category, condition, tester_comment):
 
 
 
-def generate_ebay_listing_content(item_data: dict) -> dict:
+def generate_ebay_listing_content(item_data: dict, cache: bool = True) -> dict:
     """
     Generates Title and the specific HTML Template requested.
     Now uses Pollinations instead of Gemini for robust free access.
+    Pass cache=False to regenerate: identical prompts otherwise get the cached reply.
     """
     product_name = item_data.get('product_name_raw', '')
     condition = f"Grade {item_data.get('grade', '')} ({item_data.get('condition', '')})"
@@ -846,6 +844,9 @@ def generate_ebay_listing_content(item_data: dict) -> dict:
     notes = item_data.get('tester_comment', '')
     category = item_data.get('category_label', '')
 
+    # Set when a call failed and a fallback was used; such output isn't stored as a draft.
+    degraded = False
+
     # --- 1. Generate Title ---
     title_prompt = f"""
     You are a professional e-commerce title writer for eBay.
@@ -864,11 +865,12 @@ def generate_ebay_listing_content(item_data: dict) -> dict:
     """
     
     try:
-        title_resp = _call_pollinations(title_prompt)
+        title_resp = _call_pollinations(title_prompt, cache=cache)
         title = title_resp.get("title", product_name[:80])
     except Exception as e:
         print(f"Title Gen Error: {e}")
         title = product_name[:80]
+        degraded = True
 
     # --- 2. Generate Description Data ---
     desc_prompt = f"""
@@ -885,10 +887,11 @@ def generate_ebay_listing_content(item_data: dict) -> dict:
     """
     
     try:
-        data = _call_pollinations(desc_prompt)
+        data = _call_pollinations(desc_prompt, cache=cache)
     except Exception as e:
         print(f"Desc Gen Error: {e}")
         data = {"condition": condition, "functionality": [], "included": "Device only"}
+        degraded = True
 
     # --- 3. Normalize & Format ---
     
@@ -948,5 +951,6 @@ def generate_ebay_listing_content(item_data: dict) -> dict:
 
     return {
         "title": title,
-        "html": html_output
+        "html": html_output,
+        "degraded": degraded
     }
\ No newline at end of file
@@ -0,0 +1,183 @@
+# assistant_context.py
+"""
+Precomputed data context for the assistant (/assistant/insights, /assistant/chat).
+
+The aggregate queries over inventory, POs and sales run in the background, in
+parallel on separate pooled connections, and their result is stored as a
+versioned row in assistant_context_snapshots. Assistant requests only read
+the newest snapshot, so their latency is the LLM call.
+
+refresh_assistant_context() is scheduled every ASSISTANT_CONTEXT_CHECK_SECONDS
+and rebuilds when inventory changed since the snapshot (the newest
+inventory_row_changes version moved) or the snapshot is older than
+ASSISTANT_CONTEXT_MAX_AGE_SECONDS. An advisory lock keeps the rebuild to one
+worker at a time. Until a first snapshot exists, a request builds it inline.
+
+    python assistant_context.py --refresh
+"""
+import os
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Optional, Sequence
+
+from db_utils import db
+
+log = logging.getLogger(__name__)
+
+ASSISTANT_CONTEXT_CHECK_SECONDS = int(os.getenv("ASSISTANT_CONTEXT_CHECK_SECONDS", "30"))
+ASSISTANT_CONTEXT_MAX_AGE_SECONDS = int(os.getenv("ASSISTANT_CONTEXT_MAX_AGE_SECONDS", "900"))
+_KEEP_SNAPSHOTS = 5
+
+_SNAPSHOTS_DDL = """
+CREATE TABLE IF NOT EXISTS assistant_context_snapshots (
+  version        bigserial PRIMARY KEY,
+  source_version bigint NOT NULL,          -- newest inventory_row_changes version seen
+  computed_at    timestamptz NOT NULL DEFAULT now(),
+  build_ms       integer,
+  context        jsonb NOT NULL
+);
+"""
+
+# context key -> (query, "rows" | "count")
+CONTEXT_QUERIES: Dict[str, tuple] = {
+    # 1. BROKEN LINKS (Posted but no URL)
+    "broken_links_sample": ("""
+        SELECT LEFT(pl.product_name_raw, 40) as n, i.synergy_code as s, i.cost_unit as c, COALESCE(u.name, 'Unknown') as poster
+        FROM inventory_items i
+        JOIN po_lines pl ON i.po_line_id = pl.id
+        LEFT JOIN app_users u ON i.posted_by = CAST(u.id AS TEXT)
+        WHERE i.status = 'POSTED'
+          AND (i.ebay_item_url IS NULL OR i.ebay_item_url = '')
+        ORDER BY i.cost_unit DESC NULLS LAST
+        LIMIT 100
+    """, "rows"),
+    "broken_links_count": ("""
+        SELECT COUNT(*) as count FROM inventory_items WHERE status = 'POSTED' AND (ebay_item_url IS NULL OR ebay_item_url = '')
+    """, "count"),
+    "sales": ("""
+        SELECT LEFT(pl.product_name_raw, 30) as p, COUNT(*) as n, SUM(i.sold_price) as rev
+        FROM inventory_items i JOIN po_lines pl ON i.po_line_id = pl.id
+        WHERE i.status = 'SOLD' AND i.sold_at > NOW() - INTERVAL '30 days'
+        GROUP BY pl.product_name_raw ORDER BY rev DESC LIMIT 5
+    """, "rows"),
+    # Counted per poster before the join: a few users, not every posted item.
+    "team": ("""
+        SELECT u.name, SUM(p.n)::bigint as posts
+        FROM (SELECT posted_by, COUNT(*) AS n FROM inventory_items WHERE posted_by IS NOT NULL GROUP BY posted_by) p
+        JOIN app_users u ON p.posted_by = CAST(u.id AS TEXT)
+        WHERE u.active = true GROUP BY u.name ORDER BY posts DESC LIMIT 5
+    """, "rows"),
+}
+
+_SOURCE_VERSION_SQL = "SELECT COALESCE(MAX(version), 0) AS v FROM inventory_row_changes"
+_LATEST_SQL = """
+    SELECT version, source_version, computed_at, build_ms, context,
+           computed_at < now() - make_interval(secs => %s) AS expired
+    FROM assistant_context_snapshots ORDER BY version DESC LIMIT 1
+"""
+_LOCK_KEY = "hashtext('assistant_context')"
+
+
+def _json_default(obj):
+    if isinstance(obj, Decimal): return float(obj)
+    if isinstance(obj, (datetime, date)): return obj.isoformat()
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+
+def ensure_assistant_context():
+    """Create the snapshot table. Safe on every worker start."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('assistant_context_snapshots'))")
+        cur.execute(_SNAPSHOTS_DDL)
+        con.commit()
+
+
+def _run_query(key: str) -> Any:
+    sql, shape = CONTEXT_QUERIES[key]
+    with db() as (con, cur):
+        cur.execute(sql)
+        if shape == "count":
+            return cur.fetchone()["count"]
+        return [dict(r) for r in cur.fetchall()]
+
+
+def build_context() -> Dict[str, Any]:
+    """Run every context query, in parallel, each on its own pooled connection."""
+    with ThreadPoolExecutor(max_workers=len(CONTEXT_QUERIES), thread_name_prefix="assistant-ctx") as pool:
+        futures = {key: pool.submit(_run_query, key) for key in CONTEXT_QUERIES}
+        return {key: f.result() for key, f in futures.items()}
+
+
+def _latest(cur) -> Optional[Dict[str, Any]]:
+    cur.execute(_LATEST_SQL, (ASSISTANT_CONTEXT_MAX_AGE_SECONDS,))
+    row = cur.fetchone()
+    return dict(row) if row else None
+
+
+def refresh_assistant_context(force: bool = False) -> Optional[int]:
+    """
+    Scheduled: store a new snapshot when inventory changed or the newest one
+    expired. Returns the new version, or None when nothing was rebuilt.
+    """
+    with db() as (con, cur):
+        # Transaction-scoped: released with the commit or rollback, so a failed
+        # INSERT cannot leave it held on a pooled connection.
+        cur.execute(f"SELECT pg_try_advisory_xact_lock({_LOCK_KEY}) AS ok")
+        if not cur.fetchone()["ok"]:
+            return None  # another worker is rebuilding
+        cur.execute(_SOURCE_VERSION_SQL)
+        source_version = cur.fetchone()["v"]
+        latest = _latest(cur)
+        if not force and latest and latest["source_version"] == source_version and not latest["expired"]:
+            return None
+
+        started = time.perf_counter()
+        context = build_context()
+        build_ms = int((time.perf_counter() - started) * 1000)
+        cur.execute(
+            """
+            INSERT INTO assistant_context_snapshots (source_version, build_ms, context)
+            VALUES (%s, %s, %s::jsonb) RETURNING version
+            """,
+            (source_version, build_ms, json.dumps(context, default=_json_default)),
+        )
+        version = cur.fetchone()["version"]
+        cur.execute("DELETE FROM assistant_context_snapshots WHERE version <= %s", (version - _KEEP_SNAPSHOTS,))
+    log.info("assistant context v%s built in %sms", version, build_ms)
+    return version
+
+
+def get_assistant_context() -> Dict[str, Any]:
+    """Newest snapshot's context (built inline only if none exists yet)."""
+    with db() as (con, cur):
+        latest = _latest(cur)
+    if latest is None:
+        refresh_assistant_context(force=True)
+        with db() as (con, cur):
+            latest = _latest(cur)
+    if latest is None:
+        # Another worker holds the lock on a first build; don't wait for it.
+        return build_context()
+    return latest["context"]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="rebuild the assistant context snapshot")
+    ap.add_argument("--refresh", action="store_true", help="build a new snapshot now")
+    args = ap.parse_args(argv)
+    if not args.refresh:
+        ap.print_help()
+        return 2
+    ensure_assistant_context()
+    version = refresh_assistant_context(force=True)
+    print(f"snapshot v{version}" if version else "another worker is rebuilding")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+# auth_cache.py
+"""
+In-process TTL cache of app_users roles / active flag for authorization checks.
+
+Every worker keeps its own cache. Writers to app_users call invalidate_user(),
+which drops the local entry and publishes on Redis so the other workers drop
+theirs too. Without Redis the TTL bounds staleness.
+
+Query-count check: repeated authorized GET /rows calls must look the user up
+once per TTL, not once per request:
+
+    python auth_cache.py --user 1 --requests 50 --rounds 3 --ttl 2
+"""
+import os
+import math
+import time
+import logging
+import argparse
+import threading
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from config import get_redis
+from db_utils import db
+
+log = logging.getLogger(__name__)
+
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+INVALIDATE_CHANNEL = "app_users:invalidate"
+
+_cache: Dict[int, Tuple[float, Optional[Dict[str, Any]]]] = {}
+# Bumped by every eviction (per user, and `_epoch` for evict-all). A load only
+# caches its result if neither moved while it ran, so a lookup that started
+# before invalidate_user() cannot put the old value back.
+_generations: Dict[int, int] = {}
+_epoch = 0
+_lock = threading.Lock()
+_stats = {"hits": 0, "loads": 0, "invalidations": 0}
+_listener: Optional[threading.Thread] = None
+
+
+def _load(cur, user_id: int) -> Optional[Dict[str, Any]]:
+    cur.execute("SELECT id, roles, active FROM app_users WHERE id = %s", (user_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    return {
+        "id": row["id"],
+        "roles": [str(r).lower() for r in (row.get("roles") or [])],
+        "active": bool(row.get("active")),
+    }
+
+
+def get_user_auth(user_id: Any, cur=None) -> Optional[Dict[str, Any]]:
+    """
+    {id, roles (lower-cased), active} for a user, or None when unknown.
+    Pass `cur` to reuse an open cursor on a cache miss.
+    """
+    try:
+        uid = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    if uid <= 0:
+        return None
+
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(uid)
+        if hit and hit[0] > now:
+            _stats["hits"] += 1
+            return hit[1]
+        generation = (_epoch, _generations.get(uid, 0))
+
+    if cur is not None:
+        info = _load(cur, uid)
+    else:
+        with db() as (_, c):
+            info = _load(c, uid)
+
+    with _lock:
+        _stats["loads"] += 1
+        if generation == (_epoch, _generations.get(uid, 0)):
+            _cache[uid] = (now + USER_CACHE_TTL_SECONDS, info)
+    return info
+
+
+def is_manager(user_id: Any, cur=None, require_active: bool = False) -> bool:
+    info = get_user_auth(user_id, cur)
+    if not info or (require_active and not info["active"]):
+        return False
+    return "manager" in info["roles"] or "admin" in info["roles"]
+
+
+def is_active_user(user_id: Any, cur=None) -> bool:
+    info = get_user_auth(user_id, cur)
+    return bool(info and info["active"])
+
+
+def _evict(user_id: Optional[int]):
+    global _epoch
+    with _lock:
+        _stats["invalidations"] += 1
+        if user_id is None:
+            _epoch += 1
+            _cache.clear()
+        else:
+            _generations[user_id] = _generations.get(user_id, 0) + 1
+            _cache.pop(user_id, None)
+
+
+def invalidate_user(user_id: Optional[int] = None):
+    """Drop a user (or everyone, with None) here and on every other worker."""
+    _evict(int(user_id) if user_id is not None else None)
+    try:
+        get_redis().publish(INVALIDATE_CHANNEL, str(user_id) if user_id is not None else "*")
+    except Exception as e:
+        log.warning("auth cache invalidation not published: %s", e)
+
+
+def _listen():
+    while True:
+        try:
+            pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATE_CHANNEL)
+            for msg in pubsub.listen():
+                if msg.get("type") != "message":
+                    continue
+                data = msg.get("data")
+                data = data.decode() if isinstance(data, bytes) else str(data)
+                _evict(None if data == "*" else int(data))
+        except Exception as e:
+            log.warning("auth cache listener reconnecting: %s", e)
+            # Anything could have changed while we were deaf.
+            _evict(None)
+            time.sleep(5)
+
+
+def start_invalidation_listener():
+    """Start the Redis subscriber thread once per process (no-op without Redis)."""
+    global _listener
+    if _listener is not None:
+        return
+    try:
+        get_redis()
+    except Exception as e:
+        log.warning("auth cache running without cross-worker invalidation: %s", e)
+        return
+    _listener = threading.Thread(target=_listen, name="auth-cache-invalidate", daemon=True)
+    _listener.start()
+
+
+def cache_stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "size": len(_cache)}
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from psycopg2.extras import RealDictCursor
+    import routes_inventory
+    # The routes use the imported module, not this __main__ copy.
+    import auth_cache
+    ap = argparse.ArgumentParser(description="count app_users queries across repeated authorized /rows calls")
+    ap.add_argument("--user", type=int, required=True, help="app_users id to call /rows as")
+    ap.add_argument("--requests", type=int, default=50, help="calls per round")
+    ap.add_argument("--rounds", type=int, default=3, help="rounds, each after the TTL has expired")
+    ap.add_argument("--ttl", type=float, default=5.0, help="USER_CACHE_TTL_SECONDS for the run")
+    args = ap.parse_args(argv)
+
+    # Count every statement that touches app_users, whoever issues it.
+    queries = []
+    execute = RealDictCursor.execute
+
+    def counting_execute(cur, sql, vars=None):
+        if "app_users" in str(sql):
+            queries.append(sql)
+        return execute(cur, sql, vars)
+
+    RealDictCursor.execute = counting_execute
+    auth_cache.USER_CACHE_TTL_SECONDS = args.ttl
+    auth_cache._evict(None)
+    app = FastAPI()
+    app.include_router(routes_inventory.router)
+    client = TestClient(app)
+    failed = 0
+    try:
+        for rnd in range(args.rounds):
+            if rnd:
+                time.sleep(args.ttl + 0.1)
+            before, started = len(queries), time.monotonic()
+            for _ in range(args.requests):
+                r = client.get("/rows?limit=5", headers={"X-User-ID": str(args.user)})
+                r.raise_for_status()
+            elapsed = time.monotonic() - started
+            # One lookup per TTL window the round spanned.
+            n, allowed = len(queries) - before, math.ceil(elapsed / args.ttl)
+            failed += not 1 <= n <= allowed
+            print(f"round {rnd + 1}: {args.requests} requests in {elapsed:.2f}s, "
+                  f"{n} app_users queries (allowed {allowed})")
+    finally:
+        RealDictCursor.execute = execute
+
+    print(auth_cache.cache_stats())
+    print("OK" if not failed else f"FAIL: {failed} round(s) off one lookup per TTL")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,184 @@
+# cloudinary_cleanup.py
+"""
+Deferred Cloudinary deletes (outbox).
+
+Deleting a stock photo only records its public ids in cloudinary_deletes, in
+the same transaction as the row delete: the request never waits on the
+Cloudinary Admin API, and a delete that rolls back leaves the images alone.
+
+process_cloudinary_deletes() runs after each delete request and on the
+scheduler (every CLOUDINARY_CLEANUP_SECONDS). It claims due ids with SKIP
+LOCKED plus a lease, so any number of workers can run it, and removes them
+with delete_resources in batches of up to 100 (the API's limit). Ids reported
+'deleted' or 'not_found' are done. Everything else is retried with
+exponential backoff (CLOUDINARY_CLEANUP_BACKOFF_SECONDS, doubling, capped at
+an hour) and parked after CLOUDINARY_CLEANUP_MAX_ATTEMPTS with its last error.
+
+CLOUDINARY_UPLOAD_PREFIX sends the API calls elsewhere, e.g. to a local fake:
+
+    CLOUDINARY_UPLOAD_PREFIX=http://127.0.0.1:8999 python cloudinary_cleanup.py --once
+"""
+import os
+import argparse
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import HAVE_CLOUDINARY
+from db_utils import db
+
+log = logging.getLogger(__name__)
+
+CLOUDINARY_CLEANUP_SECONDS = int(os.getenv("CLOUDINARY_CLEANUP_SECONDS", "60"))
+CLOUDINARY_CLEANUP_BATCH = min(100, int(os.getenv("CLOUDINARY_CLEANUP_BATCH", "100")))
+CLOUDINARY_CLEANUP_MAX_ATTEMPTS = int(os.getenv("CLOUDINARY_CLEANUP_MAX_ATTEMPTS", "8"))
+CLOUDINARY_CLEANUP_BACKOFF_SECONDS = float(os.getenv("CLOUDINARY_CLEANUP_BACKOFF_SECONDS", "30"))
+CLOUDINARY_UPLOAD_PREFIX = os.getenv("CLOUDINARY_UPLOAD_PREFIX")
+# A claimed batch is retried by anyone once this runs out (e.g. the worker died mid-call).
+_LEASE_SECONDS = 300
+_MAX_BACKOFF_SECONDS = 3600
+
+_OUTBOX_DDL = """
+CREATE TABLE IF NOT EXISTS cloudinary_deletes (
+  public_id       text PRIMARY KEY,
+  attempts        int NOT NULL DEFAULT 0,
+  next_attempt_at timestamptz DEFAULT now(),   -- NULL once parked
+  last_error      text,
+  created_at      timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS cloudinary_deletes_due_idx
+  ON cloudinary_deletes (next_attempt_at) WHERE next_attempt_at IS NOT NULL;
+"""
+
+_ENQUEUE_SQL = """
+    INSERT INTO cloudinary_deletes (public_id)
+    SELECT DISTINCT unnest(%s::text[]) ORDER BY 1
+    ON CONFLICT (public_id) DO UPDATE SET attempts = 0, next_attempt_at = now(), last_error = NULL
+"""
+
+_CLAIM_SQL = """
+    WITH due AS (
+        SELECT public_id FROM cloudinary_deletes
+        WHERE next_attempt_at <= now()
+        ORDER BY next_attempt_at
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE cloudinary_deletes d
+       SET attempts = d.attempts + 1,
+           next_attempt_at = now() + make_interval(secs => %(lease)s)
+      FROM due
+     WHERE d.public_id = due.public_id
+    RETURNING d.public_id
+"""
+
+_DONE_SQL = "DELETE FROM cloudinary_deletes WHERE public_id = ANY(%s)"
+
+_RETRY_SQL = """
+    UPDATE cloudinary_deletes d
+       SET last_error = f.error,
+           next_attempt_at = CASE WHEN d.attempts >= %(max_attempts)s THEN NULL
+                                  ELSE now() + make_interval(secs => least(%(cap)s, %(base)s * 2 ^ (d.attempts - 1)))
+                             END
+      FROM unnest(%(ids)s::text[], %(errors)s::text[]) f(public_id, error)
+     WHERE d.public_id = f.public_id
+    RETURNING d.public_id, d.next_attempt_at IS NULL AS parked
+"""
+
+
+def ensure_cloudinary_deletes():
+    """Create the delete outbox. Safe on every worker start."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('cloudinary_deletes'))")
+        cur.execute(_OUTBOX_DDL)
+        con.commit()
+
+
+def enqueue_cloudinary_deletes(cur, public_ids: Sequence[str]) -> int:
+    """Queue images for deletion; commits (or rolls back) with the caller's transaction."""
+    ids = [p for p in public_ids if p]
+    if not ids:
+        return 0
+    cur.execute(_ENQUEUE_SQL, (ids,))
+    return len(ids)
+
+
+def _claim() -> List[str]:
+    with db() as (con, cur):
+        cur.execute(_CLAIM_SQL, {"limit": CLOUDINARY_CLEANUP_BATCH, "lease": _LEASE_SECONDS})
+        return [r["public_id"] for r in cur.fetchall()]
+
+
+def _delete_batch(public_ids: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    """One delete_resources call. Returns (done ids, {failed id: error})."""
+    import cloudinary.api
+
+    options = {"upload_prefix": CLOUDINARY_UPLOAD_PREFIX} if CLOUDINARY_UPLOAD_PREFIX else {}
+    try:
+        result = cloudinary.api.delete_resources(public_ids, **options)
+    except Exception as e:
+        return [], {p: f"{type(e).__name__}: {e}"[:500] for p in public_ids}
+    statuses = result.get("deleted") or {}
+    done = [p for p in public_ids if statuses.get(p) in ("deleted", "not_found")]
+    failed = {p: str(statuses.get(p) or "missing from response") for p in public_ids if p not in done}
+    return done, failed
+
+
+def _settle(done: List[str], failed: Dict[str, str]) -> int:
+    """Record a batch's outcome. Returns how many ids were parked."""
+    with db() as (con, cur):
+        if done:
+            cur.execute(_DONE_SQL, (done,))
+        if not failed:
+            return 0
+        cur.execute(_RETRY_SQL, {
+            "ids": list(failed),
+            "errors": list(failed.values()),
+            "max_attempts": CLOUDINARY_CLEANUP_MAX_ATTEMPTS,
+            "base": CLOUDINARY_CLEANUP_BACKOFF_SECONDS,
+            "cap": _MAX_BACKOFF_SECONDS,
+        })
+        parked = [r["public_id"] for r in cur.fetchall() if r["parked"]]
+    if parked:
+        log.warning("cloudinary deletes gave up after %d attempts: %s", CLOUDINARY_CLEANUP_MAX_ATTEMPTS, parked[:20])
+    return len(parked)
+
+
+def process_cloudinary_deletes(max_batches: int = 50) -> Dict[str, int]:
+    """Scheduled / after deletes: work through due ids. Returns counts."""
+    stats = {"deleted": 0, "retry": 0, "parked": 0}
+    if not HAVE_CLOUDINARY:
+        return stats
+    for _ in range(max_batches):
+        ids = _claim()
+        if not ids:
+            break
+        done, failed = _delete_batch(ids)
+        parked = _settle(done, failed)
+        stats["deleted"] += len(done)
+        stats["retry"] += len(failed) - parked
+        stats["parked"] += parked
+        if failed and not done:
+            break  # API is failing; leave the rest to the backoff
+    return stats
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="process queued Cloudinary deletes")
+    ap.add_argument("--once", action="store_true", help="process everything due now and exit")
+    ap.add_argument("--requeue-parked", action="store_true", help="retry ids that ran out of attempts")
+    args = ap.parse_args(argv)
+    if not (args.once or args.requeue_parked):
+        ap.print_help()
+        return 2
+    ensure_cloudinary_deletes()
+    if args.requeue_parked:
+        with db() as (con, cur):
+            cur.execute("UPDATE cloudinary_deletes SET attempts = 0, next_attempt_at = now() WHERE next_attempt_at IS NULL")
+            print(f"{cur.rowcount} parked ids requeued")
+    if args.once:
+        print(process_cloudinary_deletes(max_batches=10_000))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+# compression.py
+"""
+Response compression: brotli when the client accepts it and the `brotli`
+package is installed, gzip otherwise.
+
+Small bodies, responses that already carry a Content-Encoding, and streams
+that should not be touched (SSE, pre-gzipped exports, images) pass through
+as-is. Streaming bodies are flushed per chunk so NDJSON stays incremental.
+Plain ASGI, so it only leans on Starlette's public header helpers.
+"""
+import os
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+    HAVE_BROTLI = True
+except ImportError:
+    brotli = None
+    HAVE_BROTLI = False
+
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+EXCLUDED_CONTENT_TYPES = (
+    "text/event-stream",
+    "application/gzip",
+    "application/zip",
+    "image/",
+    "video/",
+)
+
+
+class _GzipEncoder:
+    encoding = "gzip"
+
+    def __init__(self, level: int) -> None:
+        self._z = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def __call__(self, body: bytes, more_body: bool) -> bytes:
+        out = self._z.compress(body)
+        return out + self._z.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class _BrotliEncoder:
+    encoding = "br"
+
+    def __init__(self, quality: int) -> None:
+        self._c = brotli.Compressor(quality=quality)
+
+    def __call__(self, body: bytes, more_body: bool) -> bytes:
+        out = self._c.process(body)
+        return out + (self._c.flush() if more_body else self._c.finish())
+
+
+class _Responder:
+    """
+    Holds back http.response.start until the first body chunk, so the size
+    check and the Content-Length / Content-Encoding headers can be decided.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int, encoder) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encoder = encoder
+        self.send: Send = None
+        self.start_message: Message = None
+        self.started = False
+        self.passthrough = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.app(scope, receive, self.send_with_compression)
+
+    async def send_with_compression(self, message: Message) -> None:
+        kind = message["type"]
+        if kind == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            self.start_message = message
+            self.passthrough = (
+                "content-encoding" in headers
+                or headers.get("content-type", "").startswith(EXCLUDED_CONTENT_TYPES)
+            )
+            return
+        if kind != "http.response.body":
+            if not self.started and self.start_message is not None:
+                self.started = True
+                await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.started:
+            if not self.passthrough:
+                message = {**message, "body": self.encoder(body, more_body)}
+            await self.send(message)
+            return
+
+        self.started = True
+        if self.passthrough or (len(body) < self.minimum_size and not more_body):
+            self.passthrough = True
+            await self.send(self.start_message)
+            await self.send(message)
+            return
+
+        compressed = self.encoder(body, more_body)
+        headers = MutableHeaders(raw=self.start_message["headers"])
+        headers["Content-Encoding"] = self.encoder.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("etag")
+        if etag and etag.endswith('"') and not etag.startswith("W/"):
+            # A strong validator names one representation (see etags.py).
+            headers["ETag"] = f'{etag[:-1]}-{self.encoder.encoding}"'
+        if more_body:
+            del headers["Content-Length"]
+        else:
+            headers["Content-Length"] = str(len(compressed))
+        await self.send(self.start_message)
+        await self.send({**message, "body": compressed})
+
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+class CompressionMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = COMPRESS_MIN_BYTES,
+        gzip_level: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+    ) -> None:
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        if HAVE_BROTLI and _accepts(accept, "br"):
+            encoder = _BrotliEncoder(self.brotli_quality)
+        elif _accepts(accept, "gzip"):
+            encoder = _GzipEncoder(self.gzip_level)
+        else:
+            await self.app(scope, receive, send)
+            return
+        await _Responder(self.app, self.minimum_size, encoder)(scope, receive, send)
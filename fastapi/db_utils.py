@@ -3,13 +3,17 @@ import re
 import math
 import psycopg2
 from psycopg2.extras import RealDictCursor, register_uuid as _pg_register_uuid
-from uuid import UUID
+from uuid import UUID, uuid4
 from contextlib import contextmanager
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, Iterator
 from datetime import datetime, date
 import json
+import zlib
+import queue
+import threading
 from psycopg2 import pool
 from config import DATABASE_URL
+from fast_json import dumps
 
 try:
     _pg_register_uuid()
@@ -63,6 +67,151 @@ def db():
         raise e
 
 
+# ---------------------------------------------------------------------------
+# COPY streaming
+# ---------------------------------------------------------------------------
+COPY_QUEUE_CHUNKS = 64  # bounded: COPY blocks when the client reads slowly
+
+class _CopyCancelled(Exception):
+    pass
+
+class _QueueWriter:
+    """File-like sink for cursor.copy_expert() that hands chunks to a queue."""
+    def __init__(self, q: "queue.Queue", cancelled: threading.Event, gzip: bool):
+        self.q = q
+        self.cancelled = cancelled
+        self.z = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    def _put(self, chunk: bytes):
+        while True:
+            if self.cancelled.is_set():
+                raise _CopyCancelled()
+            try:
+                self.q.put(chunk, timeout=1.0)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if self.z is not None:
+            data = self.z.compress(data)
+        if data:
+            self._put(data)
+        return len(data)
+
+    def close(self):
+        if self.z is not None:
+            tail = self.z.flush()
+            if tail:
+                self._put(tail)
+
+def copy_stream(select_sql: str, params: Any = None, gzip: bool = False, header: bool = True) -> Iterator[bytes]:
+    """
+    Stream `COPY (select_sql) TO STDOUT WITH CSV` as bytes (optionally gzip).
+    COPY runs on a pooled connection in a worker thread; memory stays bounded by
+    COPY_QUEUE_CHUNKS and no rows are materialized in Python. Closing the
+    iterator (client disconnect) aborts the COPY.
+    """
+    q: "queue.Queue" = queue.Queue(maxsize=COPY_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    done = object()
+    failure: List[BaseException] = []
+
+    def run():
+        try:
+            with db() as (con, cur):
+                inner = cur.mogrify(select_sql, params).decode("utf-8") if params else select_sql
+                writer = _QueueWriter(q, cancelled, gzip)
+                cur.copy_expert(f"COPY ({inner}) TO STDOUT WITH (FORMAT csv{', HEADER' if header else ''})", writer)
+                writer.close()
+        except _CopyCancelled:
+            pass
+        except BaseException as e:
+            failure.append(e)
+        finally:
+            while True:
+                try:
+                    q.put(done, timeout=1.0)
+                    break
+                except queue.Full:
+                    if cancelled.is_set():
+                        break
+
+    worker = threading.Thread(target=run, name="copy-stream", daemon=True)
+    worker.start()
+    try:
+        while True:
+            chunk = q.get()
+            if chunk is done:
+                break
+            yield chunk
+        if failure:
+            raise failure[0]
+    finally:
+        cancelled.set()
+
+# ---------------------------------------------------------------------------
+# Server-side cursor streaming
+# ---------------------------------------------------------------------------
+STREAM_ITERSIZE = int(os.getenv("STREAM_ITERSIZE", "2000"))
+
+def iter_rows(sql: str, params: Any = None, itersize: int = STREAM_ITERSIZE) -> Iterator[Dict[str, Any]]:
+    """
+    Yield rows from a named (server-side) cursor, `itersize` at a time, so a
+    large result never sits in process memory. The pooled connection is held
+    until the generator is exhausted or closed.
+    """
+    con = pg_pool.getconn() if pg_pool else db_conn()
+    try:
+        with con.cursor(name=f"stream_{uuid4().hex}", cursor_factory=RealDictCursor) as cur:
+            cur.itersize = itersize
+            cur.execute(sql, params)
+            for row in cur:
+                yield row
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+    finally:
+        if pg_pool:
+            pg_pool.putconn(con)
+        else:
+            con.close()
+
+def stream_json(
+    rows: Iterator[Dict[str, Any]],
+    fmt: str = "ndjson",
+    wrap_key: Optional[str] = None,
+    transform=None,
+    batch: int = 500,
+) -> Iterator[bytes]:
+    """
+    Encode rows as NDJSON lines, or as one JSON array (optionally wrapped as
+    {"<wrap_key>": [...]}) emitted in chunks. `transform(row) -> row` runs per row.
+    """
+    buf: List[bytes] = []
+    first = True
+    if fmt == "json":
+        yield (f'{{"{wrap_key}":[' if wrap_key else "[").encode("utf-8")
+    for row in rows:
+        row = dict(row)
+        if transform:
+            row = transform(row)
+        if fmt == "json":
+            buf.append((b"" if first else b",") + dumps(row))
+            first = False
+        else:
+            buf.append(dumps(row) + b"\n")
+        if len(buf) >= batch:
+            yield b"".join(buf)
+            buf = []
+    if buf:
+        yield b"".join(buf)
+    if fmt == "json":
+        yield (b"]}" if wrap_key else b"]")
+
 
 def to_num(v) -> Optional[float]:
     if v is None:
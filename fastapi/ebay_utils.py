@@ -332,6 +332,37 @@ def _browse_get_price_app_safe(legacy_item_id: str) -> tuple[float | None, str |
     except Exception:
         return (None, None, "browse.app.error")
 
+def browse_listing_state(legacy_item_id: str, timeout: float = 5) -> dict | None:
+    """
+    Price / thumbnail / ended flag for a listing via Buy/Browse (APP token).
+    NEVER raises; None when eBay could not be reached or had no item.
+    """
+    try:
+        token = _ebay_app_access_token()
+        r = session.get(
+            f"{EBAY_BROWSE_ENDPOINT}/item/get_item_by_legacy_id",
+            params={"legacy_item_id": legacy_item_id},
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/json",
+                "X-EBAY-C-MARKETPLACE-ID": EBAY_MARKETPLACE_ID,
+            },
+            timeout=timeout,
+        )
+        if r.status_code != 200:
+            return None
+        data = r.json() or {}
+    except Exception as e:
+        print(f"[eBay Utils] browse lookup failed for {legacy_item_id}: {e}")
+        return None
+
+    avail = ((data.get("availability") or {}).get("status") or "").upper()
+    return {
+        "price": _safe_float((data.get("price") or {}).get("value")),
+        "thumbnail": (data.get("image") or {}).get("imageUrl"),
+        "ended": avail in ("OUT_OF_STOCK", "UNAVAILABLE", "ENDED"),
+    }
+
 def _summarize_sales_for_legacy_id(legacy_item_id: str, days_back: int = 365) -> dict:
     """
     Look up orders in Sell Fulfillment and summarize sales for a legacy item id.
@@ -0,0 +1,139 @@
+# etags.py
+"""
+Strong ETags for polled lists and snapshots.
+
+Validators come from cheap version lookups, never from the response body, so
+a matching If-None-Match is answered with 304 before the real query runs:
+
+  * resource_versions holds one counter per resource ('categories', 'vendors',
+    'po:<uuid>'), bumped by statement triggers on the source tables. A bump is
+    a row update, so it becomes visible exactly when the writer commits.
+  * /rows uses the newest inventory_row_changes version. Versions are
+    assigned in commit order (inventory_read._COMMIT_ORDER_FN), so a change
+    committing later always raises it.
+
+CompressionMiddleware appends "-gzip" / "-br" to the ETag of encoded
+responses; etag_matches() ignores that suffix.
+"""
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import Response
+
+from db_utils import db
+
+_VERSIONS_DDL = """
+CREATE TABLE IF NOT EXISTS resource_versions (
+  key        text PRIMARY KEY,
+  version    bigint NOT NULL DEFAULT 1,
+  changed_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE OR REPLACE FUNCTION resource_versions_bump(keys text[]) RETURNS void
+LANGUAGE sql AS $fn$
+  INSERT INTO resource_versions AS v (key)
+  SELECT DISTINCT k FROM unnest(keys) k WHERE k IS NOT NULL ORDER BY 1
+  ON CONFLICT (key) DO UPDATE SET version = v.version + 1, changed_at = now();
+$fn$;
+
+CREATE OR REPLACE FUNCTION resource_versions_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  PERFORM resource_versions_bump(TG_ARGV::text[]);
+  RETURN NULL;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION resource_versions_po_lines_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM resource_versions_bump(ARRAY(SELECT 'po:' || purchase_order_id FROM new_rows));
+  ELSIF TG_OP = 'UPDATE' THEN
+    PERFORM resource_versions_bump(ARRAY(
+      SELECT 'po:' || purchase_order_id FROM new_rows UNION SELECT 'po:' || purchase_order_id FROM old_rows));
+  ELSE
+    PERFORM resource_versions_bump(ARRAY(SELECT 'po:' || purchase_order_id FROM old_rows));
+  END IF;
+  RETURN NULL;
+END
+$fn$;
+"""
+
+# (trigger name, table, events, transition tables or None, function call)
+_TRIGGERS = [
+    ("resource_versions_categories", "categories", "INSERT OR UPDATE OR DELETE", None,
+     "resource_versions_trg('categories')"),
+    ("resource_versions_vendors", "vendors", "INSERT OR UPDATE OR DELETE", None,
+     "resource_versions_trg('vendors')"),
+    # /vendors carries po_count
+    ("resource_versions_pos", "purchase_orders", "INSERT OR UPDATE OF vendor_id OR DELETE", None,
+     "resource_versions_trg('vendors')"),
+    ("resource_versions_po_lines_ins", "po_lines", "INSERT", "NEW TABLE AS new_rows",
+     "resource_versions_po_lines_trg()"),
+    ("resource_versions_po_lines_upd", "po_lines", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows",
+     "resource_versions_po_lines_trg()"),
+    ("resource_versions_po_lines_del", "po_lines", "DELETE", "OLD TABLE AS old_rows",
+     "resource_versions_po_lines_trg()"),
+]
+
+ENCODING_SUFFIXES = ("-gzip", "-br")
+
+
+def ensure_resource_versions():
+    """Create the version table, bump functions and triggers. Safe on every worker start."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('resource_versions'))")
+        cur.execute(_VERSIONS_DDL)
+        for name, table, events, referencing, call in _TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+            cur.execute(
+                f"CREATE TRIGGER {name} AFTER {events} ON {table} "
+                + (f"REFERENCING {referencing} " if referencing else "")
+                + f"FOR EACH STATEMENT EXECUTE FUNCTION {call}"
+            )
+        con.commit()
+
+
+def resource_version(cur, key: str) -> int:
+    """Current counter for a resource key; 0 before its first write."""
+    cur.execute("SELECT version FROM resource_versions WHERE key = %s", (key,))
+    row = cur.fetchone()
+    return int(row["version"]) if row else 0
+
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha1("\x1f".join(str(p) for p in parts).encode()).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    if tag.startswith("W/"):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in ENCODING_SUFFIXES:
+        if tag.endswith(suffix):
+            return tag[: -len(suffix)]
+    return tag
+
+
+def etag_matches(if_none_match: Optional[str], etag: Optional[str]) -> bool:
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    want = _opaque(etag)
+    return any(_opaque(t) == want for t in if_none_match.split(","))
+
+
+def cache_headers(etag: Optional[str]) -> Dict[str, str]:
+    # Clients may keep the body but must revalidate every time.
+    headers = {"Cache-Control": "private, no-cache"}
+    if etag:
+        headers["ETag"] = etag
+    return headers
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=cache_headers(etag))
@@ -0,0 +1,53 @@
+# fast_json.py
+"""
+JSON encoding for responses and streams.
+
+Uses orjson when installed (UUID / datetime / date natively, Decimal through
+the default hook) and falls back to the stdlib encoder with the same rules.
+"""
+import json
+from datetime import datetime, date
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    HAVE_ORJSON = True
+except ImportError:
+    orjson = None
+    HAVE_ORJSON = False
+
+
+def _default(o: Any):
+    if isinstance(o, Decimal):
+        return float(o)
+    if isinstance(o, (datetime, date)):
+        return o.isoformat()
+    if isinstance(o, UUID):
+        return str(o)
+    if isinstance(o, (set, frozenset, tuple)):
+        return list(o)
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+if HAVE_ORJSON:
+    _ORJSON_OPTS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTS)
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    Default response class for the app. Routes that return large payloads can
+    return it directly to skip FastAPI's jsonable_encoder pass as well.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
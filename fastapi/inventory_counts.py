@@ -0,0 +1,285 @@
+# inventory_counts.py
+"""
+Trigger-maintained inventory counters for the dashboard.
+
+`inventory_counts` holds item counts per (status, is_ready, category_id)
+and `inventory_tested_counts` per (tested_date, category_id). Statement
+triggers on inventory_read add the net delta of each statement, so /rows/counts
+is a lookup over a handful of rows instead of a scan of the inventory.
+
+Each key is split over COUNTER_SLOTS rows picked by backend pid, so concurrent
+writers moving items into the same status mostly lock different rows; readers
+sum the slots. reconcile_inventory_counts() recounts from inventory_read and
+rewrites both tables (scheduled, and on demand via POST /rows/counts/reconcile).
+
+    python inventory_counts.py --reconcile
+    python inventory_counts.py --stress 8 --seconds 20
+"""
+import os
+import time
+import random
+import logging
+import argparse
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from db_utils import db
+
+log = logging.getLogger(__name__)
+
+COUNTER_SLOTS = int(os.getenv("INVENTORY_COUNTER_SLOTS", "8"))
+COUNTS_RECONCILE_MINUTES = int(os.getenv("INVENTORY_COUNTS_RECONCILE_MINUTES", "60"))
+
+_COUNTS_DDL = """
+CREATE TABLE IF NOT EXISTS inventory_counts (
+  status      text,
+  is_ready    boolean,
+  category_id uuid,
+  slot        smallint NOT NULL DEFAULT 0,
+  n           bigint NOT NULL DEFAULT 0,
+  CONSTRAINT inventory_counts_key UNIQUE NULLS NOT DISTINCT (status, is_ready, category_id, slot)
+);
+CREATE TABLE IF NOT EXISTS inventory_tested_counts (
+  tested_date date,
+  category_id uuid,
+  slot        smallint NOT NULL DEFAULT 0,
+  n           bigint NOT NULL DEFAULT 0,
+  CONSTRAINT inventory_tested_counts_key UNIQUE NULLS NOT DISTINCT (tested_date, category_id, slot)
+);
+CREATE INDEX IF NOT EXISTS inventory_tested_counts_date_idx ON inventory_tested_counts (tested_date);
+"""
+
+# Net change per key for one statement; `src` is a union of signed transition rows.
+# Keys are applied in a fixed order so two writers cannot deadlock on counter rows.
+_APPLY = """
+    INSERT INTO inventory_counts AS t (status, is_ready, category_id, slot, n)
+    SELECT status, is_ready, category_id, pg_backend_pid() % {slots}, SUM(d)
+      FROM ({src}) s
+     GROUP BY status, is_ready, category_id
+    HAVING SUM(d) <> 0
+     ORDER BY status, is_ready, category_id
+    ON CONFLICT ON CONSTRAINT inventory_counts_key DO UPDATE SET n = t.n + EXCLUDED.n;
+
+    INSERT INTO inventory_tested_counts AS t (tested_date, category_id, slot, n)
+    SELECT tested_date, category_id, pg_backend_pid() % {slots}, SUM(d)
+      FROM ({src}) s
+     WHERE tested_date IS NOT NULL
+     GROUP BY tested_date, category_id
+    HAVING SUM(d) <> 0
+     ORDER BY tested_date, category_id
+    ON CONFLICT ON CONSTRAINT inventory_tested_counts_key DO UPDATE SET n = t.n + EXCLUDED.n;
+"""
+
+_KEYS = "status, is_ready, category_id, tested_date"
+_NEW = f"SELECT {_KEYS}, 1 AS d FROM new_rows"
+_OLD = f"SELECT {_KEYS}, -1 AS d FROM old_rows"
+
+
+def _trigger_fn() -> str:
+    return f"""
+CREATE OR REPLACE FUNCTION inventory_counts_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    {_APPLY.format(src=_NEW, slots=COUNTER_SLOTS)}
+  ELSIF TG_OP = 'UPDATE' THEN
+    {_APPLY.format(src=_NEW + " UNION ALL " + _OLD, slots=COUNTER_SLOTS)}
+  ELSE
+    {_APPLY.format(src=_OLD, slots=COUNTER_SLOTS)}
+  END IF;
+  RETURN NULL;
+END
+$fn$;
+"""
+
+_TRIGGERS = [
+    ("inventory_counts_ins", "INSERT", "NEW TABLE AS new_rows"),
+    ("inventory_counts_upd", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    ("inventory_counts_del", "DELETE", "OLD TABLE AS old_rows"),
+]
+
+# Blocks writers to inventory_read (their triggers need ROW EXCLUSIVE on the
+# counters) and waits for in-flight ones, so the recount below is exact.
+_RECONCILE_SQL = """
+LOCK TABLE inventory_counts, inventory_tested_counts IN EXCLUSIVE MODE;
+
+CREATE TEMP TABLE _counts_drift ON COMMIT DROP AS
+WITH actual AS (
+  SELECT jsonb_build_object('status', status, 'isReady', is_ready, 'categoryId', category_id) AS key,
+         COUNT(*) AS n
+  FROM inventory_read GROUP BY status, is_ready, category_id
+  UNION ALL
+  SELECT jsonb_build_object('testedDate', tested_date, 'categoryId', category_id), COUNT(*)
+  FROM inventory_read WHERE tested_date IS NOT NULL GROUP BY tested_date, category_id
+), kept AS (
+  SELECT jsonb_build_object('status', status, 'isReady', is_ready, 'categoryId', category_id) AS key,
+         SUM(n)::bigint AS n
+  FROM inventory_counts GROUP BY status, is_ready, category_id
+  UNION ALL
+  SELECT jsonb_build_object('testedDate', tested_date, 'categoryId', category_id), SUM(n)::bigint
+  FROM inventory_tested_counts GROUP BY tested_date, category_id
+)
+SELECT COALESCE(a.key, k.key) AS key, COALESCE(k.n, 0) AS kept, COALESCE(a.n, 0) AS actual
+FROM actual a
+FULL JOIN kept k ON k.key = a.key
+WHERE COALESCE(k.n, 0) <> COALESCE(a.n, 0);
+
+DELETE FROM inventory_counts;
+INSERT INTO inventory_counts (status, is_ready, category_id, n)
+SELECT status, is_ready, category_id, COUNT(*)
+FROM inventory_read GROUP BY status, is_ready, category_id;
+
+DELETE FROM inventory_tested_counts;
+INSERT INTO inventory_tested_counts (tested_date, category_id, n)
+SELECT tested_date, category_id, COUNT(*)
+FROM inventory_read WHERE tested_date IS NOT NULL GROUP BY tested_date, category_id;
+"""
+
+COUNTS_SQL = """
+SELECT
+  COALESCE(SUM(n), 0)                               AS total,
+  COALESCE(SUM(n) FILTER (WHERE is_ready), 0)       AS ready,
+  COALESCE(SUM(n) FILTER (WHERE NOT is_ready), 0)   AS incomplete,
+  (SELECT COALESCE(SUM(n), 0) FROM inventory_tested_counts
+    WHERE tested_date = CURRENT_DATE AND {where}) AS today_tested,
+  COALESCE((SELECT jsonb_object_agg(COALESCE(status, ''), n) FROM (
+      SELECT status, SUM(n) AS n FROM inventory_counts WHERE {where}
+      GROUP BY status HAVING SUM(n) <> 0) s), '{{}}'::jsonb) AS by_status
+FROM inventory_counts
+WHERE {where}
+"""
+
+
+def counts_filter(category_id: Optional[str] = None):
+    if category_id:
+        return "category_id = %(category_id)s::uuid", {"category_id": category_id}
+    return "TRUE", {}
+
+
+def read_counts(cur, category_id: Optional[str] = None) -> Dict[str, Any]:
+    where_sql, params = counts_filter(category_id)
+    cur.execute(COUNTS_SQL.format(where=where_sql), params)
+    r = cur.fetchone()
+    return {
+        "total": int(r["total"]), "ready": int(r["ready"]), "incomplete": int(r["incomplete"]),
+        "todayTested": int(r["today_tested"]), "byStatus": {k: int(v) for k, v in r["by_status"].items()},
+    }
+
+
+def ensure_inventory_counts(cur, recount: bool = False):
+    """
+    Create the counter tables and (re)attach the triggers to inventory_read.
+    Called from ensure_inventory_read() inside its transaction; `recount` is set
+    when inventory_read was just rebuilt (CREATE TABLE AS fires no triggers).
+    """
+    cur.execute("SELECT to_regclass('inventory_counts') IS NULL AS missing")
+    recount = cur.fetchone()["missing"] or recount
+    cur.execute(_COUNTS_DDL)
+    cur.execute(_trigger_fn())
+    for name, event, referencing in _TRIGGERS:
+        cur.execute(f"DROP TRIGGER IF EXISTS {name} ON inventory_read")
+        cur.execute(
+            f"CREATE TRIGGER {name} AFTER {event} ON inventory_read "
+            f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION inventory_counts_trg()"
+        )
+    if recount:
+        _reconcile(cur)
+
+
+def _reconcile(cur) -> List[Dict[str, Any]]:
+    cur.execute(_RECONCILE_SQL)
+    cur.execute("SELECT key, kept, actual FROM _counts_drift ORDER BY key")
+    return [dict(r) for r in cur.fetchall()]
+
+
+def reconcile_inventory_counts() -> List[Dict[str, Any]]:
+    """Scheduled / on demand: recount from inventory_read. Returns the keys that had drifted."""
+    with db() as (con, cur):
+        drift = _reconcile(cur)
+    if drift:
+        log.warning("inventory_counts drift corrected on %d keys: %s", len(drift), drift[:20])
+    return drift
+
+
+# ============================================================
+# CONCURRENCY CHECK
+# ============================================================
+STRESS_PREFIX = "ZZCOUNT"
+_STATUSES = ("INTAKE", "TESTING", "READY", "TESTED", "IN_STORE", "POSTED", "SOLD")
+
+
+def _stress_worker(codes: Sequence[str], deadline: float, stats: Dict[str, int], lock: threading.Lock):
+    done = errors = 0
+    while time.monotonic() < deadline:
+        batch = random.sample(codes, k=min(len(codes), random.randint(1, 5)))
+        try:
+            with db() as (con, cur):
+                cur.execute(
+                    """
+                    UPDATE public.inventory_items
+                       SET status = %s,
+                           grade = CASE WHEN random() < 0.5 THEN 'A' END,
+                           tested_by = 'stress', tested_date = CURRENT_DATE - (random() * 2)::int
+                     WHERE synergy_code = ANY(%s)
+                    """,
+                    (random.choice(_STATUSES), batch),
+                )
+                if random.random() < 0.1:
+                    raise RuntimeError("rollback")
+            done += 1
+        except Exception:
+            errors += 1
+    with lock:
+        stats["committed"] += done
+        stats["rolled_back"] += errors
+
+
+def stress(workers: int, seconds: float, items: int = 200) -> List[Dict[str, Any]]:
+    """
+    Hammer status/grade/tested_date on `items` synthetic rows from `workers`
+    connections (10% of transactions roll back), then report counter drift.
+    The synthetic rows are removed again afterwards.
+    """
+    codes = [f"{STRESS_PREFIX}-{n:05d}" for n in range(items)]
+    with db() as (con, cur):
+        cur.execute(
+            "INSERT INTO public.inventory_items (synergy_code, status) "
+            "SELECT c, 'INTAKE' FROM unnest(%s::text[]) c ON CONFLICT DO NOTHING",
+            (codes,),
+        )
+    stats = {"committed": 0, "rolled_back": 0}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+    threads = [threading.Thread(target=_stress_worker, args=(codes, deadline, stats, lock)) for _ in range(workers)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    print(f"{stats['committed']} transactions committed, {stats['rolled_back']} rolled back")
+
+    drift = reconcile_inventory_counts()
+    with db() as (con, cur):
+        cur.execute("DELETE FROM public.inventory_items WHERE synergy_code = ANY(%s)", (codes,))
+    return drift + reconcile_inventory_counts()
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="reconcile / stress-check the inventory counters")
+    ap.add_argument("--reconcile", action="store_true", help="recount and report drift")
+    ap.add_argument("--stress", type=int, metavar="WORKERS", help="concurrent status updates, then check drift")
+    ap.add_argument("--seconds", type=float, default=10)
+    args = ap.parse_args(argv)
+
+    if args.stress:
+        drift = stress(args.stress, args.seconds)
+    elif args.reconcile:
+        drift = reconcile_inventory_counts()
+    else:
+        ap.print_help()
+        return 2
+    for d in drift:
+        print(f"[DRIFT] {d}")
+    print(f"{len(drift)} drifted keys")
+    return 1 if drift else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,429 @@
+"""
+Denormalized inventory read model.
+
+`inventory_read` holds one row per inventory item with exactly the columns the
+/rows endpoints and the row.* broadcasts return, already joined with po_lines
+and categories and with COALESCE()d values stored as plain columns so every
+supported filter / sort can use an index.
+
+It is kept in sync by statement-level triggers on inventory_items, po_lines
+and categories that call inventory_read_refresh(codes). Writers never touch
+it directly. Its own triggers keep the dashboard counters (inventory_counts.py).
+"""
+import os
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from db_utils import db
+from spec_extract import SPEC_FUNCTIONS_SQL, SPEC_READ_COLUMNS, SPEC_EXTRACTOR_VERSION
+from inventory_counts import ensure_inventory_counts
+from pubsub_utils import _broadcast
+
+log = logging.getLogger(__name__)
+
+# (column, source expression over i/pl/c, API alias or None when internal-only)
+READ_COLUMNS = [
+    ("synergy_code",    "i.synergy_code",                                   "synergyId"),
+    ("product_name",    "COALESCE(pl.product_name_raw, '')",                "productName"),
+    ("category_id",     "COALESCE(i.category_id, pl.category_guess)",       "categoryId"),
+    ("status",          "i.status",                                         "status"),
+    ("purchase_cost",   "COALESCE(NULLIF(i.cost_unit, 0), pl.unit_cost, 0)", "purchaseCost"),
+    ("qty",             "COALESCE(pl.qty, 1)",                              "qty"),
+    ("msrp",            "COALESCE(i.msrp, pl.msrp, 0)",                     "msrp"),
+    ("po_id",           "i.purchase_order_id",                              "poId"),
+    ("line_id",         "i.po_line_id",                                     "lineId"),
+    ("grade",           "i.grade",                                          "grade"),
+    ("tested_by",       "i.tested_by",                                      "testedBy"),
+    ("tested_date",     "i.tested_date",                                    "testedDate"),
+    ("tested_at",       "i.tested_at",                                      None),
+    ("tester_comment",  "i.tester_comment",                                 "testerComment"),
+    ("posted_at",       "i.posted_at",                                      "postedAt"),
+    ("posted_by",       "i.posted_by::text",                                "postedBy"),
+    ("ebay_item_url",   "i.ebay_item_url",                                  "ebayItemUrl"),
+    ("ebay_item_id",    "i.ebay_item_id",                                   None),
+    ("ebay_thumbnail",  "i.ebay_thumbnail",                                 "ebayThumbnail"),
+    ("ebay_sku",        "i.ebay_sku",                                       "ebaySku"),
+    ("specs",           "COALESCE(i.specs, '{}'::jsonb)",                   "specs"),
+    ("price",           "COALESCE(i.price, 0)",                             "price"),
+    ("ebay_price",      "COALESCE(i.ebay_price, 0)",                        "ebayPrice"),
+    ("sold_price",      "COALESCE(i.sold_price, 0)",                        "soldPrice"),
+    ("category_label",  "c.label",                                          "categoryLabel"),
+    ("category_prefix", "c.prefix",                                         "categoryPrefix"),
+    ("category_icon",   "COALESCE(c.icon_key, 'box')",                      "categoryIcon"),
+    ("category_color",  "COALESCE(c.color_key, 'slate')",                   "categoryColor"),
+    ("last_printed_at", "i.last_printed_at",                                "lastPrintedAt"),
+    ("upc",             "pl.upc",                                           "upc"),
+    ("asin",            "pl.asin",                                          "asin"),
+    ("part_status",     "i.part_status",                                    "partStatus"),
+    *SPEC_READ_COLUMNS,
+    ("is_ready",
+     "(i.grade IS NOT NULL AND i.tested_by IS NOT NULL AND (i.tested_date IS NOT NULL OR i.tested_at IS NOT NULL))",
+     None),
+    ("search_text",
+     "concat_ws(E'\\n', i.synergy_code, pl.product_name_raw, i.specs::text, pl.upc, pl.asin, i.tester_comment)",
+     None),
+]
+
+# API field name -> inventory_read column
+ROW_FIELDS: Dict[str, str] = {alias: col for col, _, alias in READ_COLUMNS if alias}
+
+_COLS = [col for col, _, _ in READ_COLUMNS]
+
+SOURCE_SQL = (
+    "SELECT " + ",\n       ".join(f"{expr} AS {col}" for col, expr, _ in READ_COLUMNS) + """
+    FROM public.inventory_items i
+    LEFT JOIN po_lines pl ON pl.id = i.po_line_id
+    LEFT JOIN categories c ON c.id = COALESCE(i.category_id, pl.category_guess)
+"""
+)
+
+# Shape every /rows consumer expects. Append WHERE/ORDER BY over alias `r`.
+ROWS_READ_COLUMNS_SQL = ",\n       ".join(
+    [f'r.{col} AS "{alias}"' for col, _, alias in READ_COLUMNS[:4] if alias]
+    + ["'{}'::jsonb AS \"attrs\""]
+    + [f'r.{col} AS "{alias}"' for col, _, alias in READ_COLUMNS[4:] if alias]
+)
+ROWS_READ_SQL = f"SELECT {ROWS_READ_COLUMNS_SQL}\n    FROM inventory_read r\n"
+
+READ_BY_CODES_SQL = ROWS_READ_SQL + "    WHERE r.synergy_code = ANY(%s)\n"
+
+# Fields a `fields=` projection may ask for. synergyId is always included.
+SELECTABLE_FIELDS = ("attrs",) + tuple(ROW_FIELDS)
+
+
+def rows_columns_sql(fields: Optional[Sequence[str]] = None) -> str:
+    """
+    Column list for a /rows-shaped SELECT over alias `r`, restricted to `fields`
+    (API names) when given. Raises ValueError on names outside SELECTABLE_FIELDS.
+    """
+    if not fields:
+        return ROWS_READ_COLUMNS_SQL
+    unknown = [f for f in fields if f not in SELECTABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    wanted = {"synergyId", *fields}
+    return ",\n       ".join(
+        "'{}'::jsonb AS \"attrs\"" if f == "attrs" else f'r.{ROW_FIELDS[f]} AS "{f}"'
+        for f in SELECTABLE_FIELDS
+        if f in wanted
+    )
+
+
+# API alias for every exposed column; internal ones never leave the server.
+_COLUMN_ALIASES = {col: alias for alias, col in ROW_FIELDS.items()}
+REDACTED_FIELDS = ("purchaseCost", "soldPrice", "msrp")
+
+# Above this many changes a row.changed event only carries the version and
+# clients page through /rows/changes instead.
+ROW_CHANGED_MAX_INLINE = int(os.getenv("ROW_CHANGED_MAX_INLINE", "500"))
+ROW_CHANGES_RETENTION_HOURS = int(os.getenv("ROW_CHANGES_RETENTION_HOURS", "48"))
+
+_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS inventory_read_status_code_idx ON inventory_read (status, synergy_code)",
+    "CREATE INDEX IF NOT EXISTS inventory_read_po_code_idx ON inventory_read (po_id, synergy_code)",
+    "CREATE INDEX IF NOT EXISTS inventory_read_category_code_idx ON inventory_read (category_id, synergy_code)",
+    "CREATE INDEX IF NOT EXISTS inventory_read_ready_code_idx ON inventory_read (is_ready, synergy_code)",
+    "CREATE INDEX IF NOT EXISTS inventory_read_grade_idx ON inventory_read (grade)",
+    "CREATE INDEX IF NOT EXISTS inventory_read_line_idx ON inventory_read (line_id)",
+    "CREATE INDEX IF NOT EXISTS inventory_read_ebay_item_idx ON inventory_read (ebay_item_id) WHERE ebay_item_id IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS inventory_read_cpu_specs_idx ON inventory_read (cpu_family, ram_gb, storage_gb)",
+    "CREATE INDEX IF NOT EXISTS inventory_read_cpu_model_idx ON inventory_read (cpu_model) WHERE cpu_model IS NOT NULL",
+    "CREATE INDEX IF NOT EXISTS inventory_read_storage_idx ON inventory_read (storage_gb, screen_in)",
+]
+
+_TRGM_INDEX = (
+    "CREATE INDEX IF NOT EXISTS inventory_read_search_trgm_idx "
+    "ON inventory_read USING gin (search_text gin_trgm_ops)"
+)
+
+_CHANGES_DDL = """
+CREATE TABLE IF NOT EXISTS inventory_row_changes (
+  version      bigserial PRIMARY KEY,
+  synergy_code text,
+  op           text NOT NULL,            -- upsert | delete | reset | prune
+  changed      jsonb,
+  txid         xid8 NOT NULL DEFAULT pg_current_xact_id(),
+  changed_at   timestamptz NOT NULL DEFAULT clock_timestamp()
+);
+CREATE INDEX IF NOT EXISTS inventory_row_changes_txid_idx ON inventory_row_changes (txid);
+CREATE INDEX IF NOT EXISTS inventory_row_changes_changed_at_idx ON inventory_row_changes (changed_at);
+"""
+
+# Versions are handed out in commit order, so every cursor over them (the
+# /rows/changes `next`, the /rows ETag, the match index) can move to the
+# newest visible version without skipping a change that commits later. Rows
+# get a provisional version on insert; a deferred trigger renumbers the
+# transaction's rows at commit time under an advisory lock that is held until
+# the commit is visible. The provisional numbers are left as gaps.
+_COMMIT_ORDER_FN = """
+CREATE OR REPLACE FUNCTION inventory_row_changes_commit_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF current_setting('inventory_row_changes.numbered', true) = '1' THEN
+    RETURN NULL;
+  END IF;
+  PERFORM set_config('inventory_row_changes.numbered', '1', true);
+  PERFORM pg_advisory_xact_lock(hashtext('inventory_row_changes_commit'));
+  UPDATE inventory_row_changes c
+     SET version = n.version
+    FROM (SELECT provisional, nextval('inventory_row_changes_version_seq') AS version
+            FROM (SELECT version AS provisional FROM inventory_row_changes
+                   WHERE txid = pg_current_xact_id() ORDER BY version) p) n
+   WHERE c.version = n.provisional;
+  RETURN NULL;
+END
+$fn$;
+DROP TRIGGER IF EXISTS inventory_row_changes_commit ON inventory_row_changes;
+CREATE CONSTRAINT TRIGGER inventory_row_changes_commit AFTER INSERT ON inventory_row_changes
+  DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE FUNCTION inventory_row_changes_commit_trg();
+"""
+
+# Every write to inventory_read also appends the changed columns (old vs new)
+# to inventory_row_changes, which feeds row.changed events and /rows/changes.
+_REFRESH_FN = f"""
+CREATE OR REPLACE FUNCTION inventory_read_refresh(codes text[]) RETURNS void
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF codes IS NULL OR cardinality(codes) = 0 THEN
+    RETURN;
+  END IF;
+
+  WITH gone AS (
+    DELETE FROM inventory_read r
+     WHERE r.synergy_code = ANY(codes)
+       AND NOT EXISTS (SELECT 1 FROM public.inventory_items i WHERE i.synergy_code = r.synergy_code)
+    RETURNING r.synergy_code
+  )
+  INSERT INTO inventory_row_changes (synergy_code, op)
+  SELECT synergy_code, 'delete' FROM gone;
+
+  WITH old AS (
+    SELECT * FROM inventory_read WHERE synergy_code = ANY(codes)
+  ), up AS (
+    INSERT INTO inventory_read ({", ".join(_COLS)})
+    {SOURCE_SQL}
+    WHERE i.synergy_code = ANY(codes)
+    ON CONFLICT (synergy_code) DO UPDATE
+       SET ({", ".join(_COLS[1:])}) = ROW({", ".join("EXCLUDED." + c for c in _COLS[1:])})
+     WHERE ({", ".join("inventory_read." + c for c in _COLS[1:])})
+           IS DISTINCT FROM ({", ".join("EXCLUDED." + c for c in _COLS[1:])})
+    RETURNING inventory_read.*
+  )
+  INSERT INTO inventory_row_changes (synergy_code, op, changed)
+  SELECT up.synergy_code, 'upsert',
+         (SELECT jsonb_object_agg(n.key, n.value)
+            FROM jsonb_each(to_jsonb(up)) n
+           WHERE o.synergy_code IS NULL OR (to_jsonb(o) -> n.key) IS DISTINCT FROM n.value)
+  FROM up
+  LEFT JOIN old o ON o.synergy_code = up.synergy_code;
+END
+$fn$;
+"""
+
+_TRIGGER_FNS = """
+CREATE OR REPLACE FUNCTION inventory_read_items_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM inventory_read_refresh(ARRAY(SELECT synergy_code FROM new_rows));
+  ELSIF TG_OP = 'UPDATE' THEN
+    PERFORM inventory_read_refresh(ARRAY(
+      SELECT synergy_code FROM new_rows UNION SELECT synergy_code FROM old_rows));
+  ELSE
+    PERFORM inventory_read_refresh(ARRAY(SELECT synergy_code FROM old_rows));
+  END IF;
+  RETURN NULL;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION inventory_read_lines_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    PERFORM inventory_read_refresh(ARRAY(
+      SELECT r.synergy_code FROM inventory_read r WHERE r.line_id IN (SELECT id FROM new_rows)));
+  ELSE
+    PERFORM inventory_read_refresh(ARRAY(
+      SELECT r.synergy_code FROM inventory_read r WHERE r.line_id IN (SELECT id FROM old_rows)));
+  END IF;
+  RETURN NULL;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION inventory_read_categories_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF TG_OP = 'UPDATE' THEN
+    PERFORM inventory_read_refresh(ARRAY(
+      SELECT r.synergy_code FROM inventory_read r WHERE r.category_id IN (SELECT id FROM new_rows)));
+  ELSE
+    PERFORM inventory_read_refresh(ARRAY(
+      SELECT r.synergy_code FROM inventory_read r WHERE r.category_id IN (SELECT id FROM old_rows)));
+  END IF;
+  RETURN NULL;
+END
+$fn$;
+"""
+
+# (trigger name, table, event, transition tables)
+_TRIGGERS = [
+    ("inventory_read_items_ins", "public.inventory_items", "INSERT", "NEW TABLE AS new_rows", "inventory_read_items_trg"),
+    ("inventory_read_items_upd", "public.inventory_items", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows", "inventory_read_items_trg"),
+    ("inventory_read_items_del", "public.inventory_items", "DELETE", "OLD TABLE AS old_rows", "inventory_read_items_trg"),
+    ("inventory_read_lines_upd", "po_lines", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows", "inventory_read_lines_trg"),
+    ("inventory_read_lines_del", "po_lines", "DELETE", "OLD TABLE AS old_rows", "inventory_read_lines_trg"),
+    ("inventory_read_categories_upd", "categories", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows", "inventory_read_categories_trg"),
+    ("inventory_read_categories_del", "categories", "DELETE", "OLD TABLE AS old_rows", "inventory_read_categories_trg"),
+]
+
+
+def _current_columns(cur) -> List[str]:
+    cur.execute(
+        """
+        SELECT column_name FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'inventory_read'
+        ORDER BY ordinal_position
+        """
+    )
+    return [r["column_name"] for r in cur.fetchall()]
+
+
+def _spec_version(cur) -> Optional[int]:
+    cur.execute("SELECT obj_description('inventory_read'::regclass, 'pg_class') AS note")
+    note = (cur.fetchone() or {}).get("note") or ""
+    return int(note.split("=", 1)[1]) if note.startswith("spec_extractor=") else None
+
+
+def ensure_inventory_read():
+    """
+    Create / migrate the read model, its refresh function and triggers.
+    Safe to call from every worker on startup (serialized by an advisory lock).
+    The table is rebuilt from scratch whenever READ_COLUMNS changes shape.
+    """
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('inventory_read'))")
+        cur.execute(_CHANGES_DDL)
+        cur.execute(_COMMIT_ORDER_FN)
+        cur.execute(SPEC_FUNCTIONS_SQL)
+
+        if _current_columns(cur) != _COLS:
+            log.info("Rebuilding inventory_read read model")
+            cur.execute("DROP TABLE IF EXISTS inventory_read CASCADE")
+            cur.execute(f"CREATE TABLE inventory_read AS {SOURCE_SQL} WHERE i.synergy_code IS NOT NULL")
+            cur.execute("ALTER TABLE inventory_read ADD PRIMARY KEY (synergy_code)")
+            # Clients holding an older version must refetch instead of replaying.
+            cur.execute("INSERT INTO inventory_row_changes (op) VALUES ('reset')")
+            rebuilt, reextract = True, False
+        else:
+            rebuilt = False
+            reextract = _spec_version(cur) != SPEC_EXTRACTOR_VERSION
+
+        for stmt in _INDEXES:
+            cur.execute(stmt)
+
+        cur.execute("SAVEPOINT trgm")
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute(_TRGM_INDEX)
+            cur.execute("RELEASE SAVEPOINT trgm")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT trgm")
+            log.warning("pg_trgm unavailable, inventory_read search falls back to scans: %s", e)
+
+        cur.execute(_REFRESH_FN)
+        if reextract:
+            # Extractor rules changed: recompute through refresh so the typed
+            # columns land in the change log like any other edit.
+            log.info("Re-extracting inventory_read spec columns")
+            cur.execute("SELECT inventory_read_refresh(array_agg(synergy_code)) FROM inventory_read")
+        cur.execute(f"COMMENT ON TABLE inventory_read IS 'spec_extractor={SPEC_EXTRACTOR_VERSION}'")
+        cur.execute(_TRIGGER_FNS)
+        for name, table, event, referencing, fn in _TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+            cur.execute(
+                f"CREATE TRIGGER {name} AFTER {event} ON {table} "
+                f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION {fn}()"
+            )
+        ensure_inventory_counts(cur, recount=rebuilt)
+        con.commit()
+
+
+def read_rows(cur, codes: Sequence[str]) -> List[Dict[str, Any]]:
+    """Fetch API-shaped rows for the given synergy codes from the read model."""
+    codes = [c for c in codes if c]
+    if not codes:
+        return []
+    cur.execute(READ_BY_CODES_SQL + "    ORDER BY r.synergy_code\n", (list(codes),))
+    return [dict(r) for r in cur.fetchall()]
+
+
+def change_event(row: Dict[str, Any]) -> Dict[str, Any]:
+    """inventory_row_changes row -> {version, synergyId, op, fields} with API field names."""
+    fields = {
+        _COLUMN_ALIASES[col]: val
+        for col, val in (row.get("changed") or {}).items()
+        if col in _COLUMN_ALIASES
+    }
+    return {"version": row["version"], "synergyId": row["synergy_code"], "op": row["op"], "fields": fields}
+
+
+def pending_row_changes(cur) -> Optional[str]:
+    """
+    Id of the current transaction if it wrote anything (None for read-only
+    work). Hand it to publish_row_changes() once the transaction committed.
+    """
+    cur.execute("SELECT pg_current_xact_id_if_assigned()::text AS txid")
+    return cur.fetchone()["txid"]
+
+
+def publish_row_changes(txid: Optional[str]) -> int:
+    """
+    Broadcast one row.changed event with the deltas logged by transaction
+    `txid` (see pending_row_changes). Call after commit: versions are only
+    final then, and a rolled-back transaction announces nothing. Returns the
+    number of changes.
+    """
+    if not txid:
+        return 0
+    with db() as (con, cur):
+        cur.execute(
+            """
+            SELECT version, synergy_code, op, changed
+            FROM inventory_row_changes
+            WHERE txid = %s::xid8 AND op IN ('upsert', 'delete')
+            ORDER BY version
+            """,
+            (txid,),
+        )
+        rows = cur.fetchall()
+    if not rows:
+        return 0
+    version = rows[-1]["version"]
+    if len(rows) > ROW_CHANGED_MAX_INLINE:
+        _broadcast("row.changed", {"version": version, "count": len(rows), "truncated": True})
+    else:
+        _broadcast("row.changed", {"version": version, "changes": [change_event(r) for r in rows]})
+    return len(rows)
+
+
+def prune_row_changes():
+    """Scheduled: drop changelog entries past retention, leaving a marker so stale clients reset."""
+    with db() as (con, cur):
+        cur.execute(
+            """
+            WITH gone AS (
+              DELETE FROM inventory_row_changes
+              WHERE changed_at < NOW() - make_interval(hours => %s) AND op <> 'prune'
+              RETURNING version
+            )
+            SELECT MAX(version) AS up_to FROM gone
+            """,
+            (ROW_CHANGES_RETENTION_HOURS,),
+        )
+        up_to = cur.fetchone()["up_to"]
+        if up_to:
+            cur.execute("DELETE FROM inventory_row_changes WHERE op = 'prune'")
+            cur.execute(
+                "INSERT INTO inventory_row_changes (op, changed) VALUES ('prune', jsonb_build_object('upTo', %s::bigint))",
+                (up_to,),
+            )
@@ -0,0 +1,109 @@
+# item_photos.py
+"""
+Item photos: an item's own photos plus a referenced stock photo.
+
+inventory_items.photos holds only the photos taken of that item. A stock
+photo is linked through inventory_items.stock_photo_id and expanded at read
+time, so linking a 300-unit line writes 300 uuids instead of 300 copies of the
+photo array, and editing a stock photo shows on every item that uses it.
+
+Read the combined list with item_photos_sql() (own photos first, then the
+stock photo's, in the {url, id, is_stock, stock_id} shape older links copied
+in) or resolve_item_photos(). ensure_item_photo_refs() indexes the reference
+and, the first time it runs, strips those copies from photos:
+
+    python item_photos.py --dedupe      # run the cleanup again
+"""
+import argparse
+import logging
+from typing import Any, Dict, List, Optional, Sequence
+
+from db_utils import db
+
+log = logging.getLogger(__name__)
+
+_REF_INDEX = "inventory_items_stock_photo_idx"
+
+# Photo objects of stock photo `b`.
+STOCK_PHOTOS_JSON_SQL = """
+    COALESCE((SELECT jsonb_agg(jsonb_build_object('url', u, 'id', COALESCE(b.cloudinary_ids[n], ''),
+                                                  'is_stock', true, 'stock_id', b.id::text) ORDER BY n)
+              FROM unnest(b.urls) WITH ORDINALITY x(u, n)), '[]'::jsonb)
+"""
+
+# Copies of the item's own stock photo, left in photos by links made before
+# the reference was resolved at read time.
+_DEDUPE_SQL = """
+    UPDATE inventory_items i
+       SET photos = (SELECT jsonb_agg(e.p ORDER BY e.n)
+                       FROM jsonb_array_elements(i.photos) WITH ORDINALITY e(p, n)
+                      WHERE NOT (e.p ->> 'is_stock' = 'true' AND e.p ->> 'stock_id' = i.stock_photo_id::text))
+     WHERE i.stock_photo_id IS NOT NULL
+       AND jsonb_typeof(i.photos) = 'array'
+       AND i.photos @> jsonb_build_array(jsonb_build_object('is_stock', true, 'stock_id', i.stock_photo_id::text))
+"""
+
+
+def item_photos_sql(item: str = "i") -> str:
+    """jsonb photo list of inventory_items alias `item` (a scalar subquery)."""
+    return f"""
+    (COALESCE({item}.photos, '[]'::jsonb)
+       || COALESCE((SELECT {STOCK_PHOTOS_JSON_SQL} FROM stock_photos b WHERE b.id = {item}.stock_photo_id), '[]'::jsonb))
+"""
+
+
+RESOLVE_SQL = f"""
+    SELECT i.synergy_code, {item_photos_sql()} AS photos
+    FROM inventory_items i
+    WHERE i.synergy_code = ANY(%s)
+"""
+
+
+def resolve_item_photos(cur, codes: Sequence[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """synergy_code -> photo objects, for the given items."""
+    if not codes:
+        return {}
+    cur.execute(RESOLVE_SQL, (list(codes),))
+    return {r["synergy_code"]: r["photos"] for r in cur.fetchall()}
+
+
+def _dedupe(cur) -> int:
+    cur.execute(_DEDUPE_SQL)
+    return cur.rowcount
+
+
+def ensure_item_photo_refs():
+    """Index stock photo references; on first run, drop the copied stock photos from items."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('item_photo_refs'))")
+        cur.execute("SELECT to_regclass(%s) IS NULL AS missing", (_REF_INDEX,))
+        missing = cur.fetchone()["missing"]
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {_REF_INDEX} ON inventory_items (stock_photo_id) "
+                    "WHERE stock_photo_id IS NOT NULL")
+        if missing:
+            log.info("Removing copied stock photos from inventory_items.photos")
+            log.info("%s items deduplicated", _dedupe(cur))
+        con.commit()
+
+
+def dedupe_item_photos() -> int:
+    """Strip copied stock photos from every linked item. Returns the items rewritten."""
+    with db() as (con, cur):
+        return _dedupe(cur)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="maintain stock photo references on inventory items")
+    ap.add_argument("--dedupe", action="store_true", help="remove copies of the linked stock photo from photos")
+    args = ap.parse_args(argv)
+    if not args.dedupe:
+        ap.print_help()
+        return 2
+    ensure_item_photo_refs()
+    n = dedupe_item_photos()
+    print(f"{n} items deduplicated")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,289 @@
+# listing_drafts.py
+"""
+Precomputed eBay listing drafts (title + description HTML) for
+GET /rows/{id}/ebay-listing.
+
+A draft is stored per item with an md5 of the inputs it was generated from
+(product name, grade, tester comment, specs, category label and
+DRAFT_TEMPLATE_VERSION). It is served as-is while that hash still matches the
+item; otherwise the request generates a new one inline and stores it.
+?regenerate=true forces a new draft.
+
+Statement triggers on inventory_read queue an item in
+ebay_listing_draft_queue when it becomes TESTED, or when its inputs change
+while TESTED. process_listing_drafts() (scheduler, every
+LISTING_DRAFT_SECONDS) claims queued items with SKIP LOCKED plus a lease,
+skips those whose draft is already current, and generates the rest, a few
+at a time. Output that fell back because the LLM failed is never stored. It
+is retried with backoff and dropped after LISTING_DRAFT_MAX_ATTEMPTS; reads
+still generate it on demand.
+
+    python listing_drafts.py --enqueue-tested --once
+"""
+import os
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from ai_utils import generate_ebay_listing_content
+from db_utils import db
+
+log = logging.getLogger(__name__)
+
+LISTING_DRAFT_SECONDS = int(os.getenv("LISTING_DRAFT_SECONDS", "30"))
+LISTING_DRAFT_BATCH = int(os.getenv("LISTING_DRAFT_BATCH", "10"))
+LISTING_DRAFT_WORKERS = int(os.getenv("LISTING_DRAFT_WORKERS", "2"))
+LISTING_DRAFT_MAX_ATTEMPTS = int(os.getenv("LISTING_DRAFT_MAX_ATTEMPTS", "6"))
+LISTING_DRAFT_BACKOFF_SECONDS = float(os.getenv("LISTING_DRAFT_BACKOFF_SECONDS", "60"))
+# Bump when the prompts or the template change: every draft becomes stale.
+DRAFT_TEMPLATE_VERSION = 1
+_LEASE_SECONDS = 600
+_MAX_BACKOFF_SECONDS = 3600
+
+# inventory_read columns a draft is generated from.
+INPUT_COLUMNS = ("product_name", "grade", "tester_comment", "specs", "category_label")
+
+_DRAFTS_DDL = """
+CREATE TABLE IF NOT EXISTS ebay_listing_drafts (
+  synergy_code     text PRIMARY KEY,
+  input_hash       text NOT NULL,
+  title            text,
+  description_html text,
+  generated_at     timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS ebay_listing_draft_queue (
+  synergy_code    text PRIMARY KEY,
+  seq             bigint NOT NULL DEFAULT 1,     -- bumped on every re-queue
+  attempts        int NOT NULL DEFAULT 0,
+  next_attempt_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS ebay_listing_draft_queue_due_idx ON ebay_listing_draft_queue (next_attempt_at);
+"""
+
+_ENQUEUE = """
+    INSERT INTO ebay_listing_draft_queue AS q (synergy_code)
+    {select}
+    ORDER BY 1
+    ON CONFLICT (synergy_code) DO UPDATE SET seq = q.seq + 1, attempts = 0, next_attempt_at = now()
+"""
+
+_INPUTS_CHANGED = " OR ".join(f"o.{c} IS DISTINCT FROM n.{c}" for c in ("status",) + INPUT_COLUMNS)
+
+_TRIGGER_FN = f"""
+CREATE OR REPLACE FUNCTION ebay_listing_drafts_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    {_ENQUEUE.format(select="SELECT synergy_code FROM new_rows WHERE status = 'TESTED'")};
+  ELSIF TG_OP = 'UPDATE' THEN
+    {_ENQUEUE.format(select=f"SELECT n.synergy_code FROM new_rows n JOIN old_rows o USING (synergy_code) WHERE n.status = 'TESTED' AND ({_INPUTS_CHANGED})")};
+  ELSE
+    DELETE FROM ebay_listing_draft_queue WHERE synergy_code IN (SELECT synergy_code FROM old_rows);
+    DELETE FROM ebay_listing_drafts WHERE synergy_code IN (SELECT synergy_code FROM old_rows);
+  END IF;
+  RETURN NULL;
+END
+$fn$;
+"""
+
+_TRIGGERS = [
+    ("ebay_listing_drafts_ins", "INSERT", "NEW TABLE AS new_rows"),
+    ("ebay_listing_drafts_upd", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    ("ebay_listing_drafts_del", "DELETE", "OLD TABLE AS old_rows"),
+]
+
+_BACKFILL_SQL = _ENQUEUE.format(select="""
+    SELECT r.synergy_code FROM inventory_read r
+    WHERE r.status = 'TESTED'
+      AND NOT EXISTS (SELECT 1 FROM ebay_listing_drafts d WHERE d.synergy_code = r.synergy_code)
+""")
+
+INPUT_HASH_SQL = (
+    f"md5(jsonb_build_array({DRAFT_TEMPLATE_VERSION}, "
+    + ", ".join(f"r.{c}" for c in INPUT_COLUMNS)
+    + ")::text)"
+)
+
+# An item's draft inputs, current hash and stored draft (if any).
+_INPUTS_SQL = f"""
+    SELECT r.synergy_code, r.status, {", ".join(f"r.{c}" for c in INPUT_COLUMNS)},
+           {INPUT_HASH_SQL} AS input_hash,
+           d.input_hash AS draft_hash, d.title, d.description_html, d.generated_at
+    FROM inventory_read r
+    LEFT JOIN ebay_listing_drafts d ON d.synergy_code = r.synergy_code
+    WHERE r.synergy_code = ANY(%s)
+"""
+
+_STORE_SQL = """
+    INSERT INTO ebay_listing_drafts (synergy_code, input_hash, title, description_html)
+    VALUES (%s, %s, %s, %s)
+    ON CONFLICT (synergy_code) DO UPDATE
+       SET input_hash = EXCLUDED.input_hash, title = EXCLUDED.title,
+           description_html = EXCLUDED.description_html, generated_at = now()
+    RETURNING generated_at
+"""
+
+_CLAIM_SQL = """
+    WITH due AS (
+        SELECT synergy_code FROM ebay_listing_draft_queue
+        WHERE next_attempt_at <= now()
+        ORDER BY next_attempt_at
+        LIMIT %(limit)s
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE ebay_listing_draft_queue q
+       SET attempts = q.attempts + 1,
+           next_attempt_at = now() + make_interval(secs => %(lease)s)
+      FROM due
+     WHERE q.synergy_code = due.synergy_code
+    RETURNING q.synergy_code, q.seq, q.attempts
+"""
+
+# Only if not re-queued meanwhile (the inputs changed during generation).
+_DONE_SQL = """
+    DELETE FROM ebay_listing_draft_queue q
+     USING unnest(%s::text[], %s::bigint[]) c(synergy_code, seq)
+     WHERE q.synergy_code = c.synergy_code AND q.seq = c.seq
+"""
+
+_RETRY_SQL = """
+    UPDATE ebay_listing_draft_queue
+       SET next_attempt_at = now() + make_interval(secs => least(%(cap)s, %(base)s * 2 ^ (attempts - 1)))
+     WHERE synergy_code = ANY(%(codes)s)
+"""
+
+
+def condition_label(grade: Optional[str]) -> str:
+    g = (grade or "").upper()
+    if g == 'A': return "Excellent - Refurbished"
+    if g == 'B': return "Good - Used"
+    if g == 'C': return "Fair - Heavy Wear"
+    if g == 'D': return "Rough - Damaged"
+    if g == 'P': return "For Parts or Not Working"
+    return "Used"
+
+
+def ensure_listing_drafts():
+    """Create the draft tables and queue triggers; queue TESTED items the first time."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('ebay_listing_drafts'))")
+        cur.execute("SELECT to_regclass('ebay_listing_draft_queue') IS NULL AS missing")
+        missing = cur.fetchone()["missing"]
+        cur.execute(_DRAFTS_DDL)
+        cur.execute(_TRIGGER_FN)
+        for name, event, referencing in _TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON inventory_read")
+            cur.execute(
+                f"CREATE TRIGGER {name} AFTER {event} ON inventory_read "
+                f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION ebay_listing_drafts_trg()"
+            )
+        if missing:
+            cur.execute(_BACKFILL_SQL)
+            log.info("%s TESTED items queued for listing drafts", cur.rowcount)
+        con.commit()
+
+
+def _generate(row: Dict[str, Any], cache: bool = True) -> Dict[str, Any]:
+    return generate_ebay_listing_content({
+        "product_name_raw": row["product_name"] or "",
+        "grade": row["grade"],
+        "condition": condition_label(row["grade"]),
+        "specs": row["specs"] or {},
+        "tester_comment": row["tester_comment"] or "",
+        "category_label": row["category_label"] or "",
+    }, cache=cache)
+
+
+def get_listing_draft(cur, synergy_code: str, regenerate: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    {title, html, generated_at} for an item: the stored draft while its inputs
+    are unchanged, else a new one (stored unless the LLM failed). None when
+    the code is not an inventory item.
+    """
+    cur.execute(_INPUTS_SQL, ([synergy_code],))
+    row = cur.fetchone()
+    if not row:
+        return None
+    if not regenerate and row["draft_hash"] == row["input_hash"]:
+        return {"title": row["title"], "html": row["description_html"], "generated_at": row["generated_at"]}
+    # Regenerating asks for a new text, not the LLM client's cached reply to the same prompt.
+    content = _generate(row, cache=not regenerate)
+    generated_at = None
+    if not content.get("degraded"):
+        cur.execute(_STORE_SQL, (synergy_code, row["input_hash"], content["title"], content["html"]))
+        generated_at = cur.fetchone()["generated_at"]
+    return {"title": content["title"], "html": content["html"], "generated_at": generated_at}
+
+
+def _process_batch(claimed: List[Dict[str, Any]]) -> Dict[str, int]:
+    stats = {"generated": 0, "current": 0, "retry": 0, "dropped": 0}
+    with db() as (con, cur):
+        cur.execute(_INPUTS_SQL, ([c["synergy_code"] for c in claimed],))
+        rows = {r["synergy_code"]: dict(r) for r in cur.fetchall()}
+    todo = [r for r in rows.values() if r["status"] == 'TESTED' and r["draft_hash"] != r["input_hash"]]
+
+    # LLM calls happen outside any transaction.
+    with ThreadPoolExecutor(max_workers=LISTING_DRAFT_WORKERS, thread_name_prefix="listing-draft") as pool:
+        contents = dict(zip([r["synergy_code"] for r in todo], pool.map(_generate, todo)))
+
+    failed = [code for code, c in contents.items() if c.get("degraded")]
+    with db() as (con, cur):
+        for code, c in contents.items():
+            if not c.get("degraded"):
+                cur.execute(_STORE_SQL, (code, rows[code]["input_hash"], c["title"], c["html"]))
+        attempts = {c["synergy_code"]: c["attempts"] for c in claimed}
+        dropped = [code for code in failed if attempts[code] >= LISTING_DRAFT_MAX_ATTEMPTS]
+        done = [c for c in claimed if c["synergy_code"] not in failed or c["synergy_code"] in dropped]
+        cur.execute(_DONE_SQL, ([c["synergy_code"] for c in done], [c["seq"] for c in done]))
+        retry = [code for code in failed if code not in dropped]
+        if retry:
+            cur.execute(_RETRY_SQL, {"codes": retry, "base": LISTING_DRAFT_BACKOFF_SECONDS, "cap": _MAX_BACKOFF_SECONDS})
+    if dropped:
+        log.warning("listing drafts gave up after %d attempts: %s", LISTING_DRAFT_MAX_ATTEMPTS, dropped[:20])
+    stats["generated"] = len(contents) - len(failed)
+    stats["current"] = len(claimed) - len(contents)
+    stats["retry"] = len(retry)
+    stats["dropped"] = len(dropped)
+    return stats
+
+
+def process_listing_drafts(max_batches: int = 20) -> Dict[str, int]:
+    """Scheduled: generate drafts for queued items. Returns counts."""
+    totals = {"generated": 0, "current": 0, "retry": 0, "dropped": 0}
+    for _ in range(max_batches):
+        with db() as (con, cur):
+            cur.execute(_CLAIM_SQL, {"limit": LISTING_DRAFT_BATCH, "lease": _LEASE_SECONDS})
+            claimed = [dict(r) for r in cur.fetchall()]
+        if not claimed:
+            break
+        stats = _process_batch(claimed)
+        for k, v in stats.items():
+            totals[k] += v
+        if stats["retry"] + stats["dropped"] and not stats["generated"]:
+            break  # LLM is failing; leave the rest to the backoff
+    return totals
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="generate queued eBay listing drafts")
+    ap.add_argument("--once", action="store_true", help="process everything due now and exit")
+    ap.add_argument("--enqueue-tested", action="store_true",
+                    help="queue every TESTED item (current drafts are skipped, not regenerated)")
+    args = ap.parse_args(argv)
+    if not (args.once or args.enqueue_tested):
+        ap.print_help()
+        return 2
+    ensure_listing_drafts()
+    if args.enqueue_tested:
+        with db() as (con, cur):
+            cur.execute(_ENQUEUE.format(select="SELECT synergy_code FROM inventory_read WHERE status = 'TESTED'"))
+            print(f"{cur.rowcount} items queued")
+    if args.once:
+        print(process_listing_drafts(max_batches=100_000))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,391 @@
+# llm_client.py
+"""
+Shared client for the text LLM (Pollinations) used by the assistant, listing
+generation, UPC lookup and AI imports.
+
+  * One requests.Session with a keep-alive pool sized to the concurrency cap.
+  * At most LLM_MAX_CONCURRENCY calls in flight per process; callers wait up
+    to LLM_QUEUE_TIMEOUT_SECONDS for a slot.
+  * Responses are cached in-process by a hash of the full request (model,
+    messages, mode) for LLM_CACHE_TTL_SECONDS, LRU-bounded.
+  * Identical requests already in flight are coalesced: one call, every
+    waiter gets its answer.
+  * A circuit breaker opens after LLM_BREAKER_FAILURES consecutive failures
+    (timeouts, connection errors, 429/5xx) and fails calls fast for
+    LLM_BREAKER_COOLDOWN_SECONDS; then one probe call decides whether it
+    closes again.
+
+Failures raise LLMError (a RuntimeError), LLMUnavailable when the call was not
+even attempted. LLM_URL points the client elsewhere, e.g. the local stub:
+
+    python llm_client.py --stub 8998 --status 500 --delay 2      # stand-in server
+    LLM_URL=http://127.0.0.1:8998/ python llm_client.py "say hi" --repeat 3
+    python llm_client.py --check    # timeout, fallback, coalescing, breaker
+"""
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+LLM_URL = os.getenv("LLM_URL", "https://text.pollinations.ai/")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "30"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+LLM_RETRY_DELAY_SECONDS = float(os.getenv("LLM_RETRY_DELAY_SECONDS", "2"))
+LLM_CACHE_TTL_SECONDS = float(os.getenv("LLM_CACHE_TTL_SECONDS", "600"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500"))
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+
+class LLMError(RuntimeError):
+    """The LLM call failed (or its reply did not parse)."""
+
+
+class LLMUnavailable(LLMError):
+    """Not attempted: breaker open or no free slot in time."""
+
+
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=LLM_MAX_CONCURRENCY, max_retries=0)
+_session.mount("https://", _adapter)
+_session.mount("http://", _adapter)
+
+_slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+_lock = threading.Lock()
+_cache: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+_inflight: Dict[str, Future] = {}
+_breaker = {"failures": 0, "open_until": 0.0, "probing": False}
+_stats = {"calls": 0, "hits": 0, "coalesced": 0, "failures": 0, "rejected": 0}
+
+
+def _key(payload: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+
+def _breaker_admit():
+    """Raise LLMUnavailable while open; past the cooldown let a single probe through."""
+    with _lock:
+        if _breaker["failures"] < LLM_BREAKER_FAILURES:
+            return
+        if time.monotonic() < _breaker["open_until"] or _breaker["probing"]:
+            _stats["rejected"] += 1
+            raise LLMUnavailable("LLM circuit open after repeated failures")
+        _breaker["probing"] = True
+
+
+def _breaker_record(ok: bool):
+    with _lock:
+        _breaker["probing"] = False
+        if ok:
+            _breaker["failures"] = 0
+            return
+        _stats["failures"] += 1
+        _breaker["failures"] += 1
+        if _breaker["failures"] >= LLM_BREAKER_FAILURES:
+            if _breaker["failures"] == LLM_BREAKER_FAILURES:
+                log.warning("LLM circuit open for %ss", LLM_BREAKER_COOLDOWN_SECONDS)
+            _breaker["open_until"] = time.monotonic() + LLM_BREAKER_COOLDOWN_SECONDS
+
+
+def _post(payload: Dict[str, Any], attempts: int, timeout: Optional[Tuple[float, float]]) -> str:
+    error = "no attempt made"
+    for attempt in range(attempts):
+        if attempt:
+            time.sleep(LLM_RETRY_DELAY_SECONDS)
+        _breaker_admit()
+        if not _slots.acquire(timeout=LLM_QUEUE_TIMEOUT_SECONDS):
+            with _lock:
+                _stats["rejected"] += 1
+                _breaker["probing"] = False
+            raise LLMUnavailable(f"no free LLM slot within {LLM_QUEUE_TIMEOUT_SECONDS}s")
+        try:
+            with _lock:
+                _stats["calls"] += 1
+            r = _session.post(LLM_URL, json=payload, timeout=timeout or (LLM_CONNECT_TIMEOUT, LLM_READ_TIMEOUT))
+        except requests.RequestException as e:
+            error = f"{type(e).__name__}: {e}"
+            _breaker_record(False)
+            log.warning("LLM attempt %d failed: %s", attempt + 1, error)
+            continue
+        finally:
+            _slots.release()
+        if r.status_code == 200:
+            _breaker_record(True)
+            return r.text
+        error = f"HTTP {r.status_code}: {r.text[:200]}"
+        log.warning("LLM attempt %d failed: %s", attempt + 1, error)
+        if r.status_code == 429 or r.status_code >= 500:
+            _breaker_record(False)
+        else:
+            _breaker_record(True)  # the service answered; this request is the problem
+            break
+    raise LLMError(error)
+
+
+def complete(
+    messages: List[Dict[str, str]],
+    model: str = "openai",
+    json_mode: bool = False,
+    parse: Optional[Callable[[str], Any]] = None,
+    cache: bool = True,
+    attempts: int = 1,
+    timeout: Optional[Tuple[float, float]] = None,
+) -> Any:
+    """
+    Reply text for a chat request, or parse(text) when `parse` is given. A
+    reply that fails to parse is not cached and the parse error propagates.
+    """
+    payload = {"messages": messages, "model": model, "jsonMode": json_mode}
+    key = _key(payload)
+    finish = parse or (lambda text: text)
+
+    with _lock:
+        hit = _cache.get(key) if cache else None
+        if hit and hit[0] > time.monotonic():
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            text = hit[1]
+        else:
+            text = None
+            future = _inflight.get(key)
+            leader = future is None
+            if leader:
+                future = _inflight[key] = Future()
+            else:
+                _stats["coalesced"] += 1
+    if text is not None:
+        return finish(text)
+    if not leader:
+        return finish(future.result())
+
+    try:
+        text = _post(payload, attempts, timeout)
+        result = finish(text)
+    except BaseException as e:
+        with _lock:
+            _inflight.pop(key, None)
+        future.set_exception(e)
+        raise
+    with _lock:
+        if cache:
+            _cache[key] = (time.monotonic() + LLM_CACHE_TTL_SECONDS, text)
+            _cache.move_to_end(key)
+            while len(_cache) > LLM_CACHE_MAX_ENTRIES:
+                _cache.popitem(last=False)
+        _inflight.pop(key, None)
+    future.set_result(text)
+    return result
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+
+
+def llm_stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            **_stats,
+            "cached": len(_cache),
+            "in_flight": len(_inflight),
+            "circuit_open": _breaker["failures"] >= LLM_BREAKER_FAILURES,
+        }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """Stand-in LLM: echoes the last message as JSON after `delay`, or answers `status`."""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        state = self.server.state
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        with self.server.lock:
+            state["requests"] += 1
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+        try:
+            time.sleep(state["delay"])
+            prompt = (payload.get("messages") or [{}])[-1].get("content", "")
+            body = json.dumps({"title": prompt[:80], "echo": prompt}) if state["status"] == 200 else "stub failure"
+            data = body.encode()
+            self.send_response(state["status"])
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out and hung up
+        finally:
+            with self.server.lock:
+                state["active"] -= 1
+
+
+def serve_stub(port: int = 0, status: int = 200, delay: float = 0.0) -> ThreadingHTTPServer:
+    """
+    Start the stub LLM server on a daemon thread. Its `state` dict (status,
+    delay, requests, peak concurrency) can be changed while it runs.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), _StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.state = {"status": status, "delay": delay, "requests": 0, "active": 0, "peak": 0}
+    threading.Thread(target=server.serve_forever, name="llm-stub", daemon=True).start()
+    return server
+
+
+def check() -> int:
+    """
+    Run the client against an in-process stub: caching, coalescing, the
+    concurrency cap, read timeouts, the listing fallback and the breaker
+    opening and closing again. Returns the number of failed checks.
+    """
+    global LLM_URL, LLM_READ_TIMEOUT, LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SECONDS
+    from ai_utils import generate_ebay_listing_content
+
+    stub = serve_stub()
+    state = stub.state
+    LLM_URL = f"http://127.0.0.1:{stub.server_address[1]}/"
+    LLM_READ_TIMEOUT = 0.5
+    LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN_SECONDS = 3, 1.0
+    failed = 0
+
+    def reset(status: int = 200, delay: float = 0.0):
+        with _lock:
+            _cache.clear()
+            _breaker.update(failures=0, open_until=0.0, probing=False)
+            for k in _stats:
+                _stats[k] = 0
+        state.update(status=status, delay=delay, requests=0, peak=0)
+
+    def report(name: str, ok: bool, detail: str):
+        nonlocal failed
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {name}: {detail}")
+
+    def ask(prompt: str, **kw):
+        return complete([{"role": "user", "content": prompt}], **kw)
+
+    try:
+        reset()
+        ask("cache me"); ask("cache me")
+        report("cache", state["requests"] == 1 and _stats["hits"] == 1,
+               f"{state['requests']} upstream call(s), {_stats['hits']} hit(s) for 2 identical prompts")
+
+        reset(delay=0.3)
+        threads = [threading.Thread(target=ask, args=("coalesce me",)) for _ in range(6)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        report("coalescing", state["requests"] == 1 and _stats["coalesced"] == 5,
+               f"{state['requests']} upstream call(s), {_stats['coalesced']} coalesced for 6 concurrent identical prompts")
+
+        reset(delay=0.2)
+        threads = [threading.Thread(target=ask, args=(f"prompt {i}",)) for i in range(LLM_MAX_CONCURRENCY * 3)]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        report("concurrency cap", state["peak"] <= LLM_MAX_CONCURRENCY,
+               f"peak {state['peak']} in flight upstream, cap {LLM_MAX_CONCURRENCY}")
+
+        reset(delay=LLM_READ_TIMEOUT * 3)
+        started = time.monotonic()
+        try:
+            ask("too slow")
+            outcome = "answered"
+        except LLMUnavailable:
+            outcome = "unavailable"
+        except LLMError as e:
+            outcome = "timeout" if "Timeout" in str(e) else f"error {e}"
+        took = time.monotonic() - started
+        report("timeout", outcome == "timeout" and took < LLM_READ_TIMEOUT * 2,
+               f"{outcome} after {took:.2f}s with a {LLM_READ_TIMEOUT}s read timeout")
+
+        reset(status=500)
+        listing = generate_ebay_listing_content(
+            {"product_name_raw": "Stub Laptop 14 i5 8GB 256GB", "grade": "B", "tester_comment": "works"}, cache=False)
+        report("listing fallback", listing.get("degraded") is True and listing.get("title") == "Stub Laptop 14 i5 8GB 256GB",
+               f"degraded={listing.get('degraded')}, title={listing.get('title')!r}")
+
+        reset(status=500)
+        errors = []
+        for i in range(LLM_BREAKER_FAILURES + 1):
+            try:
+                ask(f"failing {i}")
+                errors.append("ok")
+            except LLMError as e:
+                errors.append(type(e).__name__)
+        upstream = state["requests"]
+        report("breaker opens", errors[-1] == "LLMUnavailable" and upstream == LLM_BREAKER_FAILURES,
+               f"{errors}, {upstream} upstream call(s)")
+
+        state["status"] = 200
+        time.sleep(LLM_BREAKER_COOLDOWN_SECONDS + 0.1)
+        try:
+            ask("probe")
+            probe = "ok"
+        except LLMError as e:
+            probe = type(e).__name__
+        report("breaker closes", probe == "ok" and not llm_stats()["circuit_open"],
+               f"probe after cooldown: {probe}, circuit_open={llm_stats()['circuit_open']}")
+    finally:
+        stub.shutdown()
+    print("OK" if not failed else f"FAILED ({failed})")
+    return failed
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="send one prompt through the shared LLM client")
+    ap.add_argument("prompt", nargs="?")
+    ap.add_argument("--model", default="openai")
+    ap.add_argument("--json", action="store_true", help="request JSON mode")
+    ap.add_argument("--repeat", type=int, default=1, help="send it this many times (later ones hit the cache)")
+    ap.add_argument("--check", action="store_true", help="run the client checks against an in-process stub")
+    ap.add_argument("--stub", type=int, metavar="PORT", help="serve the stub LLM on PORT until interrupted")
+    ap.add_argument("--status", type=int, default=200, help="stub: HTTP status to answer with")
+    ap.add_argument("--delay", type=float, default=0.0, help="stub: seconds to wait before answering")
+    args = ap.parse_args(argv)
+
+    if args.check:
+        # ai_utils uses the imported module, not this __main__ copy.
+        import llm_client
+        return 1 if llm_client.check() else 0
+    if args.stub is not None:
+        server = serve_stub(args.stub, args.status, args.delay)
+        print(f"stub LLM on http://127.0.0.1:{server.server_address[1]}/ (status {args.status}, delay {args.delay}s)")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+        return 0
+    if not args.prompt:
+        ap.error("a prompt is required (or --check / --stub)")
+
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        try:
+            reply = complete([{"role": "user", "content": args.prompt}], model=args.model, json_mode=args.json)
+        except LLMError as e:
+            reply = f"[{type(e).__name__}] {e}"
+        print(f"{(time.perf_counter() - started) * 1000:.0f}ms  {reply[:200]}")
+    print(llm_stats())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
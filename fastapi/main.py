@@ -9,7 +9,8 @@ from starlette.responses import StreamingResponse
 from dotenv import load_dotenv
 from pathlib import Path
 from fastapi import FastAPI, Depends, Query, HTTPException, Request
-from db_utils import db 
+from fast_json import FastJSONResponse
+from compression import CompressionMiddleware
 from contextlib import asynccontextmanager  # ### NEW: Required for lifespan ###
 from apscheduler.schedulers.background import BackgroundScheduler # ### NEW: The Scheduler ###
 
@@ -35,23 +36,112 @@ from routes_synergy import router as synergy_router
 from routes_label_inventory import router as label_inventory_router
 from routes_label_inventory import employees_router
 from routes_search import router as search_router 
-from routes_messages import router as messages_route 
+from routes_messages import router as messages_route, ensure_message_read_state
 from routes_system import router as system_router 
 from pubsub_utils import _stream_pubsub_sse, subscribe, unsubscribe
 from routes_photos import router as photos_router 
 from routes_time import router as timecard_router 
 from routes_todos import router as todo_router 
 from routes_assistant import router as assistant_router 
+from inventory_read import ensure_inventory_read, prune_row_changes
+from inventory_counts import reconcile_inventory_counts, COUNTS_RECONCILE_MINUTES
+from etags import ensure_resource_versions
+from sales_facts import ensure_sales_facts, reconcile_sales_facts, SALES_FACTS_RECONCILE_HOURS
+from photo_match import ensure_stock_photo_search
+from item_photos import ensure_item_photo_refs
+from photo_tags import ensure_photo_tags
+from cloudinary_cleanup import ensure_cloudinary_deletes, process_cloudinary_deletes, CLOUDINARY_CLEANUP_SECONDS
+from assistant_context import ensure_assistant_context, refresh_assistant_context, ASSISTANT_CONTEXT_CHECK_SECONDS
+from listing_drafts import ensure_listing_drafts, process_listing_drafts, LISTING_DRAFT_SECONDS
+from auth_cache import is_active_user, start_invalidation_listener
+from user_events import attach as attach_user_events, detach as detach_user_events, start_user_events_listener
+from match_index import start_match_index
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # 0. Startup: Make sure the denormalized read model + its triggers exist
+    try:
+        ensure_inventory_read()
+    except Exception as e:
+        print(f"--- WARNING: inventory_read setup failed: {e} ---")
+
+    try:
+        ensure_resource_versions()
+    except Exception as e:
+        print(f"--- WARNING: resource_versions setup failed: {e} ---")
+
+    try:
+        ensure_sales_facts()
+    except Exception as e:
+        print(f"--- WARNING: daily_sales_facts setup failed: {e} ---")
+
+    try:
+        ensure_message_read_state()
+    except Exception as e:
+        print(f"--- WARNING: message read state setup failed: {e} ---")
+
+    try:
+        ensure_stock_photo_search()
+    except Exception as e:
+        print(f"--- WARNING: stock photo search setup failed: {e} ---")
+
+    try:
+        ensure_photo_tags()
+    except Exception as e:
+        print(f"--- WARNING: stock photo tag dictionary setup failed: {e} ---")
+
+    try:
+        ensure_item_photo_refs()
+    except Exception as e:
+        print(f"--- WARNING: stock photo references setup failed: {e} ---")
+
+    try:
+        ensure_cloudinary_deletes()
+    except Exception as e:
+        print(f"--- WARNING: cloudinary delete outbox setup failed: {e} ---")
+
+    try:
+        ensure_assistant_context()
+    except Exception as e:
+        print(f"--- WARNING: assistant context setup failed: {e} ---")
+
+    try:
+        ensure_listing_drafts()
+    except Exception as e:
+        print(f"--- WARNING: listing drafts setup failed: {e} ---")
+
+    # Cross-worker invalidation for the role cache
+    start_invalidation_listener()
+    # Per-user chat delivery + presence across workers
+    start_user_events_listener()
+    # Smart-match index builds in the background; SQL scoring until ready
+    start_match_index()
+
     # 1. Startup: Initialize the Scheduler
     print("--- Server Starting: Initializing Background Scheduler ---")
     scheduler = BackgroundScheduler()
     
     # Run the eBay Sync every 15 minutes
     scheduler.add_job(run_global_ebay_sync, 'interval', minutes=15)
+
+    # Trim the row change log used for delta catch-up
+    scheduler.add_job(prune_row_changes, 'interval', hours=1)
+
+    # Correct any drift in the dashboard counters
+    scheduler.add_job(reconcile_inventory_counts, 'interval', minutes=COUNTS_RECONCILE_MINUTES)
+
+    # Recount recent daily sales facts and fix any drift
+    scheduler.add_job(reconcile_sales_facts, 'interval', hours=SALES_FACTS_RECONCILE_HOURS)
+
+    # Retry queued Cloudinary deletes
+    scheduler.add_job(process_cloudinary_deletes, 'interval', seconds=CLOUDINARY_CLEANUP_SECONDS)
+
+    # Rebuild the assistant's data snapshot when inventory changed (or it aged out)
+    scheduler.add_job(refresh_assistant_context, 'interval', seconds=ASSISTANT_CONTEXT_CHECK_SECONDS)
+
+    # Generate eBay listing drafts for newly tested / edited items
+    scheduler.add_job(process_listing_drafts, 'interval', seconds=LISTING_DRAFT_SECONDS)
     
     scheduler.start()
     print("--- Scheduler Started: Auto-Sync active ---")
@@ -64,7 +154,7 @@ async def lifespan(app: FastAPI):
 
 # --- FastAPI App Initialization ---
 # ### NEW: Add lifespan=lifespan here ###
-app = FastAPI(title="Synergy API", lifespan=lifespan)
+app = FastAPI(title="Synergy API", lifespan=lifespan, default_response_class=FastJSONResponse)
 
 @app.middleware("http")
 async def add_security_headers(request: Request, call_next):
@@ -110,6 +200,9 @@ app.add_middleware(
     allow_origin_regex="chrome-extension://.*",
 )
 
+# --- Response Compression (br / gzip above COMPRESS_MIN_BYTES) ---
+app.add_middleware(CompressionMiddleware)
+
 # --- Include Routers into the Application ---
 app.include_router(auth_admin_router, tags=["Admin & Auth"])
 app.include_router(category_vendor_router, tags=["Categories & Vendors"])
@@ -152,34 +245,36 @@ def verify_sse_access(user_id: str | None = Query(None)):
         # print("SSE Warning: No user_id provided, bypassing auth for stream.")
         return True
 
-    # 3. STANDARD CHECK
-    with db() as (con, cur):
-        # We just need to check if this is a valid active user
-        # Cast to integer safely to avoid DB errors if user_id is weird
-        try:
-            uid = int(user_id)
-            cur.execute("SELECT id FROM app_users WHERE id = %s AND active = TRUE", (uid,))
-            if not cur.fetchone():
-                print(f"SSE Blocked: Invalid user_id {uid}")
-                raise HTTPException(status_code=403, detail="Invalid User")
-        except ValueError:
-            # If user_id isn't an int, ignore it or block it. 
-            # Here we block it to be safe, but the 'if not user_id' block above handles the empty case.
-            raise HTTPException(status_code=403, detail="Invalid User ID format")
+    # 3. STANDARD CHECK (cached; see auth_cache)
+    # Cast to integer safely to avoid DB errors if user_id is weird
+    try:
+        uid = int(user_id)
+    except ValueError:
+        # If user_id isn't an int, ignore it or block it. 
+        # Here we block it to be safe, but the 'if not user_id' block above handles the empty case.
+        raise HTTPException(status_code=403, detail="Invalid User ID format")
+    if not is_active_user(uid):
+        print(f"SSE Blocked: Invalid user_id {uid}")
+        raise HTTPException(status_code=403, detail="Invalid User")
     
     return True
 
 @app.get("/events", tags=["Events"])
 async def events_list(
     # This dependency runs before the stream starts
-    authorized: bool = Depends(verify_sse_access) 
+    authorized: bool = Depends(verify_sse_access),
+    user_id: str | None = Query(None),
 ):
     """
     Endpoint for Server-Sent Events (SSE).
     Protected in Production (DEBUG=False), Open in Local (DEBUG=True).
+    With ?user_id= the stream also carries that user's chat events (user_events).
     """
     # Use the shared subscription logic from pubsub_utils
     q = subscribe()
+    uid = int(user_id) if user_id and user_id.isdigit() else None
+    if uid is not None:
+        attach_user_events(uid, q)
 
     async def gen():
         try:
@@ -198,6 +293,8 @@ async def events_list(
             return
         finally:
             unsubscribe(q)
+            if uid is not None:
+                detach_user_events(uid, q)
 
     return StreamingResponse(gen(), media_type="text/event-stream")
 
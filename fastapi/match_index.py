@@ -0,0 +1,433 @@
+# match_index.py
+"""
+In-memory BM25 index over TESTED inventory for /rows/smart-match.
+
+Documents are the normalized product name plus a few key specs (CPU, RAM,
+storage, screen). Each worker builds the index once in a background thread,
+then keeps it current from inventory_row_changes: changed codes are re-read
+from inventory_read, so replaying a change is harmless. Until a build
+finishes (at startup, or after the change history was reset or pruned past
+the index), callers fall back to the SQL scorer.
+
+    python match_index.py --eval match_fixtures.json   # ranking quality
+    python match_index.py --bench 500000               # top-k latency
+"""
+import os
+import re
+import math
+import time
+import heapq
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from db_utils import db, iter_rows
+
+log = logging.getLogger(__name__)
+
+MATCH_INDEX_REFRESH_SECONDS = float(os.getenv("MATCH_INDEX_REFRESH_SECONDS", "2"))
+# Tokens in more than this fraction of the documents only re-score existing
+# candidates; below MATCH_MIN_COMMON_POSTINGS postings a token always opens them.
+MATCH_COMMON_FRACTION = float(os.getenv("MATCH_COMMON_FRACTION", "0.01"))
+MATCH_MIN_COMMON_POSTINGS = int(os.getenv("MATCH_MIN_COMMON_POSTINGS", "1000"))
+# Per common token, the shortest documents kept as its champion list.
+MATCH_CHAMPIONS = int(os.getenv("MATCH_CHAMPIONS", "250"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+STOP_WORDS = {
+    "and", "or", "the", "with", "for", "new", "used", "open", "box", "grade", "condition",
+    "excellent", "good", "fair", "mint", "black", "white", "silver", "gray", "grey", "blue",
+    "red", "gold", "tablet", "phone", "laptop",
+}
+SPEC_KEYS = ("processor", "cpu", "ram", "memory", "storage", "hdd", "ssd", "screen")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+DOCS_SQL = """
+    SELECT r.synergy_code, r.product_name, r.specs
+    FROM inventory_read r
+    WHERE r.status = 'TESTED'
+"""
+DOCS_BY_CODES_SQL = """
+    SELECT r.synergy_code, r.status, r.product_name, r.specs
+    FROM inventory_read r
+    WHERE r.synergy_code = ANY(%s)
+"""
+CANDIDATES_SQL = """
+    SELECT
+        r.synergy_code AS "synergy_id",
+        r.product_name AS "product_name_raw",
+        r.grade,
+        r.purchase_cost AS "unit_cost",
+        r.qty,
+        r.tester_comment
+    FROM inventory_read r
+    WHERE r.synergy_code = ANY(%s) AND r.status = 'TESTED'
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased words; short tokens survive only when they carry a digit (m1, s7, 12)."""
+    return [
+        t for t in _TOKEN_RE.findall((text or "").lower())
+        if (len(t) > 2 or any(ch.isdigit() for ch in t)) and t not in STOP_WORDS
+    ]
+
+
+def document_text(product_name: Optional[str], specs: Optional[Dict[str, Any]]) -> str:
+    specs = specs or {}
+    parts = [product_name or ""]
+    parts += [str(specs[k]) for k in SPEC_KEYS if specs.get(k)]
+    return " ".join(parts)
+
+
+class MatchIndex:
+    """BM25 over an inverted index: token -> {code: term frequency}."""
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.docs: Dict[str, Tuple[str, ...]] = {}
+        # token -> shortest docs (BM25 favours them at equal tf); rebuilt lazily.
+        self.champions: Dict[str, List[str]] = {}
+        self.total_len = 0
+        self.version = 0
+        self.ready = False
+        self.lock = threading.RLock()
+
+    # --- maintenance ---
+    def _remove(self, code: str):
+        tokens = self.docs.pop(code, None)
+        if tokens is None:
+            return
+        self.total_len -= len(tokens)
+        for t in set(tokens):
+            plist = self.postings.get(t)
+            if plist is not None:
+                plist.pop(code, None)
+                if not plist:
+                    del self.postings[t]
+
+    def upsert(self, code: str, text: str):
+        with self.lock:
+            self._remove(code)
+            tokens = tuple(tokenize(text))
+            if not tokens:
+                return
+            self.docs[code] = tokens
+            self.total_len += len(tokens)
+            for t, tf in Counter(tokens).items():
+                self.postings.setdefault(t, {})[code] = tf
+                ch = self.champions.get(t)
+                if ch is not None:
+                    ch.append(code)
+
+    def _champions(self, token: str, plist: Dict[str, int]) -> List[str]:
+        # Appends from upsert() and removed codes are tolerated (callers
+        # filter by the postings); the list is recut once it doubles.
+        ch = self.champions.get(token)
+        if ch is None or len(ch) > 2 * MATCH_CHAMPIONS:
+            ch = heapq.nsmallest(MATCH_CHAMPIONS, plist, key=lambda c: len(self.docs[c]))
+            self.champions[token] = ch
+        return ch
+
+    def common_cutoff(self) -> int:
+        """Posting-list length above which a token counts as common."""
+        return max(MATCH_MIN_COMMON_POSTINGS, int(len(self.docs) * MATCH_COMMON_FRACTION))
+
+    def remove(self, code: str):
+        with self.lock:
+            self._remove(code)
+
+    def load(self, docs: Iterable[Tuple[str, str]], version: int):
+        """Replace the whole index with (code, text) pairs."""
+        fresh = MatchIndex()
+        for code, text in docs:
+            fresh.upsert(code, text)
+        cutoff = fresh.common_cutoff()
+        for t, plist in fresh.postings.items():
+            if len(plist) > cutoff:
+                fresh._champions(t, plist)
+        with self.lock:
+            self.postings, self.docs, self.total_len = fresh.postings, fresh.docs, fresh.total_len
+            self.champions = fresh.champions
+            self.version = version
+            self.ready = True
+
+    # --- ranking ---
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """
+        Top-k (code, score). With more than two query tokens a candidate must
+        match at least two of them, mirroring the old SQL threshold.
+        """
+        q_tokens = list(dict.fromkeys(tokenize(query)))
+        if not q_tokens:
+            return []
+        min_matched = 2 if len(q_tokens) > 2 else 1
+
+        with self.lock:
+            n = len(self.docs)
+            if not n:
+                return []
+            avgdl = self.total_len / n
+            cutoff = self.common_cutoff()
+            plists = sorted(
+                ((t, self.postings.get(t)) for t in q_tokens if self.postings.get(t)),
+                key=lambda tp: len(tp[1]),
+            )
+            rare = [tp for tp in plists if len(tp[1]) <= cutoff]
+            common = [tp for tp in plists if len(tp[1]) > cutoff]
+
+            # Rare tokens open candidates; common tokens only re-score them. A
+            # query made only of common tokens starts from their champion lists.
+            scores: Dict[str, float] = {}
+            matched: Dict[str, int] = {}
+            if not rare and common:
+                cand = set()
+                for t, plist in common:
+                    cand.update(c for c in self._champions(t, plist) if c in plist)
+                scores = dict.fromkeys(cand, 0.0)
+                matched = dict.fromkeys(cand, 0)
+
+            for t, plist in rare + common:
+                df = len(plist)
+                idf = math.log((n - df + 0.5) / (df + 0.5) + 1.0)
+                if df > cutoff:
+                    items = ((c, plist[c]) for c in scores if c in plist)
+                else:
+                    items = plist.items()
+                for code, tf in items:
+                    dl = len(self.docs[code])
+                    s = idf * tf * (BM25_K1 + 1.0) / (tf + BM25_K1 * (1.0 - BM25_B + BM25_B * dl / avgdl))
+                    scores[code] = scores.get(code, 0.0) + s
+                    matched[code] = matched.get(code, 0) + 1
+
+        eligible = ((c, s) for c, s in scores.items() if matched[c] >= min_matched)
+        return heapq.nlargest(k, eligible, key=lambda cs: (cs[1], cs[0]))
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {"ready": self.ready, "docs": len(self.docs), "tokens": len(self.postings), "version": self.version}
+
+
+_index = MatchIndex()
+_refresh_lock = threading.Lock()
+_last_refresh = 0.0
+_build_lock = threading.Lock()
+_build_thread: Optional[threading.Thread] = None
+
+
+def rebuild():
+    """Full load from inventory_read (streamed through a server-side cursor)."""
+    started = time.monotonic()
+    # Read before the documents: changes committed meanwhile are replayed.
+    with db() as (con, cur):
+        cur.execute("SELECT COALESCE(MAX(version), 0) AS v FROM inventory_row_changes")
+        version = cur.fetchone()["v"]
+    docs = (
+        (r["synergy_code"], document_text(r["product_name"], r["specs"]))
+        for r in iter_rows(DOCS_SQL)
+    )
+    _index.load(docs, version)
+    log.info("match index built: %s in %.1fs", _index.stats(), time.monotonic() - started)
+
+
+def refresh():
+    """
+    Apply row changes after the index version. If history was reset or pruned
+    past it, drop to the SQL scorer and rebuild in the background.
+    """
+    global _last_refresh
+    if not _refresh_lock.acquire(blocking=False):
+        return
+    try:
+        since = _index.version
+        with db() as (con, cur):
+            cur.execute(
+                """
+                SELECT EXISTS (
+                  SELECT 1 FROM inventory_row_changes
+                  WHERE (op = 'reset' AND version > %(since)s)
+                     OR (op = 'prune' AND (changed->>'upTo')::bigint > %(since)s)
+                ) AS reset
+                """,
+                {"since": since},
+            )
+            if cur.fetchone()["reset"]:
+                reset = True
+            else:
+                reset = False
+                # Versions follow commit order, so the index can move to the
+                # last one read without passing over a later commit.
+                cur.execute(
+                    """
+                    SELECT version, synergy_code
+                    FROM inventory_row_changes
+                    WHERE version > %(since)s AND op IN ('upsert', 'delete')
+                    ORDER BY version
+                    """,
+                    {"since": since},
+                )
+                changes = cur.fetchall()
+                codes = list({r["synergy_code"] for r in changes})
+                cur.execute(DOCS_BY_CODES_SQL, (codes,))
+                current = {r["synergy_code"]: r for r in cur.fetchall()}
+
+        if reset:
+            with _index.lock:
+                _index.ready = False
+            start_match_index()
+            return
+
+        next_version = changes[-1]["version"] if changes else since
+
+        with _index.lock:
+            for code in codes:
+                row = current.get(code)
+                if row and row["status"] == "TESTED":
+                    _index.upsert(code, document_text(row["product_name"], row["specs"]))
+                else:
+                    _index.remove(code)
+            _index.version = next_version
+        _last_refresh = time.monotonic()
+    finally:
+        _refresh_lock.release()
+
+
+def start_match_index():
+    """Build the index in the background (once at a time); smart-match uses SQL until it is ready."""
+    global _build_thread
+
+    def run():
+        try:
+            rebuild()
+        except Exception as e:
+            log.warning("match index build failed, smart-match stays on SQL: %s", e)
+
+    with _build_lock:
+        if _build_thread is not None and _build_thread.is_alive():
+            return
+        _build_thread = threading.Thread(target=run, name="match-index-build", daemon=True)
+        _build_thread.start()
+
+
+def smart_match(cur, product_name: str, k: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """
+    Ranked candidates for a product name, or None while the index is being
+    built or rebuilt. Refreshes from row changes at most every MATCH_INDEX_REFRESH_SECONDS.
+    """
+    if not _index.ready:
+        return None
+    if time.monotonic() - _last_refresh > MATCH_INDEX_REFRESH_SECONDS:
+        try:
+            refresh()
+        except Exception as e:
+            log.warning("match index refresh failed: %s", e)
+        if not _index.ready:
+            return None
+
+    hits = _index.search(product_name, k)
+    if not hits:
+        return []
+    cur.execute(CANDIDATES_SQL, ([c for c, _ in hits],))
+    rows = {r["synergy_id"]: dict(r) for r in cur.fetchall()}
+    out = []
+    for code, score in hits:
+        row = rows.get(code)
+        if row:
+            row["score"] = round(score, 4)
+            out.append(row)
+    return out
+
+
+def match_index_stats() -> Dict[str, Any]:
+    return _index.stats()
+
+
+# ============================================================
+# OFFLINE CHECKS
+# ============================================================
+def evaluate(fixtures: Dict[str, Any], k: int = 10) -> Dict[str, Any]:
+    """
+    fixtures: {"items": [{"code", "product_name", "specs"}],
+               "queries": [{"query", "expected": [codes, best first]}]}
+    Reports hit@1, recall@k and MRR of the first expected code.
+    """
+    idx = MatchIndex()
+    idx.load(((d["code"], document_text(d.get("product_name"), d.get("specs"))) for d in fixtures["items"]), 0)
+    hit1 = recall = rr = 0.0
+    misses = []
+    for q in fixtures["queries"]:
+        ranked = [c for c, _ in idx.search(q["query"], k)]
+        expected = q["expected"]
+        hit1 += 1.0 if ranked[:1] == expected[:1] else 0.0
+        recall += len(set(ranked) & set(expected)) / len(expected)
+        rank = ranked.index(expected[0]) + 1 if expected[0] in ranked else None
+        rr += 1.0 / rank if rank else 0.0
+        if rank != 1:
+            misses.append({"query": q["query"], "expected": expected[0], "got": ranked[:3]})
+    n = max(1, len(fixtures["queries"]))
+    return {"queries": n, "hit@1": hit1 / n, f"recall@{k}": recall / n, "mrr": rr / n, "misses": misses}
+
+
+def _synthetic_docs(n: int, seed: int = 7) -> List[Tuple[str, str]]:
+    import random
+    rnd = random.Random(seed)
+    brands = ["apple", "dell", "lenovo", "samsung", "asus", "acer", "microsoft", "google", "sony", "lg"]
+    lines = ["macbook", "latitude", "thinkpad", "galaxy", "zenbook", "aspire", "surface", "pixel", "xperia", "gram"]
+    extra = ["pro", "air", "plus", "ultra", "mini", "max", "slim", "x1", "carbon", "flip"]
+    cpus = ["i5-8350u", "i7-1165g7", "m1", "m2", "ryzen", "i3-10110u", "snapdragon", "celeron"]
+    storage = ["128gb", "256gb", "512gb", "1tb"]
+    docs = []
+    for i in range(n):
+        b = rnd.randrange(len(brands))
+        name = f"{brands[b]} {lines[b]} {rnd.choice(extra)} {rnd.randint(2015, 2024)} model{rnd.randint(1, 5000)}"
+        docs.append((f"ZZ-{i:07d}", f"{name} {rnd.choice(cpus)} {rnd.choice(storage)}"))
+    return docs
+
+
+def bench(n: int, queries: int = 200, k: int = 10) -> Dict[str, Any]:
+    docs = _synthetic_docs(n)
+    t0 = time.perf_counter()
+    idx = MatchIndex()
+    idx.load(docs, 0)
+    build_s = time.perf_counter() - t0
+    import random
+    rnd = random.Random(11)
+    timings = []
+    for _ in range(queries):
+        _, text = docs[rnd.randrange(n)]
+        words = text.split()
+        q = " ".join(rnd.sample(words, min(4, len(words))))
+        t = time.perf_counter()
+        idx.search(q, k)
+        timings.append((time.perf_counter() - t) * 1000)
+    timings.sort()
+    return {
+        "docs": n, "build_s": round(build_s, 2), "common_cutoff": idx.common_cutoff(),
+        "p50_ms": round(timings[len(timings) // 2], 2),
+        "p95_ms": round(timings[int(len(timings) * 0.95) - 1], 2),
+        "max_ms": round(timings[-1], 2),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    import json
+    import argparse
+    ap = argparse.ArgumentParser(description="smart-match index checks")
+    ap.add_argument("--eval", help="labelled fixtures JSON (see evaluate())")
+    ap.add_argument("--bench", type=int, help="time top-k over N synthetic items")
+    ap.add_argument("--k", type=int, default=10)
+    args = ap.parse_args(argv)
+    if args.eval:
+        with open(args.eval) as fh:
+            print(json.dumps(evaluate(json.load(fh), args.k), indent=2))
+    if args.bench:
+        print(json.dumps(bench(args.bench, k=args.k), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,224 @@
+# photo_match.py
+"""
+Stock photo retrieval for smart-match and auto-linking.
+
+stock_photos carries two stored, generated columns:
+
+  * search_vector: 'simple' tsvector of product_name (weight A) and tags
+    (weight B), GIN-indexed; candidate retrieval for matching.
+  * search_text: lower-cased name + tags, trigram-indexed (when pg_trgm is
+    available) for the gallery's substring search.
+
+tags itself is GIN-indexed for the gallery's tag filter (tags @> ...).
+
+Matching ranks candidates in SQL with the same points the gallery has always
+used: 10 per product-name word shared with the item, +20 for the same grade
+(+10 for an A photo on a B item), +15 per tester-comment colour/condition
+keyword found in the photo's tags. Name words come from the same
+to_tsvector('simple', ...) parser on both sides; keywords are compared as
+bitmasks over ISSUE_TAGS.
+"""
+import logging
+from typing import Any, Dict, List, Optional
+
+from db_utils import db
+
+log = logging.getLogger(__name__)
+
+# Tester-comment keywords that may match stock photo tags (at most 31: bit masks).
+ISSUE_TAGS = ["silver", "gray", "grey", "black", "white", "gold", "rose", "scratch", "dent", "cracked"]
+
+# Auto-link only when this many name words match (or all of them, for shorter names).
+AUTO_LINK_MIN_NAME_HITS = 3
+
+_SEARCH_DDL = """
+CREATE OR REPLACE FUNCTION stock_photo_search_text(product_name text, tags text[]) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $fn$
+  SELECT lower(concat_ws(' ', product_name, array_to_string(tags, ' ')))
+$fn$;
+
+CREATE OR REPLACE FUNCTION stock_photo_search_vector(product_name text, tags text[]) RETURNS tsvector
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $fn$
+  SELECT setweight(to_tsvector('simple', COALESCE(product_name, '')), 'A')
+      || setweight(to_tsvector('simple', COALESCE(array_to_string(tags, ' '), '')), 'B')
+$fn$;
+
+ALTER TABLE stock_photos
+  ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (stock_photo_search_vector(product_name, tags)) STORED,
+  ADD COLUMN IF NOT EXISTS search_text text
+    GENERATED ALWAYS AS (stock_photo_search_text(product_name, tags)) STORED;
+
+CREATE INDEX IF NOT EXISTS stock_photos_search_vector_idx ON stock_photos USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS stock_photos_category_grade_idx ON stock_photos (category_id, grade);
+CREATE INDEX IF NOT EXISTS stock_photos_tags_idx ON stock_photos USING gin (tags);
+CREATE INDEX IF NOT EXISTS stock_photos_created_idx ON stock_photos (created_at DESC, id);
+"""
+
+_TRGM_INDEX = (
+    "CREATE INDEX IF NOT EXISTS stock_photos_search_trgm_idx "
+    "ON stock_photos USING gin (search_text gin_trgm_ops)"
+)
+
+# Probe words, from the same parser as search_vector. Candidates must contain
+# the first two words of the name (typically brand + line): an indexed lookup
+# that keeps the scored set small, where any-word retrieval would pull in most
+# of the catalogue.
+_VECTOR_SQL = "to_tsvector('simple', COALESCE({name}, ''))"
+_QUERY_SQL = (
+    "plainto_tsquery('simple', array_to_string("
+    "(regexp_split_to_array(btrim(COALESCE({name}, '')), '\\s+'))[1:2], ' '))"
+)
+# Bit n-1 set when ISSUE_TAGS[n] matches.
+_MASK_SQL = (
+    "(SELECT COALESCE(bit_or(1 << (k.n - 1)::int), 0) "
+    "FROM unnest(%(issue_tags)s::text[]) WITH ORDINALITY k(t, n) WHERE {test})"
+)
+_KEYWORDS_SQL = _MASK_SQL.format(test="strpos(lower(COALESCE({comment}, '')), k.t) > 0")
+_TAG_MASK_SQL = _MASK_SQL.format(test="k.t = ANY(sp.tags)")
+
+# Retrieved photos with the number of name words they share with the probe
+# ({vector}): |A and B| = |A| + |B| - |A or B| on lexeme sets, no per-row
+# subquery. Placeholders are SQL expressions so the same text serves bind
+# params and LATERAL joins. OFFSET 0 keeps the name vector computed once.
+_CANDIDATES_SQL = """
+    SELECT sp.id, sp.product_name, sp.grade, sp.tags, sp.urls, sp.cloudinary_ids, sp.category_id, sp.created_at,
+           length(n.v) + length({vector}) - length(n.v || {vector}) AS name_hits,
+           {tag_mask} AS tag_mask
+    FROM stock_photos sp
+    CROSS JOIN LATERAL (SELECT ts_filter(sp.search_vector, '{{a}}') AS v OFFSET 0) n
+    WHERE sp.search_vector @@ {query} {extra}
+"""
+_CONFIDENT_SQL = "AND length(n.v) + length({vector}) - length(n.v || {vector}) >= least(%(min_hits)s, length({vector}))"
+
+_SCORE_SQL = """
+    c.name_hits * 10
+      + CASE WHEN upper(c.grade) = upper({grade}) THEN 20
+             WHEN upper(c.grade) = 'A' AND upper({grade}) = 'B' THEN 10
+             ELSE 0 END
+      + 15 * bit_count((c.tag_mask & {keywords})::bit(32))::int
+"""
+
+# Same-category photos win ties.
+_ORDER_SQL = "score DESC, c.category_id IS NOT DISTINCT FROM {category} DESC, c.created_at DESC, c.id"
+
+
+def _smart_match_sql(extra: str) -> str:
+    return """
+    WITH probe AS (
+        SELECT {vector} AS vector, {query} AS query, {keywords} AS keywords
+    )
+    SELECT c.*, {score} AS score
+    FROM probe p
+    CROSS JOIN LATERAL ({candidates}) c
+    ORDER BY {order}
+    LIMIT %(limit)s
+""".format(
+        vector=_VECTOR_SQL.format(name="%(name)s::text"),
+        query=_QUERY_SQL.format(name="%(name)s::text"),
+        keywords=_KEYWORDS_SQL.format(comment="%(comment)s::text"),
+        candidates=_CANDIDATES_SQL.format(vector="p.vector", query="p.query", tag_mask=_TAG_MASK_SQL, extra=extra),
+        score=_SCORE_SQL.format(grade="%(grade)s::text", keywords="p.keywords"),
+        order=_ORDER_SQL.format(category="%(category_id)s::uuid"),
+    )
+
+
+SMART_MATCH_SQL = _smart_match_sql("")
+SMART_MATCH_CONFIDENT_SQL = _smart_match_sql(_CONFIDENT_SQL.format(vector="p.vector"))
+
+# Every item of a PO in one statement. Candidates and their name hits are
+# computed once per distinct product name. Candidates of a name that share
+# grade, tag mask and category rank the same way for every probe, so only the
+# top one of each such group is kept; each distinct (name, grade, category,
+# comment keywords) probe then picks its best in one hash join + DISTINCT ON.
+AUTO_LINK_PO_SQL = """
+    WITH items AS MATERIALIZED (
+        SELECT i.item_id, COALESCE(pl.product_name_raw, '') AS name, COALESCE(i.grade, '') AS grade,
+               COALESCE(i.category_id, pl.category_guess) AS category_id,
+               {keywords} AS keywords
+        FROM inventory_items i
+        LEFT JOIN po_lines pl ON pl.id = i.po_line_id
+        WHERE i.purchase_order_id = %(po_id)s
+          AND (%(overwrite)s OR i.stock_photo_id IS NULL)
+    ), names AS MATERIALIZED (
+        SELECT name, {vector} AS vector, {query} AS query FROM (SELECT DISTINCT name FROM items) d
+    ), cands AS MATERIALIZED (
+        SELECT DISTINCT ON (p.name, upper(c.grade), c.tag_mask, c.category_id) p.name AS probe_name, c.*
+        FROM names p
+        CROSS JOIN LATERAL ({candidates}) c
+        ORDER BY p.name, upper(c.grade), c.tag_mask, c.category_id, c.name_hits DESC, c.created_at DESC, c.id
+    ), probes AS MATERIALIZED (
+        SELECT DISTINCT name, grade, category_id, keywords FROM items
+    ), best AS MATERIALIZED (
+        SELECT DISTINCT ON (p.name, p.grade, p.category_id, p.keywords)
+               p.name AS probe_name, p.grade AS probe_grade, p.category_id AS probe_category,
+               p.keywords AS probe_keywords, c.id, c.product_name, c.urls, c.cloudinary_ids, {score} AS score
+        FROM probes p
+        JOIN cands c ON c.probe_name = p.name
+        ORDER BY p.name, p.grade, p.category_id, p.keywords, {order}
+    )
+    UPDATE inventory_items i
+       SET stock_photo_id = b.id
+      FROM items it
+      JOIN best b ON b.probe_name = it.name AND b.probe_grade = it.grade
+                 AND b.probe_category IS NOT DISTINCT FROM it.category_id AND b.probe_keywords = it.keywords
+     WHERE i.item_id = it.item_id
+    RETURNING i.synergy_code, b.id AS stock_photo_id, b.product_name, b.score
+""".format(
+    keywords=_KEYWORDS_SQL.format(comment="i.tester_comment"),
+    vector=_VECTOR_SQL.format(name="name"),
+    query=_QUERY_SQL.format(name="name"),
+    candidates=_CANDIDATES_SQL.format(vector="p.vector", query="p.query", tag_mask=_TAG_MASK_SQL,
+                                      extra=_CONFIDENT_SQL.format(vector="p.vector")),
+    score=_SCORE_SQL.format(grade="p.grade", keywords="p.keywords"),
+    order=_ORDER_SQL.format(category="p.category_id"),
+)
+
+
+def ensure_stock_photo_search():
+    """Add the generated search columns and their indexes to stock_photos."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('stock_photo_search'))")
+        cur.execute(_SEARCH_DDL)
+        cur.execute("SAVEPOINT trgm")
+        try:
+            cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cur.execute(_TRGM_INDEX)
+            cur.execute("RELEASE SAVEPOINT trgm")
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT trgm")
+            log.warning("pg_trgm unavailable, photo search falls back to scans: %s", e)
+        con.commit()
+
+
+def match_photos(
+    cur,
+    product_name: str,
+    grade: Optional[str] = None,
+    tester_comment: Optional[str] = None,
+    category_id: Optional[str] = None,
+    limit: int = 5,
+    confident_only: bool = False,
+) -> List[Dict[str, Any]]:
+    """Best stock photos for one item, highest score first."""
+    cur.execute(SMART_MATCH_CONFIDENT_SQL if confident_only else SMART_MATCH_SQL, {
+        "name": product_name or "",
+        "grade": grade or "",
+        "comment": tester_comment or "",
+        "category_id": category_id or None,
+        "issue_tags": ISSUE_TAGS,
+        "min_hits": AUTO_LINK_MIN_NAME_HITS,
+        "limit": limit,
+    })
+    return [dict(r) for r in cur.fetchall()]
+
+
+def auto_link_po(cur, po_id: str, overwrite: bool = False) -> List[Dict[str, Any]]:
+    """Point every item of a PO at its best confident stock photo. Returns the linked rows."""
+    cur.execute(AUTO_LINK_PO_SQL, {
+        "po_id": po_id,
+        "overwrite": overwrite,
+        "issue_tags": ISSUE_TAGS,
+        "min_hits": AUTO_LINK_MIN_NAME_HITS,
+    })
+    return [dict(r) for r in cur.fetchall()]
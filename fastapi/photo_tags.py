@@ -0,0 +1,144 @@
+# photo_tags.py
+"""
+Tag dictionary for the photo library: one stock_photo_tags row per distinct
+(lower-cased) tag with the number of stock photos using it, plus the photo
+count in stock_photo_totals (the unfiltered gallery total).
+
+Statement triggers on stock_photos apply the net change of every write (edits
+that leave tags alone net to nothing), so tag suggestions never scan the photo
+table. Prefix lookups use the text_pattern_ops index and return the most used
+tags first.
+
+    python photo_tags.py --rebuild
+"""
+import argparse
+from typing import List, Optional, Sequence
+
+from db_utils import db
+
+_TAGS_DDL = """
+CREATE TABLE IF NOT EXISTS stock_photo_tags (
+  tag  text PRIMARY KEY,
+  uses integer NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS stock_photo_tags_prefix_idx ON stock_photo_tags (tag text_pattern_ops);
+-- Empty between statements; lets the trigger drop unused tags without a scan.
+CREATE INDEX IF NOT EXISTS stock_photo_tags_unused_idx ON stock_photo_tags (tag) WHERE uses <= 0;
+
+CREATE TABLE IF NOT EXISTS stock_photo_totals (
+  id     boolean PRIMARY KEY DEFAULT true CHECK (id),
+  photos bigint NOT NULL DEFAULT 0
+);
+"""
+
+PHOTO_TOTAL_SQL = "SELECT photos AS n FROM stock_photo_totals"
+
+# Distinct tags per photo of `src`, with `d` = +1 / -1.
+_PHOTO_TAGS = "SELECT DISTINCT s.id, lower(t) AS tag, {d} AS d FROM {src} s CROSS JOIN LATERAL unnest(s.tags) t"
+
+_APPLY = """
+    INSERT INTO stock_photo_tags AS t (tag, uses)
+    SELECT tag, SUM(d) FROM ({src}) x
+     GROUP BY tag
+    HAVING SUM(d) <> 0
+     ORDER BY tag
+    ON CONFLICT (tag) DO UPDATE SET uses = t.uses + EXCLUDED.uses;
+    DELETE FROM stock_photo_tags WHERE uses <= 0;
+"""
+
+_REBUILD_SQL = """
+LOCK TABLE stock_photo_tags, stock_photo_totals IN EXCLUSIVE MODE;
+TRUNCATE stock_photo_tags;
+INSERT INTO stock_photo_tags (tag, uses)
+SELECT tag, COUNT(*) FROM ({src}) x GROUP BY tag;
+INSERT INTO stock_photo_totals (photos) SELECT COUNT(*) FROM stock_photos
+ON CONFLICT (id) DO UPDATE SET photos = EXCLUDED.photos;
+"""
+
+_TRIGGERS = [
+    ("stock_photo_tags_ins", "INSERT", "NEW TABLE AS new_rows"),
+    ("stock_photo_tags_upd", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    ("stock_photo_tags_del", "DELETE", "OLD TABLE AS old_rows"),
+]
+
+
+def _trigger_fn() -> str:
+    new = _PHOTO_TAGS.format(d="1", src="new_rows")
+    old = _PHOTO_TAGS.format(d="-1", src="old_rows")
+    return f"""
+CREATE OR REPLACE FUNCTION stock_photo_tags_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    {_APPLY.format(src=new)}
+    UPDATE stock_photo_totals SET photos = photos + (SELECT COUNT(*) FROM new_rows);
+  ELSIF TG_OP = 'UPDATE' THEN
+    {_APPLY.format(src=new + " UNION ALL " + old)}
+  ELSE
+    {_APPLY.format(src=old)}
+    UPDATE stock_photo_totals SET photos = photos - (SELECT COUNT(*) FROM old_rows);
+  END IF;
+  RETURN NULL;
+END
+$fn$;
+"""
+
+
+def _rebuild(cur):
+    cur.execute(_REBUILD_SQL.format(src=_PHOTO_TAGS.format(d="1", src="stock_photos")))
+
+
+def ensure_photo_tags():
+    """Create the tag dictionary and its triggers; fill it when the table is new."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('stock_photo_tags'))")
+        cur.execute("SELECT to_regclass('stock_photo_totals') IS NULL AS missing")
+        missing = cur.fetchone()["missing"]
+        cur.execute(_TAGS_DDL)
+        cur.execute(_trigger_fn())
+        for name, event, referencing in _TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON stock_photos")
+            cur.execute(
+                f"CREATE TRIGGER {name} AFTER {event} ON stock_photos "
+                f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION stock_photo_tags_trg()"
+            )
+        if missing:
+            _rebuild(cur)
+        con.commit()
+
+
+def suggest_tags(cur, prefix: str = "", limit: Optional[int] = None) -> List[str]:
+    """Tags starting with `prefix`, most used first; every tag A-Z without a prefix."""
+    prefix = prefix.strip().lower()
+    # One array instead of a row per tag: the full list runs to thousands.
+    if not prefix:
+        cur.execute(
+            "SELECT ARRAY(SELECT tag FROM stock_photo_tags ORDER BY tag LIMIT %s) AS tags",
+            (limit,),
+        )
+    else:
+        pattern = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        cur.execute(
+            "SELECT ARRAY(SELECT tag FROM stock_photo_tags WHERE tag LIKE %s ORDER BY uses DESC, tag LIMIT %s) AS tags",
+            (pattern, limit),
+        )
+    return cur.fetchone()["tags"]
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="maintain stock_photo_tags")
+    ap.add_argument("--rebuild", action="store_true", help="recount every tag from stock_photos")
+    args = ap.parse_args(argv)
+    if not args.rebuild:
+        ap.print_help()
+        return 2
+    ensure_photo_tags()
+    with db() as (con, cur):
+        _rebuild(cur)
+        cur.execute("SELECT COUNT(*) AS n FROM stock_photo_tags")
+        print(f"{cur.fetchone()['n']} tags")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,414 @@
+#!/usr/bin/env python3
+"""
+Query-plan regression harness for the hot SQL paths.
+
+Runs EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) for every registered query against
+the database in DATABASE_URL and fails when a plan regresses:
+
+  * a Seq Scan shows up on a large table the query is not allowed to scan, or
+  * execution time goes over the query's budget.
+
+Usage (from the fastapi/ directory):
+
+    python plan_check.py                      # check against existing data
+    python plan_check.py --seed 50000         # add synthetic rows first (rolled back)
+    python plan_check.py --seed 50000 --keep  # ...and keep them
+    python plan_check.py --only rows. --out plan_report.json
+
+Exit code is 1 when any check fails, so this can gate a deploy.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union
+
+from psycopg2.extras import RealDictCursor
+
+from db_utils import db_conn
+from inventory_read import rows_columns_sql
+from inventory_counts import COUNTS_SQL, counts_filter
+from routes_inventory import ROWS_BRIEF_SQL, build_rows_filter, build_similar_query
+from routes_po import (
+    PO_SUMMARIES_SQL,
+    WEEKLY_PULSE_TOTALS_SQL,
+    WEEKLY_PULSE_CHART_SQL,
+    WEEKLY_PULSE_TOP_ITEMS_SQL,
+    DAILY_SALES_TOTALS_SQL,
+    DAILY_SALES_TOP_POS_SQL,
+    DAILY_SALES_RECENT_SQL,
+)
+from routes_search import SEARCH_VENDORS_SQL, SEARCH_POS_SQL, SEARCH_LINES_SQL
+from routes_synergy import SYNERGY_OVERVIEW_STATS_SQL
+from routes_messages import THREADS_ALL_SQL, THREAD_MESSAGES_PAGE_SQL, MESSAGES_PAGE_SIZE, MESSAGES_UNREAD_CAP
+from photo_match import SMART_MATCH_SQL, ISSUE_TAGS
+
+DEFAULT_BUDGET_MS = float(os.getenv("PLAN_CHECK_BUDGET_MS", "250"))
+# Seq Scans are only flagged on tables at least this big (pg_class.reltuples).
+SEQ_SCAN_MIN_ROWS = int(os.getenv("PLAN_CHECK_SEQ_SCAN_MIN_ROWS", "10000"))
+# Estimated vs actual rows off by more than this factor is reported (not failed).
+MISESTIMATE_FACTOR = float(os.getenv("PLAN_CHECK_MISESTIMATE_FACTOR", "10"))
+
+SEED_PREFIX = "ZZPLAN"
+
+Params = Union[Sequence[Any], Dict[str, Any], None]
+
+# ============================================================
+# REGISTRY
+# ============================================================
+QUERIES: Dict[str, Dict[str, Any]] = {}
+
+def register_query(
+    name: str,
+    sql: str,
+    params: Union[Params, Callable[[Any], Params]] = None,
+    budget_ms: Optional[float] = None,
+    allow_seq_scan: Sequence[str] = (),
+):
+    """
+    Register a query for plan checking.
+    `params` may be a callable taking a cursor, for queries that need a real id.
+    `allow_seq_scan` lists tables a Seq Scan is expected on (e.g. tiny lookups).
+    """
+    QUERIES[name] = {
+        "sql": sql,
+        "params": params,
+        "budget_ms": budget_ms if budget_ms is not None else DEFAULT_BUDGET_MS,
+        "allow_seq_scan": set(allow_seq_scan),
+    }
+
+def _pick(cur, sql: str, default: Any = None) -> Any:
+    cur.execute(sql)
+    row = cur.fetchone()
+    return next(iter(row.values())) if row else default
+
+def _pick_many(cur, sql: str) -> List[Any]:
+    cur.execute(sql)
+    return [next(iter(r.values())) for r in cur.fetchall()]
+
+def _rows_page(with_total: bool = False, fields: Optional[List[str]] = None, **filters):
+    """Build the /rows page query exactly as rows_list does."""
+    where_sql, params = build_rows_filter(**filters)
+    params.update({"limit": 200, "offset": 0})
+    total_col = ', COUNT(*) OVER() AS "__total"' if with_total else ""
+    sql = (f"SELECT {rows_columns_sql(fields)}{total_col} FROM inventory_read r WHERE {where_sql} "
+           "ORDER BY r.synergy_code LIMIT %(limit)s OFFSET %(offset)s")
+    return sql, params
+
+def _rows_count(**filters):
+    where_sql, params = build_rows_filter(**filters)
+    return f"SELECT COUNT(*) AS total FROM inventory_read r WHERE {where_sql}", params
+
+# Compare rows.X + rows.X_count (two round trips) against rows.X_total (one).
+register_query("rows.list_default", *_rows_page())
+register_query("rows.list_default_count", *_rows_count())
+register_query("rows.list_default_total", *_rows_page(with_total=True))
+# Sparse fieldset as the tester list requests it; compare buffers with rows.list_default.
+register_query("rows.list_narrow", *_rows_page(fields=["productName", "status"]))
+register_query("rows.search", *_rows_page(q="laptop"))
+register_query("rows.search_count", *_rows_count(q="laptop"))
+register_query("rows.search_total", *_rows_page(with_total=True, q="laptop"))
+# The other q= paths and the category-label ILIKE filter, alone and combined.
+register_query("rows.search_code", *_rows_page(q="ZZ-999999"))
+register_query("rows.search_category", *_rows_page(with_total=True, category="laptop"))
+register_query("rows.search_category_q", *_rows_page(with_total=True, category="laptop", q="16gb"))
+register_query("rows.ready", *_rows_page(status="ready"))
+register_query("rows.ready_total", *_rows_page(with_total=True, status="ready"))
+
+_by_po_sql, _by_po_params = _rows_page(with_total=True, po_id="00000000-0000-0000-0000-000000000000")
+register_query(
+    "rows.list_by_po_total",
+    _by_po_sql,
+    lambda cur: {
+        **_by_po_params,
+        "po_id": _pick(cur, "SELECT purchase_order_id::text FROM inventory_items ORDER BY synergy_code DESC LIMIT 1",
+                       _by_po_params["po_id"]),
+    },
+)
+register_query(
+    "rows.brief",
+    ROWS_BRIEF_SQL,
+    lambda cur: (_pick_many(cur, "SELECT synergy_code FROM inventory_items ORDER BY synergy_code DESC LIMIT 50"),),
+)
+register_query(
+    "rows.changes_since",
+    "SELECT version, synergy_code, op, changed FROM inventory_row_changes "
+    "WHERE version > %(since)s AND op IN ('upsert', 'delete') ORDER BY version LIMIT 1001",
+    lambda cur: {"since": _pick(cur, "SELECT COALESCE(MAX(version), 0) - 500 AS v FROM inventory_row_changes", 0)},
+)
+# Similar-item search on the typed spec columns, against the old text match
+# over CAST(specs AS text) it replaced (kept here only as the baseline).
+_SIMILAR_NAME = "Dell Latitude 7490 i5-8350U 16GB 256GB SSD"
+_SIMILAR_PROBE = {"cpu_family": "i5", "cpu_model": "i5-8350u", "ram_gb": 16, "storage_gb": 256,
+                  "storage_type": "ssd", "screen_in": None}
+register_query("rows.search_similar", *build_similar_query(_SIMILAR_PROBE, _SIMILAR_NAME))
+_SIMILAR_TOKENS = _SIMILAR_NAME.split()
+register_query(
+    "rows.search_similar_specs_text",
+    "SELECT r.synergy_code, ("
+    + " + ".join(f"CASE WHEN r.product_name ILIKE %(t{n})s THEN 2 ELSE 0 END"
+                 f" + CASE WHEN CAST(r.specs AS text) ILIKE %(t{n})s THEN 1 ELSE 0 END" for n in range(len(_SIMILAR_TOKENS)))
+    + ") AS score FROM inventory_read r WHERE "
+    + " OR ".join(f"r.product_name ILIKE %(t{n})s OR CAST(r.specs AS text) ILIKE %(t{n})s" for n in range(len(_SIMILAR_TOKENS)))
+    + " ORDER BY score DESC, r.synergy_code LIMIT 5",
+    {f"t{n}": f"%{t}%" for n, t in enumerate(_SIMILAR_TOKENS)},
+    budget_ms=2000,
+    allow_seq_scan=("inventory_read",),
+)
+register_query("rows.counts", COUNTS_SQL.format(where=counts_filter()[0]))
+# Top-N over every PO by created_at; lines and items go through their PO indexes.
+register_query("po.summaries", PO_SUMMARIES_SQL, budget_ms=500, allow_seq_scan=("purchase_orders",))
+register_query("analytics.weekly_totals", WEEKLY_PULSE_TOTALS_SQL)
+register_query("analytics.weekly_chart", WEEKLY_PULSE_CHART_SQL)
+register_query("analytics.weekly_top_items", WEEKLY_PULSE_TOP_ITEMS_SQL)
+register_query("analytics.daily_totals", DAILY_SALES_TOTALS_SQL)
+register_query("analytics.daily_top_pos", DAILY_SALES_TOP_POS_SQL)
+register_query("analytics.daily_recent", DAILY_SALES_RECENT_SQL)
+register_query("search.vendors", SEARCH_VENDORS_SQL, ("%zz%",), allow_seq_scan=("vendors",))
+register_query("search.pos", SEARCH_POS_SQL, ("%zz%",), budget_ms=500,
+               allow_seq_scan=("purchase_orders", "po_lines"))
+register_query("search.lines", SEARCH_LINES_SQL, ("%zz%",) * 4, budget_ms=500,
+               allow_seq_scan=("po_lines",))
+register_query("synergy.overview_stats", SYNERGY_OVERVIEW_STATS_SQL, allow_seq_scan=("synergy_id_events",))
+register_query(
+    "messages.threads_all",
+    THREADS_ALL_SQL,
+    lambda cur: {
+        "me": _pick(cur, "SELECT user_id FROM message_thread_participants GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1", 0),
+        "unread_cap": MESSAGES_UNREAD_CAP,
+    },
+)
+register_query(
+    "messages.thread_page",
+    THREAD_MESSAGES_PAGE_SQL.format(cursor=""),
+    lambda cur: {
+        "thread": _pick(cur, "SELECT thread_id FROM messages GROUP BY 1 ORDER BY COUNT(*) DESC LIMIT 1"),
+        "limit": MESSAGES_PAGE_SIZE,
+    },
+)
+register_query(
+    "photos.smart_match",
+    SMART_MATCH_SQL,
+    {"name": "Synthetic Laptop 12 i5-8300U 8GB RAM 512GB SSD", "grade": "B", "comment": "silver, light scratch",
+     "category_id": None, "issue_tags": ISSUE_TAGS, "limit": 5},
+)
+
+# ============================================================
+# SYNTHETIC DATA
+# ============================================================
+def seed(cur, items: int, lines_per_po: int = 50):
+    """
+    Insert `items` synthetic lines + inventory items spread over POs of
+    `lines_per_po` lines each. Everything is tagged with SEED_PREFIX so it is
+    easy to spot (and delete) if --keep was used.
+    """
+    pos = max(1, items // lines_per_po)
+    cur.execute(
+        "INSERT INTO vendors (name) VALUES (%s) ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id",
+        (f"{SEED_PREFIX} Vendor",),
+    )
+    vendor_id = cur.fetchone()["id"]
+    cur.execute(
+        """
+        INSERT INTO purchase_orders (po_number, vendor_id, created_at)
+        SELECT %(prefix)s || '-PO-' || g, %(vendor)s, NOW() - (g || ' hours')::interval
+        FROM generate_series(1, %(pos)s) g
+        """,
+        {"prefix": SEED_PREFIX, "vendor": vendor_id, "pos": pos},
+    )
+    cur.execute(
+        """
+        INSERT INTO po_lines (purchase_order_id, product_name_raw, upc, qty, unit_cost, msrp, raw_json)
+        SELECT p.id,
+               'Synthetic Laptop ' || (g %% 97) || ' i' || (3 + 2 * (g %% 4)) || '-' || (8250 + g %% 7 * 50) || 'U '
+                 || (4 << (g %% 3)) || 'GB RAM ' || (128 << (g %% 4)) || 'GB SSD',
+               lpad(g::text, 12, '0'), 1, 100 + (g %% 400), 300 + (g %% 900), '{}'::jsonb
+        FROM purchase_orders p
+        CROSS JOIN generate_series(1, %(per_po)s) g
+        WHERE p.po_number LIKE %(prefix)s || '-PO-%%'
+        """,
+        {"prefix": SEED_PREFIX, "per_po": lines_per_po},
+    )
+    cur.execute(
+        """
+        INSERT INTO inventory_items (synergy_code, purchase_order_id, po_line_id, cost_unit, msrp, status, grade, sold_at, sold_price)
+        SELECT %(prefix)s || '-' || row_number() OVER (ORDER BY pl.id),
+               pl.purchase_order_id, pl.id, pl.unit_cost, pl.msrp,
+               (ARRAY['INTAKE','TESTING','READY','TESTED','IN_STORE','POSTED','SOLD'])[1 + (abs(hashtext(pl.id::text)) %% 7)],
+               (ARRAY['A','B','C','D','P'])[1 + (abs(hashtext(pl.id::text)) %% 5)],
+               -- ~3 years of sales history
+               NOW() - make_interval(days => abs(hashtext(pl.id::text)) %% 1095, mins => abs(hashtext(pl.id::text || 'm')) %% 1440),
+               pl.msrp * 0.6
+        FROM po_lines pl
+        JOIN purchase_orders p ON p.id = pl.purchase_order_id
+        WHERE p.po_number LIKE %(prefix)s || '-PO-%%'
+        """,
+        {"prefix": SEED_PREFIX},
+    )
+    # Group threads with long histories between the first few users.
+    cur.execute(
+        """
+        WITH users AS (SELECT id FROM app_users ORDER BY id LIMIT 5),
+        threads AS (
+            INSERT INTO message_threads (subject, is_group, created_by_id)
+            SELECT %(prefix)s || ' thread ' || g, true, (SELECT MIN(id) FROM users)
+            FROM generate_series(1, %(threads)s) g
+            WHERE (SELECT COUNT(*) FROM users) >= 2
+            RETURNING id
+        ), members AS (
+            INSERT INTO message_thread_participants (thread_id, user_id)
+            SELECT t.id, u.id FROM threads t CROSS JOIN users u
+        )
+        INSERT INTO messages (thread_id, sender_id, body, created_at)
+        SELECT t.id, (ARRAY(SELECT id FROM users ORDER BY id))[1 + g %% (SELECT COUNT(*) FROM users)],
+               %(prefix)s || ' message ' || g, NOW() - (g || ' minutes')::interval
+        FROM threads t CROSS JOIN generate_series(1, %(per_thread)s) g
+        """,
+        {"prefix": SEED_PREFIX, "threads": 20, "per_thread": max(1, items // 40)},
+    )
+    # Stock photos named like the seeded lines, so smart-match has a dense brand to rank.
+    cur.execute(
+        """
+        INSERT INTO stock_photos (product_name, grade, tags, urls, cloudinary_ids)
+        SELECT 'Synthetic Laptop ' || (g %% 97) || ' i' || (3 + 2 * (g %% 4)) || ' ' || (4 << (g %% 3)) || 'GB RAM',
+               (ARRAY['A','B','C'])[1 + g %% 3],
+               ARRAY[(ARRAY['silver','gray','black','scratch'])[1 + g %% 4], %(prefix)s],
+               ARRAY['https://example.invalid/' || g || '.jpg'], ARRAY[%(prefix)s || '/' || g]
+        FROM generate_series(1, %(photos)s) g
+        """,
+        {"prefix": SEED_PREFIX.lower(), "photos": max(1, items // 10)},
+    )
+    for table in ("vendors", "purchase_orders", "po_lines", "inventory_items", "inventory_read", "daily_sales_facts",
+                  "message_threads", "message_thread_participants", "messages", "stock_photos"):
+        cur.execute(f"ANALYZE {table}")
+
+# ============================================================
+# PLAN INSPECTION
+# ============================================================
+def _walk(node: Dict[str, Any], out: List[Dict[str, Any]], depth: int = 0):
+    loops = node.get("Actual Loops") or 1
+    out.append({
+        "depth": depth,
+        "node": node.get("Node Type"),
+        "relation": node.get("Relation Name"),
+        "index": node.get("Index Name"),
+        "plan_rows": node.get("Plan Rows"),
+        "actual_rows": (node.get("Actual Rows") or 0) * loops,
+        "loops": loops,
+        "total_ms": round((node.get("Actual Total Time") or 0) * loops, 3),
+        "shared_hit": node.get("Shared Hit Blocks"),
+        "shared_read": node.get("Shared Read Blocks"),
+        "filter": node.get("Filter"),
+    })
+    for child in node.get("Plans") or []:
+        _walk(child, out, depth + 1)
+
+def _table_sizes(cur) -> Dict[str, float]:
+    cur.execute(
+        """
+        SELECT c.relname, c.reltuples
+        FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind IN ('r', 'm', 'p') AND n.nspname = 'public'
+        """
+    )
+    return {r["relname"]: float(r["reltuples"] or 0) for r in cur.fetchall()}
+
+def check_query(cur, name: str, spec: Dict[str, Any], sizes: Dict[str, float]) -> Dict[str, Any]:
+    params = spec["params"](cur) if callable(spec["params"]) else spec["params"]
+    started = time.perf_counter()
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + spec["sql"], params)
+    wall_ms = (time.perf_counter() - started) * 1000
+    raw = cur.fetchone()
+    doc = next(iter(raw.values()))
+    if isinstance(doc, str):
+        doc = json.loads(doc)
+    top = doc[0]
+
+    nodes: List[Dict[str, Any]] = []
+    _walk(top["Plan"], nodes)
+
+    failures: List[str] = []
+    warnings: List[str] = []
+    exec_ms = float(top.get("Execution Time") or 0)
+    if exec_ms > spec["budget_ms"]:
+        failures.append(f"execution {exec_ms:.1f}ms > budget {spec['budget_ms']:.0f}ms")
+
+    for n in nodes:
+        rel = n["relation"]
+        if n["node"] == "Seq Scan" and rel and rel not in spec["allow_seq_scan"]:
+            if sizes.get(rel, 0) >= SEQ_SCAN_MIN_ROWS:
+                failures.append(f"Seq Scan on {rel} (~{int(sizes[rel])} rows)")
+        planned, actual = n["plan_rows"] or 0, n["actual_rows"] or 0
+        if planned and actual and max(planned, actual) / max(1, min(planned, actual)) > MISESTIMATE_FACTOR:
+            warnings.append(f"{n['node']}{' on ' + rel if rel else ''}: planned {planned} rows, got {actual}")
+
+    return {
+        "name": name,
+        "ok": not failures,
+        "budget_ms": spec["budget_ms"],
+        "planning_ms": top.get("Planning Time"),
+        "execution_ms": exec_ms,
+        "wall_ms": round(wall_ms, 3),
+        "buffers": (top["Plan"].get("Shared Hit Blocks") or 0) + (top["Plan"].get("Shared Read Blocks") or 0),
+        "failures": failures,
+        "warnings": warnings,
+        "nodes": nodes,
+    }
+
+def run(only: Optional[str] = None, seed_items: int = 0, keep: bool = False) -> List[Dict[str, Any]]:
+    con = db_conn()
+    results: List[Dict[str, Any]] = []
+    try:
+        cur = con.cursor(cursor_factory=RealDictCursor)
+        if seed_items:
+            seed(cur, seed_items)
+        sizes = _table_sizes(cur)
+        for name, spec in QUERIES.items():
+            if only and not name.startswith(only):
+                continue
+            cur.execute("SAVEPOINT plan_check")
+            try:
+                results.append(check_query(cur, name, spec, sizes))
+                cur.execute("RELEASE SAVEPOINT plan_check")
+            except Exception as e:
+                cur.execute("ROLLBACK TO SAVEPOINT plan_check")
+                results.append({"name": name, "ok": False, "failures": [f"error: {e}"], "warnings": [], "nodes": []})
+        if seed_items and keep:
+            con.commit()
+        else:
+            con.rollback()
+    finally:
+        con.close()
+    return results
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="EXPLAIN ANALYZE regression check for hot queries")
+    ap.add_argument("--only", help="only run queries whose name starts with this prefix")
+    ap.add_argument("--seed", type=int, default=0, help="insert N synthetic inventory rows before checking")
+    ap.add_argument("--keep", action="store_true", help="commit the synthetic rows instead of rolling back")
+    ap.add_argument("--out", help="write the full JSON report (with plan nodes) here")
+    args = ap.parse_args(argv)
+
+    results = run(only=args.only, seed_items=args.seed, keep=args.keep)
+
+    for r in results:
+        mark = "PASS" if r["ok"] else "FAIL"
+        timing = f"{r.get('execution_ms', 0):8.1f}ms" if "execution_ms" in r else " " * 10
+        buffers = f"{r['buffers']:7d} buf" if r.get("buffers") is not None else " " * 11
+        print(f"[{mark}] {timing} {buffers}  {r['name']}")
+        for f in r["failures"]:
+            print(f"         ! {f}")
+        for w in r["warnings"]:
+            print(f"         ~ {w}")
+
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2, default=str)
+
+    failed = [r["name"] for r in results if not r["ok"]]
+    print(f"\n{len(results) - len(failed)}/{len(results)} passed")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,11 @@
 import json
-import requests
 from decimal import Decimal
 from datetime import datetime, date
 from fastapi import APIRouter, Body, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Dict, Any
-from db_utils import db
+from assistant_context import get_assistant_context
+from llm_client import complete
 
 router = APIRouter()
 
@@ -47,57 +47,21 @@ def compress_list_to_csv(data_list: List[Dict], fields: List[str]) -> str:
     return "\n".join(lines)
 
 def ask_pollinations(system_prompt: str, user_prompt: str, json_mode: bool = False):
-    url = "https://text.pollinations.ai/"
     if len(user_prompt) > 12000: user_prompt = user_prompt[:12000] + "...[TRUNCATED]"
-    payload = {
-        "messages": [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}],
-        "model": "openai", "jsonMode": json_mode
-    }
+    messages = [{"role": "system", "content": system_prompt}, {"role": "user", "content": user_prompt}]
     try:
-        r = requests.post(url, json=payload, timeout=60)
-        if r.status_code != 200: return None
+        text = complete(messages, model="openai", json_mode=json_mode)
         if json_mode:
-            raw = r.text.replace("```json", "").replace("```", "").strip()
+            raw = text.replace("```json", "").replace("```", "").strip()
             s, e = raw.find('['), raw.rfind(']') + 1
             if s != -1 and e != -1: return json.loads(raw[s:e])
-        return r.text
+        return text
     except Exception as e:
         return None
 
 def gather_omniscient_context():
-    context = {}
-    with db() as (con, cur):
-        # 1. BROKEN LINKS (Posted but no URL)
-        cur.execute("""
-            SELECT LEFT(pl.product_name_raw, 40) as n, i.synergy_code as s, i.cost_unit as c, COALESCE(u.name, 'Unknown') as poster
-            FROM inventory_items i
-            JOIN po_lines pl ON i.po_line_id = pl.id
-            LEFT JOIN app_users u ON i.posted_by = CAST(u.id AS TEXT)
-            WHERE i.status = 'POSTED' 
-              AND (i.ebay_item_url IS NULL OR i.ebay_item_url = '')
-            ORDER BY i.cost_unit DESC NULLS LAST
-            LIMIT 100
-        """)
-        context['broken_links_sample'] = [dict(r) for r in cur.fetchall()]
-
-        cur.execute("SELECT COUNT(*) as count FROM inventory_items WHERE status = 'POSTED' AND (ebay_item_url IS NULL OR ebay_item_url = '')")
-        context['broken_links_count'] = cur.fetchone()['count']
-
-        cur.execute("""
-            SELECT LEFT(pl.product_name_raw, 30) as p, COUNT(*) as n, SUM(i.sold_price) as rev
-            FROM inventory_items i JOIN po_lines pl ON i.po_line_id = pl.id
-            WHERE i.status = 'SOLD' AND i.sold_at > NOW() - INTERVAL '30 days'
-            GROUP BY pl.product_name_raw ORDER BY rev DESC LIMIT 5
-        """)
-        context['sales'] = [dict(r) for r in cur.fetchall()]
-
-        cur.execute("""
-            SELECT u.name, COUNT(*) as posts
-            FROM app_users u JOIN inventory_items i ON i.posted_by = CAST(u.id AS TEXT)
-            WHERE u.active = true GROUP BY u.name ORDER BY posts DESC LIMIT 5
-        """)
-        context['team'] = [dict(r) for r in cur.fetchall()]
-    return context
+    # Precomputed in the background (assistant_context.py); no queries per request.
+    return get_assistant_context()
 
 @router.get("/assistant/insights", response_model=List[SyniInsight])
 def get_ai_insights():
@@ -16,7 +16,8 @@ import xml.etree.ElementTree as ET
 from db_utils import db
 from ebay_utils import get_ebay_token
 from config import EBAY_MARKETPLACE_ID, CURRENT_GENAI_MODEL, HAVE_GENAI, GEMINI_API_KEY, AI_FIRST
-from pubsub_utils import _broadcast
+from inventory_read import pending_row_changes, publish_row_changes
+from auth_cache import get_user_auth, invalidate_user, is_manager as user_is_manager
 
 router = APIRouter()
 
@@ -102,17 +103,13 @@ def require_manager_auth(user_id: int = Depends(get_current_user_id)):
     if not user_id:
         raise HTTPException(status_code=401, detail="Not Authenticated")
 
-    with db() as (con, cur):
-        cur.execute("SELECT roles FROM app_users WHERE id = %s AND active = TRUE", (user_id,))
-        user = cur.fetchone()
-        
-        if not user:
-            raise HTTPException(status_code=403, detail="Forbidden: User not found or inactive")
+    user = get_user_auth(user_id)
 
-        user_roles = [r.lower() for r in (user['roles'] if user['roles'] else [])]
-        
-        if 'manager' not in user_roles and 'admin' not in user_roles:
-            raise HTTPException(status_code=403, detail="Forbidden: Not authorized (Manager access required)")
+    if not user or not user["active"]:
+        raise HTTPException(status_code=403, detail="Forbidden: User not found or inactive")
+
+    if 'manager' not in user["roles"] and 'admin' not in user["roles"]:
+        raise HTTPException(status_code=403, detail="Forbidden: Not authorized (Manager access required)")
             
     return user_id
 
@@ -177,6 +174,7 @@ def admin_update_user_details(
         sql = f"UPDATE app_users SET {', '.join(updates)} WHERE id = %s"
         cur.execute(sql, params)
         con.commit()
+    invalidate_user(user_id)
 
     return {"success": True, "message": "User details updated successfully."}
 
@@ -213,6 +211,7 @@ def admin_delete_user(user_id: int, payload: AdminDeletePayload):
              raise HTTPException(status_code=404, detail="Target user not found.")
 
         con.commit()
+    invalidate_user(user_id)
 
     return {"success": True, "message": f"User {deactivated['name']} has been deactivated."}
 
@@ -244,12 +243,7 @@ def list_users(
     
     with db() as (con, cur):
         if requester_id:
-            cur.execute("SELECT roles FROM app_users WHERE id = %s", (requester_id,))
-            requesting_user = cur.fetchone()
-            if requesting_user:
-                r_roles = [r.lower() for r in (requesting_user.get('roles') or [])]
-                if 'manager' in r_roles or 'admin' in r_roles:
-                    is_manager = True
+            is_manager = user_is_manager(requester_id, cur)
 
         # VISIBILITY LOGIC:
         # 1. If Manager: See Everyone.
@@ -350,6 +344,7 @@ def create_user(body: NewUser):
         row = cur.fetchone()
         con.commit()
 
+    invalidate_user(row["id"])
     return dict(row)
 
 @router.post("/auth/login")
@@ -669,50 +664,14 @@ def link_ebay_items(payload: EbayLinkPayload):
         updated_rows = cur.fetchall()
         updated_codes = [r['synergy_code'] for r in updated_rows]
         
-        if updated_codes:
-            cur.execute(
-                """
-                SELECT 
-                    i.synergy_code AS "synergyId", 
-                    COALESCE(pl.product_name_raw, '') AS "productName",
-                    i.category_id AS "categoryId", 
-                    i.status AS "status",
-                    COALESCE(i.cost_unit, 0) AS "purchaseCost", 
-                    COALESCE(pl.qty, 1) AS "qty",
-                    COALESCE(i.msrp, pl.msrp, 0) AS "msrp",
-                    i.purchase_order_id AS "poId", 
-                    i.po_line_id AS "lineId",
-                    i.grade AS "grade", 
-                    i.tested_by AS "testedBy", 
-                    i.tested_date AS "testedDate",
-                    i.tester_comment AS "testerComment", 
-                    i.posted_at AS "postedAt",
-                    i.posted_by::text AS "postedBy", 
-                    i.ebay_item_url AS "ebayItemUrl",
-                    COALESCE(i.specs, '{}'::jsonb) AS "specs",
-                    COALESCE(i.price, 0) AS "price", 
-                    COALESCE(i.ebay_price, 0) AS "ebayPrice",
-                    c.label AS "categoryLabel", 
-                    c.prefix AS "categoryPrefix",
-                    i.ebay_sku AS "ebaySku"
-                FROM inventory_items i
-                LEFT JOIN po_lines pl ON pl.id = i.po_line_id
-                LEFT JOIN categories c ON c.id = i.category_id
-                WHERE i.synergy_code = ANY(%s)
-                """,
-                (updated_codes,)
-            )
-            rows = cur.fetchall()
-            
-            cur.execute("SELECT sku_next_number FROM app_users WHERE id = %s", (payload.posted_by_user_id,))
-            user_res = cur.fetchone()
-            next_sku = user_res['sku_next_number'] if user_res else None
+        if not updated_codes:
+            return {"success": True, "updated": 0}
 
-            con.commit()
-            
-            for r in rows:
-                _broadcast("row.upserted", dict(r))
-                
-            return {"success": True, "updated": len(updated_codes), "nextSku": next_sku}
+        cur.execute("SELECT sku_next_number FROM app_users WHERE id = %s", (payload.posted_by_user_id,))
+        user_res = cur.fetchone()
+        next_sku = user_res['sku_next_number'] if user_res else None
+        txid = pending_row_changes(cur)
+        con.commit()
 
-    return {"success": True, "updated": len(updated_codes)}
\ No newline at end of file
+    publish_row_changes(txid)
+    return {"success": True, "updated": len(updated_codes), "nextSku": next_sku}
\ No newline at end of file
@@ -8,6 +8,9 @@ from pydantic import BaseModel, HttpUrl
 import psycopg2
 
 from db_utils import db
+from fast_json import FastJSONResponse
+from auth_cache import is_manager as user_is_manager
+from etags import resource_version, make_etag, etag_matches, not_modified, cache_headers
 
 router = APIRouter()
 
@@ -20,10 +23,13 @@ class CategoryBody(BaseModel):
     color: Optional[str] = "slate"  
 
 @router.get("/categories")
-def categories_list():
+def categories_list(if_none_match: Optional[str] = Header(None)):
     with db() as (con, cur):
+        etag = make_etag("categories", resource_version(cur, "categories"))
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         cur.execute("SELECT id, label, prefix, notes, icon_key as icon, color_key as color FROM categories ORDER BY label;")
-        return [dict(r) for r in cur.fetchall()]
+        return FastJSONResponse([dict(r) for r in cur.fetchall()], headers=cache_headers(etag))
 
 @router.post("/categories")
 def categories_create(body: CategoryBody):
@@ -77,12 +83,7 @@ def categories_delete(cat_id: str):
 @router.get("/categories/summary")
 def get_category_summary(x_user_id: Optional[str] = Header(None, alias="X-User-ID")):
     with db() as (con, cur):
-        is_manager = False
-        if x_user_id:
-            cur.execute("SELECT roles FROM app_users WHERE id = %s", (x_user_id,))
-            u = cur.fetchone()
-            if u and ('manager' in u['roles'] or 'admin' in u['roles']):
-                is_manager = True
+        is_manager = bool(x_user_id) and user_is_manager(x_user_id, cur)
 
         cur.execute("""
             SELECT
@@ -115,8 +116,11 @@ class VendorUpdate(BaseModel):
     name: str
 
 @router.get("/vendors")
-def vendors_list(q: Optional[str] = Query(None)):
+def vendors_list(q: Optional[str] = Query(None), if_none_match: Optional[str] = Header(None)):
     with db() as (con, cur):
+        etag = make_etag("vendors", resource_version(cur, "vendors"), q or "")
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         if q:
             cur.execute("""
                 SELECT v.id, v.name, COALESCE(COUNT(p.id),0) AS po_count
@@ -134,7 +138,7 @@ def vendors_list(q: Optional[str] = Query(None)):
                 GROUP BY v.id, v.name
                 ORDER BY v.name ASC
             """)
-        return [dict(r) for r in cur.fetchall()]
+        return FastJSONResponse([dict(r) for r in cur.fetchall()], headers=cache_headers(etag))
 
 @router.post("/vendors")
 def create_vendor(body: VendorIn):
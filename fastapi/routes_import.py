@@ -10,7 +10,7 @@ import psycopg2.extras
 import requests
 from typing import Optional, List, Dict, Any, Tuple
 from fastapi import APIRouter, HTTPException, Query, Body, File, Form, UploadFile
-from fastapi.responses import JSONResponse
+from fast_json import FastJSONResponse
 from starlette.responses import StreamingResponse
 import json as _json
 
@@ -542,7 +542,7 @@ async def ai_preview(
         "headers_seen": headers_seen, "via": "gemini" if used_ai else ("xlsx" if ext.startswith("xl") else "csv"),
         "model": model_name,
     }
-    return JSONResponse(
+    return FastJSONResponse(
         content=payload,
         headers={"X-AI-Used": "1" if used_ai else "0", "X-AI-Model": model_name or ""},
     )
@@ -576,7 +576,7 @@ async def imports_preview(vendor_id: str, po_file: UploadFile = File(...)):
                 d["created_at"] = d["created_at"].isoformat()
             existing.append(d)
 
-    return {
+    return FastJSONResponse({
         "ok": True, "vendor_id": vendor_id, "file_name": filename, "new_po_lines": raw_lines,
         "existing_pos_summary": existing, "via": "xlsx" if ext.startswith("xl") else "csv",
-    }
\ No newline at end of file
+    })
\ No newline at end of file
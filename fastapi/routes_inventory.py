@@ -2,20 +2,34 @@ import re
 import json
 import os
 from uuid import UUID
-from typing import Optional, List, Dict, Any
+from datetime import date, datetime
+from typing import Optional, List, Dict, Any, Tuple, Sequence
 from fastapi import APIRouter, HTTPException, Header, Query, Body, Path, Depends, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+import psycopg2
 import psycopg2.extras
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
 import requests
 import jwt
 
-from db_utils import db, to_num, to_ymd, is_uuid_like, _uuid_list
-from pubsub_utils import _broadcast
+from fast_json import FastJSONResponse
+from db_utils import db, to_num, to_ymd, is_uuid_like, _uuid_list, copy_stream, iter_rows, stream_json
 from ebay_utils import _parse_ebay_legacy_id, get_ebay_token, session, EBAY_MARKETPLACE_ID
 from config import CONNECT_TIMEOUT, READ_TIMEOUT
 from ai_utils import generate_ebay_listing_content 
+from auth_cache import is_manager
+from match_index import smart_match
+from spec_extract import extract_specs
+from inventory_counts import read_counts, reconcile_inventory_counts
+from etags import make_etag, etag_matches, not_modified, cache_headers
+from inventory_read import (
+    rows_columns_sql, ROW_FIELDS, REDACTED_FIELDS, read_rows, change_event,
+    pending_row_changes, publish_row_changes,
+)
+from photo_match import match_photos
+from item_photos import item_photos_sql
+from listing_drafts import get_listing_draft, condition_label
 
 # --- AUTH CONFIG (Matches Admin Router) ---
 JWT_SECRET = os.getenv("JWT_SECRET", "unsafe_default_secret")
@@ -41,6 +55,9 @@ class RowPatch(BaseModel):
     purchaseCost: Optional[float] = None
     partStatus: Optional[str] = None
 
+class RowBatchBody(BaseModel):
+    rows: List[Dict[str, Any]]
+
 class PostedSearch(BaseModel):
     productName: Optional[str] = None
     grade: Optional[str] = None
@@ -56,6 +73,50 @@ class EbaySyncBody(BaseModel):
 class SmartMatchRequest(BaseModel):
     product_name: str
 
+# --- Hot SQL (also registered in plan_check.py) ---
+ROWS_BRIEF_SQL = """
+    WITH agg AS (
+      SELECT
+        pl.synergy_id::text AS "synergyId",
+        MAX(r.status) AS real_status,
+        MAX(r.grade) FILTER (WHERE r.grade IS NOT NULL) AS grade,
+        MAX(r.tested_by::text) AS "testedById",
+        MAX(r.tested_date) AS tested_date,
+        COALESCE(BOOL_OR(COALESCE(r.ebay_item_url,'') <> '' OR r.posted_at IS NOT NULL OR r.posted_by IS NOT NULL), FALSE) AS posted,
+        MAX(r.posted_at) AS "postedAt",
+        MAX(r.posted_by) AS "postedById",
+        MAX(NULLIF(r.ebay_price, 0)) AS "ebayPrice",
+        MAX(r.ebay_item_url) AS "ebayItemUrl",
+        MAX(r.part_status) AS "partStatus",
+        MAX(r.ebay_thumbnail) AS "ebayThumbnail"
+      FROM public.po_lines pl
+      LEFT JOIN inventory_read r ON r.line_id = pl.id
+      WHERE pl.synergy_id = ANY(%s)
+      GROUP BY pl.synergy_id
+    )
+    SELECT
+      a."synergyId",
+      COALESCE(
+          a.real_status, 
+          CASE WHEN a.grade IS NOT NULL AND a."testedById" IS NOT NULL AND a.tested_date IS NOT NULL THEN 'TESTED' ELSE 'UNTESTED' END
+      ) AS status,
+      a.grade,
+      a."testedById" AS "testedBy",
+      COALESCE(tester.name, a."testedById") AS "testedByName",
+      TO_CHAR(a.tested_date, 'YYYY-MM-DD') AS "testedDate",
+      a.posted,
+      a."postedAt",
+      a."postedById" AS "postedBy",
+      COALESCE(poster.name, a."postedById") AS "postedByName",
+      a."ebayPrice",
+      a."ebayItemUrl",
+      a."partStatus",
+      a."ebayThumbnail"
+    FROM agg a
+    LEFT JOIN app_users tester ON CASE WHEN a."testedById" ~ '^[0-9]+$' THEN tester.id = CAST(a."testedById" AS INTEGER) ELSE FALSE END
+    LEFT JOIN app_users poster ON CASE WHEN a."postedById" ~ '^[0-9]+$' THEN poster.id = CAST(a."postedById" AS INTEGER) ELSE FALSE END
+"""
+
 # --- AUTH HELPER (Hybrid JWT + Legacy) ---
 def verify_token(token: str):
     try:
@@ -87,6 +148,98 @@ def get_current_user_id(
 
 # --- ROUTES ---
 
+ROWS_DEFAULT_STATUSES = ('INTAKE', 'TESTING', 'READY', 'HOLD', 'TESTED', 'IN_STORE')
+# total=auto counts exactly below this planner estimate, and returns the estimate above it.
+ROWS_EXACT_COUNT_LIMIT = int(os.getenv("ROWS_EXACT_COUNT_LIMIT", "50000"))
+ROWS_PAGE_MAX = 1000
+ROWS_STREAM_MAX = int(os.getenv("ROWS_STREAM_MAX", "100000"))
+
+def _like_needle(s: str) -> str:
+    return "%" + str(s).replace("\\", "\\\\").replace("%", r"\%").replace("_", r"\_") + "%"
+
+def build_rows_filter(
+    q: Optional[str] = None,
+    grade: Optional[str] = None,
+    category: Optional[str] = None,
+    status: Optional[str] = None,
+    po_id: Optional[str] = None,
+    ebayItemId: Optional[str] = None,
+    codes: Optional[Sequence[str]] = None,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    WHERE clause (over inventory_read r) + params shared by /rows and /rows/count,
+    so the page and its total can never disagree.
+    """
+    where: List[str] = []
+    params: Dict[str, Any] = {}
+
+    # Status Logic
+    if status == "ready": where.append("r.is_ready")
+    elif status == "incomplete": where.append("NOT r.is_ready")
+    elif status == "ALL": pass
+    elif status: where.append("r.status = %(status)s"); params["status"] = status
+    else: where.append("r.status = ANY(%(default_statuses)s)"); params["default_statuses"] = list(ROWS_DEFAULT_STATUSES)
+
+    if grade: where.append("r.grade = %(grade)s"); params["grade"] = grade
+
+    if po_id:
+        if is_uuid_like(po_id): where.append("r.po_id = %(po_id)s::uuid"); params["po_id"] = po_id
+        else: where.append("1=0")
+
+    if category:
+        if str(category).upper() == "UNASSIGNED": where.append("r.category_id IS NULL")
+        elif is_uuid_like(category): where.append("r.category_id = %(category_uuid)s::uuid"); params["category_uuid"] = category
+        else:
+            where.append("(r.category_label ILIKE %(cat_like)s ESCAPE '\\' OR r.category_prefix ILIKE %(cat_like)s ESCAPE '\\')")
+            params["cat_like"] = _like_needle(category)
+
+    if ebayItemId:
+        where.append("r.ebay_item_id = %(ebay_item_id)s"); params["ebay_item_id"] = ebayItemId
+
+    if codes:
+        where.append("r.synergy_code = ANY(%(codes)s)"); params["codes"] = list(codes)
+
+    if q:
+        if re.match(r'^[A-Z]{2,4}-\d+$', q.strip().upper()):
+            where.append("r.synergy_code = %(exact_code)s")
+            params["exact_code"] = q.strip().upper()
+        else:
+            where.append("r.search_text ILIKE %(needle)s ESCAPE '\\'")
+            params["needle"] = _like_needle(q)
+
+    return (" AND ".join(where) if where else "TRUE"), params
+
+def _estimate_rows(cur, where_sql: str, params: Dict[str, Any]) -> int:
+    """Planner row estimate for a filtered inventory_read scan (no execution)."""
+    cur.execute(f"EXPLAIN (FORMAT JSON) SELECT 1 FROM inventory_read r WHERE {where_sql}", params)
+    plan = next(iter(cur.fetchone().values()))
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+def _exact_count(cur, where_sql: str, params: Dict[str, Any]) -> int:
+    cur.execute(f"SELECT COUNT(*) AS total FROM inventory_read r WHERE {where_sql}", params)
+    return int(cur.fetchone()["total"])
+
+def _is_manager(cur, user_id: int) -> bool:
+    return is_manager(user_id, cur)
+
+ROWS_VERSION_SQL = "SELECT COALESCE(MAX(version), 0) AS version FROM inventory_row_changes"
+
+def _rows_etag(cur, *parts: Any) -> str:
+    """
+    Validator for /rows pages: the newest change-log version. Versions follow
+    commit order, so no change can commit below one that is already visible.
+    """
+    cur.execute(ROWS_VERSION_SQL)
+    return make_etag("rows", cur.fetchone()["version"], *parts)
+
+def _redact_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    for f in REDACTED_FIELDS:
+        if f in row:
+            row[f] = 0
+    return row
+
 @router.get("/rows")
 def rows_list(
     q: Optional[str] = Query(None, description="Free text across synergy_code, product_name_raw, specs"),
@@ -96,177 +249,348 @@ def rows_list(
     status: Optional[str] = Query(None),
     po_id: Optional[str] = Query(None, description="Filter by Purchase Order ID"),
     ebayItemId: Optional[str] = Query(None, description="Filter inventory by eBay item id"),
-    limit: int = Query(200, ge=1, le=1000),
+    codes: Optional[str] = Query(None, description="Comma-separated synergy codes; live views fetch rows they only have a partial delta for"),
+    limit: int = Query(200, ge=1, le=ROWS_STREAM_MAX),
     offset: int = Query(0, ge=0),
+    total: Optional[str] = Query(None, pattern="^(exact|estimate|auto)$",
+                                 description="Also return the filtered total: exact | estimate | auto. Switches the response to {rows, total, totalExact}."),
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$",
+                                  description="Stream from a server-side cursor: ndjson lines or a plain JSON array. Allows limit up to ROWS_STREAM_MAX."),
+    fields: Optional[str] = Query(None, description="Comma-separated row fields to return (synergyId is always included)"),
+    if_none_match: Optional[str] = Header(None),
     user_id: int = Depends(get_current_user_id) # Using Hybrid Auth
 ):
     if categoryId and not category: 
         category = categoryId
+    if stream and total:
+        raise HTTPException(status_code=400, detail="total is not available on streamed responses; use /rows/count")
+    if not stream and limit > ROWS_PAGE_MAX:
+        raise HTTPException(status_code=422, detail=f"limit above {ROWS_PAGE_MAX} requires stream=ndjson|json")
         
-    with db() as (con, cur):
-        # 1. CHECK PERMISSIONS
-        is_manager = False
-        if user_id:
-            cur.execute("SELECT roles FROM app_users WHERE id = %s", (user_id,))
-            user_row = cur.fetchone()
-            if user_row:
-                roles = [r.lower() for r in (user_row.get('roles') or [])]
-                if 'manager' in roles or 'admin' in roles:
-                    is_manager = True
-
-        base_sql = """
-            SELECT 
-              i.synergy_code AS "synergyId", 
-              COALESCE(pl.product_name_raw, '') AS "productName",
-              COALESCE(i.category_id, pl.category_guess) AS "categoryId", 
-              i.status AS "status", 
-              %(empty_json)s::jsonb AS "attrs",
-              COALESCE(NULLIF(i.cost_unit, 0), pl.unit_cost, 0) AS "purchaseCost", 
-              COALESCE(pl.qty, 1) AS "qty", 
-              COALESCE(i.msrp, pl.msrp, 0) AS "msrp",
-              i.purchase_order_id AS "poId", 
-              i.po_line_id AS "lineId", 
-              i.grade AS "grade", 
-              i.tested_by AS "testedBy",
-              i.tested_date AS "testedDate", 
-              i.tester_comment AS "testerComment", 
-              i.posted_at AS "postedAt",
-              i.posted_by::text AS "postedBy", 
-              i.ebay_item_url AS "ebayItemUrl",
-              i.ebay_thumbnail AS "ebayThumbnail",
-              i.ebay_sku AS "ebaySku",
-              COALESCE(i.specs, %(empty_json)s::jsonb) AS "specs", 
-              COALESCE(i.price, 0) AS "price", 
-              COALESCE(i.ebay_price, 0) AS "ebayPrice",
-              COALESCE(i.sold_price, 0) AS "soldPrice",
-              c.label AS "categoryLabel", 
-              c.prefix AS "categoryPrefix",
-              COALESCE(c.icon_key, 'box') AS "categoryIcon",
-              COALESCE(c.color_key, 'slate') AS "categoryColor",
-              i.last_printed_at as "lastPrintedAt",
-              pl.upc AS "upc", 
-              pl.asin AS "asin",
-              i.part_status AS "partStatus"
-            FROM public.inventory_items i
-            LEFT JOIN po_lines pl ON pl.id = i.po_line_id
-            LEFT JOIN categories c ON c.id = COALESCE(i.category_id, pl.category_guess)
+    try:
+        columns_sql = rows_columns_sql([f.strip() for f in fields.split(",") if f.strip()] if fields else None)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    code_list = [c.strip() for c in codes.split(",") if c.strip()] if codes else None
+    where_sql, params = build_rows_filter(q, grade, category, status, po_id, ebayItemId, code_list)
+    params.update({"limit": limit, "offset": offset})
+
+    if stream:
+        manager = _is_manager(None, user_id)
+        sql = f"""SELECT {columns_sql}
+            FROM inventory_read r WHERE {where_sql}
+            ORDER BY r.synergy_code LIMIT %(limit)s OFFSET %(offset)s
         """
+        return StreamingResponse(
+            stream_json(iter_rows(sql, params), stream, transform=None if manager else _redact_row),
+            media_type="application/x-ndjson" if stream == "ndjson" else "application/json",
+        )
 
-        where: list[str] = []
-        params: dict[str, object] = {"limit": limit, "offset": offset, "empty_json": "{}"}
-
-        # Status Logic
-        ready_sql = "(i.grade IS NOT NULL AND i.tested_by IS NOT NULL AND (i.tested_date IS NOT NULL OR i.tested_at IS NOT NULL))"
-        if status == "ready": where.append(ready_sql)
-        elif status == "incomplete": where.append(f"NOT {ready_sql}")
-        elif status == "ALL": pass 
-        elif status: where.append("i.status = %(status)s"); params["status"] = status
-        else: where.append("i.status IN ('INTAKE','TESTING','READY','HOLD','TESTED','IN_STORE')")
-
-        if grade: where.append("i.grade = %(grade)s"); params["grade"] = grade
-
-        if po_id:
-            if is_uuid_like(po_id): where.append("i.purchase_order_id = %(po_id)s::uuid"); params["po_id"] = po_id
-            else: where.append("1=0")
-
-        if category:
-            if str(category).upper() == "UNASSIGNED": where.append("COALESCE(i.category_id, pl.category_guess) IS NULL")
-            elif is_uuid_like(category): where.append("COALESCE(i.category_id, pl.category_guess) = %(category_uuid)s::uuid"); params["category_uuid"] = category
-            else: where.append("(c.label ILIKE %(cat_like)s ESCAPE '\\' OR c.prefix ILIKE %(cat_like)s ESCAPE '\\')"); params["cat_like"] = f"%{category}%"
-
-        if ebayItemId:
-            where.append("i.ebay_item_id = %(ebay_item_id)s"); params["ebay_item_id"] = ebayItemId
-
-        if q:
-            if re.match(r'^[A-Z]{2,4}-\d+$', q.strip().upper()):
-                where.append("i.synergy_code = %(exact_code)s")
-                params["exact_code"] = q.strip().upper()
-            else:
-                needle = f"%{q}%"
-                params["needle"] = needle
-                where.append("""
-                    (i.synergy_code ILIKE %(needle)s ESCAPE '\\' 
-                     OR pl.product_name_raw ILIKE %(needle)s ESCAPE '\\' 
-                     OR CAST(i.specs AS text) ILIKE %(needle)s ESCAPE '\\'
-                     OR pl.upc ILIKE %(needle)s ESCAPE '\\'
-                     OR pl.asin ILIKE %(needle)s ESCAPE '\\'
-                     OR i.tester_comment ILIKE %(needle)s ESCAPE '\\')
-                """)
-
-        sql = f"""{base_sql} WHERE {" AND ".join(where) if where else "TRUE"}
-            ORDER BY i.synergy_code LIMIT %(limit)s OFFSET %(offset)s
+    with db() as (con, cur):
+        # 1. CHECK PERMISSIONS
+        is_manager = _is_manager(cur, user_id)
+
+        etag = _rows_etag(cur, is_manager, q, grade, category, status, po_id, ebayItemId, codes, limit, offset, total, fields)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
+        mode = total
+        estimate = None
+        if mode in ("estimate", "auto"):
+            estimate = _estimate_rows(cur, where_sql, params)
+            if mode == "auto":
+                mode = "exact" if estimate <= ROWS_EXACT_COUNT_LIMIT else "estimate"
+
+        # Exact totals ride along on the page query as a window count.
+        total_col = ', COUNT(*) OVER() AS "__total"' if mode == "exact" else ""
+        sql = f"""SELECT {columns_sql}{total_col}
+            FROM inventory_read r WHERE {where_sql}
+            ORDER BY r.synergy_code LIMIT %(limit)s OFFSET %(offset)s
         """
 
         cur.execute(sql, params)
         results = [dict(r) for r in cur.fetchall()]
 
+        total_count = None
+        if mode == "exact":
+            if results:
+                total_count = int(results[0]["__total"])
+                for row in results:
+                    row.pop("__total", None)
+            else:
+                # Past the last page the window count is unavailable.
+                total_count = _exact_count(cur, where_sql, params) if offset else 0
+        elif mode == "estimate":
+            total_count = max(estimate, offset + len(results))
+
         # 2. REDACT FINANCIALS (But keep IDs)
         if not is_manager:
             for row in results:
                 # We overwrite the sensitive costs with 0. 
                 # This protects the business data while keeping the app functional.
-                row["purchaseCost"] = 0
-                row["soldPrice"] = 0
-                row["msrp"] = 0
+                _redact_row(row)
+
+        if total:
+            return FastJSONResponse({"rows": results, "total": total_count, "totalExact": mode == "exact"},
+                                    headers=cache_headers(etag))
+        return FastJSONResponse(results, headers=cache_headers(etag))
+
+# RowPatch field -> inventory_items column (anything else is ignored)
+ROW_PATCH_COLUMNS = {
+    "grade": "grade", "testedBy": "tested_by", "testedDate": "tested_date", "testerComment": "tester_comment",
+    "specs": "specs", "price": "price", "ebayPrice": "ebay_price", "categoryId": "category_id",
+    "postedAt": "posted_at", "postedBy": "posted_by", "ebayItemUrl": "ebay_item_url", "status": "status",
+    "purchaseCost": "cost_unit", "partStatus": "part_status",
+}
+_PATCH_CASTS = {"tested_date": "::date", "posted_at": "::timestamptz", "category_id": "::uuid", "specs": "::jsonb"}
+ROWS_BATCH_MAX = 1000
+
+def _coerce_row_patch(data: Dict[str, Any]) -> Dict[str, Any]:
+    """RowPatch dump -> {column: db value}. Raises ValueError on malformed input."""
+    out: Dict[str, Any] = {}
+    for k, v in data.items():
+        col = ROW_PATCH_COLUMNS.get(k)
+        if not col: continue
+
+        if col == "tested_date":
+            v = to_ymd(v)
+            if v: date.fromisoformat(v)
+            out[col] = v
+        elif col == "posted_at":
+            if v: datetime.fromisoformat(str(v).replace("Z", "+00:00"))
+            out[col] = v or None
+        elif col in ("price", "ebay_price", "cost_unit"): out[col] = to_num(v)
+        elif col == "category_id": out[col] = str(UUID(str(v))) if v else None
+        elif col == "specs": out[col] = json.dumps(v or {})
+        else: out[col] = v if v != "" else None
+    return out
+
+_inventory_column_types: Dict[str, str] = {}
+
+def _column_types(cur) -> Dict[str, str]:
+    if not _inventory_column_types:
+        cur.execute(
+            """
+            SELECT attname, format_type(atttypid, atttypmod) AS type
+            FROM pg_attribute
+            WHERE attrelid = 'public.inventory_items'::regclass AND attnum > 0 AND NOT attisdropped
+            """
+        )
+        _inventory_column_types.update({r["attname"]: r["type"] for r in cur.fetchall()})
+    return _inventory_column_types
+
+# CSV column order for /rows/export (API names, no placeholder "attrs")
+ROWS_EXPORT_FIELDS = [f for f in ROW_FIELDS]
+
+@router.get("/rows/export")
+def rows_export(
+    q: Optional[str] = Query(None),
+    grade: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    categoryId: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    po_id: Optional[str] = Query(None),
+    ebayItemId: Optional[str] = Query(None),
+    format: str = Query("csv", pattern="^(csv|csv.gz)$"),
+    user_id: int = Depends(get_current_user_id)
+):
+    """Stream every matching row as CSV (or gzip CSV) straight from COPY."""
+    if categoryId and not category: category = categoryId
 
-        return results
+    where_sql, params = build_rows_filter(q, grade, category, status, po_id, ebayItemId)
+    manager = is_manager(user_id)
+    cols = [
+        f'0 AS "{f}"' if f in REDACTED_FIELDS and not manager else f'r.{ROW_FIELDS[f]} AS "{f}"'
+        for f in ROWS_EXPORT_FIELDS
+    ]
+    sql = f"SELECT {', '.join(cols)} FROM inventory_read r WHERE {where_sql} ORDER BY r.synergy_code"
+
+    gz = format == "csv.gz"
+    filename = f"inventory_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv" + (".gz" if gz else "")
+    return StreamingResponse(
+        copy_stream(sql, params, gzip=gz),
+        media_type="application/gzip" if gz else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @router.patch("/rows/{synergy_id}")
 def rows_patch(synergy_id: str, body: RowPatch):
     if not synergy_id: raise HTTPException(400, "Missing synergyId")
 
-    mapping = {"grade": "grade", "testedBy": "tested_by", "testedDate": "tested_date", "testerComment": "tester_comment",
-               "specs": "specs", "price": "price", "ebayPrice": "ebay_price", "categoryId": "category_id",
-               "postedAt": "posted_at", "postedBy": "posted_by", "ebayItemUrl": "ebay_item_url", "status": "status",
-               "purchaseCost": "cost_unit", "partStatus": "part_status"}
-    
-    ALLOWED_COLS = {
-        "grade", "tested_by", "tested_date", "tester_comment", "specs", "price", 
-        "ebay_price", "category_id", "posted_at", "posted_by", "ebay_item_url", 
-        "status", "cost_unit", "part_status"
-    }
-
-    data = body.model_dump(exclude_unset=True)
-
-    fields, vals = [], []
-    for k, v in data.items():
-        col = mapping.get(k)
-        if not col: continue
-        
-        if col not in ALLOWED_COLS:
-            continue
+    try:
+        values = _coerce_row_patch(body.model_dump(exclude_unset=True))
+    except ValueError as e:
+        raise HTTPException(400, f"Invalid value: {e}")
 
-        if col == "tested_date": fields.append(f"{col} = %s::date"); vals.append(to_ymd(v))
-        elif col == "posted_at": fields.append(f"{col} = %s::timestamptz"); vals.append(v or None)
-        elif col in ("price","ebay_price","cost_unit"): fields.append(f"{col} = %s"); vals.append(to_num(v))
-        elif col == "category_id": fields.append(f"{col} = %s::uuid"); vals.append(str(UUID(str(v))) if v else None)
-        elif col == "specs": fields.append(f"{col} = %s::jsonb"); vals.append(json.dumps(v or {}))
-        else: fields.append(f"{col} = %s"); vals.append(v if v != "" else None)
+    if not values: return {"ok": True, "updated": 0}
 
-    if not fields: return {"ok": True, "updated": 0}
+    fields = [f"{col} = %s{_PATCH_CASTS.get(col, '')}" for col in values]
+    vals = list(values.values())
 
     where_sql, key_vals = ("WHERE synergy_id = %s::uuid", [synergy_id]) if is_uuid_like(synergy_id) else ("WHERE synergy_code = %s", [synergy_id])
     
-    update_sql = f"UPDATE public.inventory_items SET {', '.join(fields)} {where_sql}"
+    update_sql = f"UPDATE public.inventory_items SET {', '.join(fields)} {where_sql} RETURNING synergy_code"
 
     with db() as (con, cur):
         cur.execute(update_sql, vals + key_vals)
-        if cur.rowcount == 0: raise HTTPException(404, f"No row found for '{synergy_id}'")
-        
-        select_sql = f"""
-            SELECT i.synergy_code AS "synergyId", COALESCE(pl.product_name_raw, '') AS "productName", i.category_id AS "categoryId", i.status AS "status",
-                   %s::jsonb AS "attrs", COALESCE(NULLIF(i.cost_unit, 0), pl.unit_cost, 0) AS "purchaseCost", COALESCE(pl.qty, 1) AS "qty", COALESCE(i.msrp, pl.msrp, 0) AS "msrp",
-                   i.purchase_order_id AS "poId", i.po_line_id AS "lineId", i.grade AS "grade", i.tested_by AS "testedBy", i.tested_date AS "testedDate",
-                   i.tester_comment AS "testerComment", COALESCE(i.specs, %s::jsonb) AS "specs", COALESCE(i.price, 0) AS "price",
-                   COALESCE(i.ebay_price, 0) AS "ebayPrice", i.posted_at AS "postedAt", i.posted_by::text AS "postedBy", i.ebay_item_url AS "ebayItemUrl",
-                   i.last_printed_at as "lastPrintedAt", pl.upc AS "upc", pl.asin AS "asin", i.part_status AS "partStatus"
-            FROM public.inventory_items i LEFT JOIN po_lines pl ON pl.id = i.po_line_id {where_sql}
-        """
-        cur.execute(select_sql, ["{}", "{}"] + key_vals)
-        row = cur.fetchone()
-        if row: _broadcast("row.upserted", dict(row))
-        return {"ok": True, "updated": 1}
-    
+        updated = cur.fetchone()
+        if not updated: raise HTTPException(404, f"No row found for '{synergy_id}'")
+        txid = pending_row_changes(cur)
+
+    publish_row_changes(txid)
+    return {"ok": True, "updated": 1}
+
+@router.patch("/rows")
+def rows_patch_batch(
+    body: RowBatchBody,
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Apply per-row patches ({synergyId, ...RowPatch fields}) in one
+    UPDATE ... FROM (VALUES ...). Invalid rows, and rows the database
+    rejects, are reported in `errors` and skipped; the rest are still
+    applied. One row.changed event
+    carries the deltas of all updated rows.
+    """
+    if len(body.rows) > ROWS_BATCH_MAX:
+        raise HTTPException(400, f"At most {ROWS_BATCH_MAX} rows per batch")
+
+    errors: List[Dict[str, Any]] = []
+    patches: Dict[str, Dict[str, Any]] = {}
+    for idx, raw in enumerate(body.rows):
+        code = str((raw or {}).get("synergyId") or "").strip()
+        if not code:
+            errors.append({"index": idx, "synergyId": None, "error": "Missing synergyId"}); continue
+        if code in patches:
+            errors.append({"index": idx, "synergyId": code, "error": "Duplicate synergyId in batch"}); continue
+        try:
+            patch = RowPatch.model_validate(raw).model_dump(exclude_unset=True)
+            values = _coerce_row_patch(patch)
+        except (ValidationError, ValueError) as e:
+            errors.append({"index": idx, "synergyId": code, "error": f"Invalid value: {e}"}); continue
+        if values:
+            patches[code] = values
+
+    if not patches:
+        return {"ok": not errors, "updated": 0, "rows": [], "errors": errors}
+
+    cols = sorted({col for values in patches.values() for col in values})
+
+    with db() as (con, cur):
+        types = _column_types(cur)
+        template = "(%s, " + ", ".join(f"%s::boolean, %s::{types[c]}" for c in cols) + ")"
+        set_sql = ", ".join(f"{c} = CASE WHEN v.set_{c} THEN v.{c} ELSE i.{c} END" for c in cols)
+        value_cols = ", ".join(f"set_{c}, {c}" for c in cols)
+
+        args = []
+        for code, values in patches.items():
+            row = [code]
+            for c in cols:
+                row += [c in values, values.get(c)]
+            args.append(tuple(row))
+
+        def apply(rows):
+            return psycopg2.extras.execute_values(
+                cur,
+                f"""
+                UPDATE public.inventory_items i SET {set_sql}
+                FROM (VALUES %s) AS v(synergy_code, {value_cols})
+                WHERE i.synergy_code = v.synergy_code
+                RETURNING i.synergy_code
+                """,
+                rows, template=template, page_size=len(rows), fetch=True,
+            )
+
+        # A constraint violation (unknown categoryId, ...) fails the whole
+        # statement: redo the batch row by row to report just the bad rows.
+        rejected: Dict[str, str] = {}
+        cur.execute("SAVEPOINT patch_batch")
+        try:
+            updated = apply(args)
+            cur.execute("RELEASE SAVEPOINT patch_batch")
+        except (psycopg2.IntegrityError, psycopg2.DataError):
+            cur.execute("ROLLBACK TO SAVEPOINT patch_batch")
+            updated = []
+            for row in args:
+                cur.execute("SAVEPOINT patch_row")
+                try:
+                    updated += apply([row])
+                    cur.execute("RELEASE SAVEPOINT patch_row")
+                except (psycopg2.IntegrityError, psycopg2.DataError) as e:
+                    cur.execute("ROLLBACK TO SAVEPOINT patch_row")
+                    rejected[row[0]] = (e.diag.message_primary or str(e)).strip()
+        updated_codes = {r["synergy_code"] for r in updated}
+
+        for idx, raw in enumerate(body.rows):
+            code = str((raw or {}).get("synergyId") or "").strip()
+            if code in rejected:
+                errors.append({"index": idx, "synergyId": code, "error": f"Rejected: {rejected[code]}"})
+            elif code in patches and code not in updated_codes:
+                errors.append({"index": idx, "synergyId": code, "error": f"No row found for '{code}'"})
+
+        rows = read_rows(cur, list(updated_codes))
+        txid = pending_row_changes(cur)
+
+        if not _is_manager(cur, user_id):
+            rows = [_redact_row(r) for r in rows]
+
+    publish_row_changes(txid)
+    return {"ok": not errors, "updated": len(updated_codes), "rows": rows, "errors": errors}
+
+@router.get("/rows/changes")
+def rows_changes(
+    since: int = Query(0, ge=0, description="Last row version the client has applied"),
+    limit: int = Query(1000, ge=1, le=5000),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Row deltas after `since`, for clients catching up after a reconnect.
+    Resume from `next`; re-applied changes are harmless since fields carry
+    absolute values. `reset: true` means the history is gone and the client
+    must refetch /rows.
+    """
+    with db() as (con, cur):
+        cur.execute(
+            """
+            SELECT EXISTS (
+              SELECT 1 FROM inventory_row_changes
+              WHERE (op = 'reset' AND version > %(since)s)
+                 OR (op = 'prune' AND (changed->>'upTo')::bigint > %(since)s)
+            ) AS reset
+            """,
+            {"since": since},
+        )
+        if since and cur.fetchone()["reset"]:
+            cur.execute("SELECT COALESCE(MAX(version), 0) AS v FROM inventory_row_changes")
+            return {"reset": True, "next": cur.fetchone()["v"], "changes": [], "hasMore": False}
+
+        # Versions follow commit order (see inventory_read._COMMIT_ORDER_FN), so
+        # nothing can later commit below the last one returned.
+        cur.execute(
+            """
+            SELECT version, synergy_code, op, changed
+            FROM inventory_row_changes
+            WHERE version > %(since)s AND op IN ('upsert', 'delete')
+            ORDER BY version
+            LIMIT %(limit)s
+            """,
+            {"since": since, "limit": limit + 1},
+        )
+        rows = cur.fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_version = rows[-1]["version"] if rows else since
+
+        changes = [change_event(r) for r in rows]
+        if not _is_manager(cur, user_id):
+            for c in changes:
+                for f in REDACTED_FIELDS:
+                    c["fields"].pop(f, None)
+
+    return {"reset": False, "next": next_version, "changes": changes, "hasMore": has_more}
+
 @router.post("/rows/{synergy_id}/record-print")
 def record_print_for_row(synergy_id: str):
     if not synergy_id:
@@ -294,50 +618,7 @@ def rows_brief_post(body: Dict[str, List[str]] = Body(...)):
 
     out: List[Dict] = []
     with db() as (_, cur):
-        cur.execute(
-            """
-            WITH agg AS (
-              SELECT
-                pl.synergy_id::text AS "synergyId",
-                MAX(i.status) AS real_status,
-                MAX(i.grade) FILTER (WHERE i.grade IS NOT NULL) AS grade,
-                MAX(i.tested_by::text) AS "testedById",
-                MAX(i.tested_date) AS tested_date,
-                COALESCE(BOOL_OR(COALESCE(i.ebay_item_url,'') <> '' OR i.posted_at IS NOT NULL OR i.posted_by IS NOT NULL), FALSE) AS posted,
-                MAX(i.posted_at) AS "postedAt",
-                MAX(i.posted_by::text) AS "postedById",
-                MAX(i.ebay_price) AS "ebayPrice",
-                MAX(i.ebay_item_url) AS "ebayItemUrl",
-                MAX(i.part_status) AS "partStatus",
-                MAX(i.ebay_thumbnail) AS "ebayThumbnail"
-              FROM public.po_lines pl
-              LEFT JOIN public.inventory_items i ON i.po_line_id = pl.id
-              WHERE pl.synergy_id = ANY(%s)
-              GROUP BY pl.synergy_id
-            )
-            SELECT
-              a."synergyId",
-              COALESCE(
-                  a.real_status, 
-                  CASE WHEN a.grade IS NOT NULL AND a."testedById" IS NOT NULL AND a.tested_date IS NOT NULL THEN 'TESTED' ELSE 'UNTESTED' END
-              ) AS status,
-              a.grade,
-              a."testedById" AS "testedBy",
-              COALESCE(tester.name, a."testedById") AS "testedByName",
-              TO_CHAR(a.tested_date, 'YYYY-MM-DD') AS "testedDate",
-              a.posted,
-              a."postedAt",
-              a."postedById" AS "postedBy",
-              COALESCE(poster.name, a."postedById") AS "postedByName",
-              a."ebayPrice",
-              a."ebayItemUrl",
-              a."partStatus",
-              a."ebayThumbnail"
-            FROM agg a
-            LEFT JOIN app_users tester ON CASE WHEN a."testedById" ~ '^[0-9]+$' THEN tester.id = CAST(a."testedById" AS INTEGER) ELSE FALSE END
-            LEFT JOIN app_users poster ON CASE WHEN a."postedById" ~ '^[0-9]+$' THEN poster.id = CAST(a."postedById" AS INTEGER) ELSE FALSE END
-            """, (arr,)
-        )
+        cur.execute(ROWS_BRIEF_SQL, (arr,))
         line_rows = [dict(r) for r in cur.fetchall()]
         out.extend(line_rows)
         
@@ -354,85 +635,23 @@ def rows_count(
     ebayItemId: Optional[str] = Query(None)
 ):
     if categoryId and not category: category = categoryId
-    
+
+    where_sql, params = build_rows_filter(q, grade, category, status, po_id, ebayItemId)
     with db() as (con, cur):
-        where = []
-        params = {}
-
-        ready_sql = "(i.grade IS NOT NULL AND i.tested_by IS NOT NULL AND (i.tested_date IS NOT NULL OR i.tested_at IS NOT NULL))"
-        if status == "ready": where.append(ready_sql)
-        elif status == "incomplete": where.append(f"NOT {ready_sql}")
-        elif status == "ALL": pass 
-        elif status: 
-            where.append("i.status = %(status)s")
-            params["status"] = status
-        else: 
-            where.append("i.status IN ('INTAKE','TESTING','READY','HOLD','TESTED')")
-
-        if grade: 
-            where.append("i.grade = %(grade)s")
-            params["grade"] = grade
-
-        if po_id:
-            if is_uuid_like(po_id):
-                where.append("i.purchase_order_id = %(po_id)s::uuid")
-                params["po_id"] = po_id
-            else:
-                where.append("1=0")
-
-        if category:
-            if str(category).upper() == "UNASSIGNED":
-                 where.append("COALESCE(i.category_id, pl.category_guess) IS NULL")
-            elif is_uuid_like(category):
-                where.append("COALESCE(i.category_id, pl.category_guess) = %(category_uuid)s::uuid")
-                params["category_uuid"] = category
-            else:
-                cat_like = "%" + str(category).replace("%", r"\%").replace("_", r"\_") + "%"
-                where.append("(c.label ILIKE %(cat_like)s ESCAPE '\\' OR c.prefix ILIKE %(cat_like)s ESCAPE '\\')")
-                params["cat_like"] = cat_like
-
-        if ebayItemId:
-            where.append("i.ebay_item_id = %(ebay_item_id)s")
-            params["ebay_item_id"] = ebayItemId
-
-        if q:
-            needle = "%" + q.replace("%", r"\%").replace("_", r"\_") + "%"
-            params["needle"] = needle
-            where.append("""
-                (i.synergy_code ILIKE %(needle)s ESCAPE '\\' 
-                 OR pl.product_name_raw ILIKE %(needle)s ESCAPE '\\' 
-                 OR CAST(i.specs AS text) ILIKE %(needle)s ESCAPE '\\'
-                 OR pl.upc ILIKE %(needle)s ESCAPE '\\'
-                 OR pl.asin ILIKE %(needle)s ESCAPE '\\'
-                 OR i.tester_comment ILIKE %(needle)s ESCAPE '\\')
-            """)
-
-        sql = f"""
-            SELECT COUNT(*) AS total 
-            FROM public.inventory_items i
-            LEFT JOIN po_lines pl ON pl.id = i.po_line_id
-            LEFT JOIN categories c ON c.id = COALESCE(i.category_id, pl.category_guess)
-            WHERE {" AND ".join(where) if where else "TRUE"}
-        """
-        
-        cur.execute(sql, params)
-        return {"total": int(cur.fetchone()["total"])}
+        return {"total": _exact_count(cur, where_sql, params)}
 
 @router.get("/rows/counts")
-def rows_counts():
-    sql = """
-      SELECT COUNT(*) AS total,
-        COUNT(*) FILTER (WHERE grade IS NOT NULL AND tested_by IS NOT NULL AND (tested_date IS NOT NULL OR tested_at IS NOT NULL)) AS ready,
-        COUNT(*) FILTER (WHERE NOT (grade IS NOT NULL AND tested_by IS NOT NULL AND (tested_date IS NOT NULL OR tested_at IS NOT NULL))) AS incomplete,
-        COUNT(*) FILTER (WHERE tested_date = CURRENT_DATE) AS today_tested
-      FROM public.inventory_items
-    """
+def rows_counts(category: Optional[str] = None):
+    # Served from the trigger-maintained counters, not a scan of the inventory.
+    if category and not is_uuid_like(category): raise HTTPException(400, "category must be an id")
     with db() as (_, cur):
-      cur.execute(sql)
-      r = cur.fetchone()
-      return {
-        "total": int(r["total"]), "ready": int(r["ready"]), "incomplete": int(r["incomplete"]), "todayTested": int(r["today_tested"]),
-      }
+      return read_counts(cur, category_id=category)
+
+@router.post("/rows/counts/reconcile")
+def rows_counts_reconcile(user_id: int = Depends(get_current_user_id)):
+    if not _is_manager(None, user_id): raise HTTPException(403, "Managers only")
+    drift = reconcile_inventory_counts()
+    return {"ok": True, "drifted": len(drift), "drift": drift[:100]}
 
 @router.post("/rows/search_posted")
 def search_posted_row(body: PostedSearch):
@@ -458,6 +677,88 @@ def rows_similar(productName: str = Query(..., min_length=2), limit: int = Query
         cur.execute(sql, [productName] + params + [limit])
         return cur.fetchall() or []
 
+def _tokenize_for_like(s: str) -> List[str]:
+    raw = re.split(r"[\s\-_/|,.;:()+]+", s or "")
+    toks: List[str] = []
+    for t in raw:
+        t = t.strip()
+        if len(t) < 2: continue
+        toks.append(t[:64])
+        if len(toks) >= 8: break
+    return toks
+
+def build_similar_query(
+    probe: Dict[str, Any],
+    name: str = "",
+    grade: Optional[str] = None,
+    category_id: Optional[str] = None,
+    exclude_synergy: str = "",
+    limit: int = 5,
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Similar-item query over inventory_read. `probe` holds the extracted spec
+    columns for the item being matched (spec_extract.extract_specs). Candidates
+    come from indexed equality / range arms on the typed spec columns plus
+    name tokens; the score weighs spec agreement above name overlap.
+    """
+    where = ["TRUE"]; params: Dict[str, Any] = {"limit": limit}
+    if exclude_synergy: where.append("r.synergy_code <> %(exclude)s"); params["exclude"] = exclude_synergy
+
+    if category_id:
+        if is_uuid_like(str(category_id)):
+            where.append("r.category_id = %(cat_uuid)s::uuid"); params["cat_uuid"] = str(category_id)
+        else:
+            params["cat_like"] = _like_needle(str(category_id))
+            where.append("(r.category_label ILIKE %(cat_like)s ESCAPE '\\' OR r.category_prefix ILIKE %(cat_like)s ESCAPE '\\')")
+
+    if grade: where.append("r.grade = %(grade)s"); params["grade"] = grade
+
+    params.update({f"p_{k}": v for k, v in probe.items()})
+    arms: List[str] = []; score_parts: List[str] = ["0"]
+    if probe.get("cpu_model"):
+        arms.append("r.cpu_model = %(p_cpu_model)s")
+        score_parts.append("CASE WHEN r.cpu_model = %(p_cpu_model)s THEN 4 ELSE 0 END")
+    if probe.get("cpu_family"):
+        if probe.get("ram_gb"):
+            arms.append("(r.cpu_family = %(p_cpu_family)s AND r.ram_gb BETWEEN %(p_ram_gb)s / 2 AND %(p_ram_gb)s * 2)")
+        else:
+            arms.append("r.cpu_family = %(p_cpu_family)s")
+        score_parts.append("CASE WHEN r.cpu_family = %(p_cpu_family)s THEN 2 ELSE 0 END")
+    elif probe.get("storage_gb"):
+        # No CPU (phones, tablets, drives): storage size is the strongest key.
+        arms.append("r.storage_gb = %(p_storage_gb)s")
+    if probe.get("ram_gb"):
+        score_parts.append("CASE WHEN r.ram_gb = %(p_ram_gb)s THEN 2 ELSE 0 END")
+    if probe.get("storage_gb"):
+        score_parts.append("CASE WHEN r.storage_gb = %(p_storage_gb)s THEN 2 ELSE 0 END")
+    if probe.get("storage_type"):
+        score_parts.append("CASE WHEN r.storage_type = %(p_storage_type)s THEN 1 ELSE 0 END")
+    if probe.get("screen_in"):
+        score_parts.append("CASE WHEN r.screen_in BETWEEN %(p_screen_in)s - 0.2 AND %(p_screen_in)s + 0.2 THEN 1 ELSE 0 END")
+
+    # Name tokens only widen the candidate set when no spec could be extracted;
+    # otherwise they just break ties between spec matches.
+    spec_gated = bool(arms)
+    for idx, tok in enumerate(_tokenize_for_like(name)):
+        key = f"tok{idx}"
+        params[key] = _like_needle(tok)
+        if not spec_gated:
+            arms.append(f"r.search_text ILIKE %({key})s ESCAPE '\\'")
+        score_parts.append(f"CASE WHEN r.product_name ILIKE %({key})s ESCAPE '\\' THEN 2 ELSE 0 END")
+
+    gate = f"({' OR '.join(arms)})" if arms else "TRUE"
+    sql = f"""
+      SELECT r.synergy_code AS "synergyId", r.product_name AS "productName", r.grade AS "grade", r.status AS "status",
+        r.category_id AS "categoryId", r.category_label AS "categoryLabel", r.specs AS "specs", r.price AS "price",
+        r.ebay_price AS "ebayPrice", ({' + '.join(score_parts)}) AS score,
+        r.last_printed_at as "lastPrintedAt", r.upc AS "upc", r.asin AS "asin"
+      FROM inventory_read r
+      WHERE {' AND '.join(where)} AND {gate}
+      ORDER BY score DESC, COALESCE(r.posted_at, r.tested_date, r.tested_at) DESC NULLS LAST, r.synergy_code ASC
+      LIMIT %(limit)s
+    """
+    return sql, params
+
 @router.post("/rows/search_similar")
 def rows_search_similar(payload: Dict[str, Any] = Body(...)):
     name = (payload.get("productName") or "").strip()
@@ -467,58 +768,11 @@ def rows_search_similar(payload: Dict[str, Any] = Body(...)):
     exclude_synergy = (payload.get("excludeSynergyId") or "").strip()
     limit = int(payload.get("limit") or 5)
 
-    def _tokenize_for_like(s: str) -> List[str]:
-        raw = re.split(r"[\s\-_/|,.;:()+]+", s or "")
-        toks: List[str] = []
-        for t in raw:
-            t = t.strip()
-            if len(t) < 2: continue
-            toks.append(t[:64])
-            if len(toks) >= 8: break
-        return toks
-
-    blob = " ".join([name, str(specs.get("processor") or ""), str(specs.get("ram") or ""), str(specs.get("storage") or ""),
-                     str(specs.get("screen") or ""), str(specs.get("batteryHealth") or ""), str(specs.get("color") or "")])
-    tokens = _tokenize_for_like(blob)
-
-    where = ["TRUE"]; params: Dict[str, Any] = {"limit": limit, "empty_json": "{}"}
-    if exclude_synergy: where.append("i.synergy_code <> %(exclude)s"); params["exclude"] = exclude_synergy
-
-    if category_id:
-        if is_uuid_like(str(category_id)):
-            where.append("i.category_id = %(cat_uuid)s::uuid"); params["cat_uuid"] = str(category_id)
-        else:
-            params["cat_like"] = "%" + str(category_id).replace("%", r"\%").replace("_", r"\_") + "%"
-            where.append("(c.label ILIKE %(cat_like)s ESCAPE '\\' OR c.prefix ILIKE %(cat_like)s ESCAPE '\\')")
-
-    if grade: where.append("i.grade = %(grade)s"); params["grade"] = grade
-
-    match_clauses: List[str] = []; score_parts: List[str] = ["0"]
-    for idx, tok in enumerate(tokens):
-        key = f"tok{idx}"; like = "%" + tok.replace("%", r"\%").replace("_", r"\_") + "%"
-        params[key] = like
-        match_clauses.append(f"(pl.product_name_raw ILIKE %({key})s ESCAPE '\\' OR CAST(i.specs AS text) ILIKE %({key})s ESCAPE '\\')")
-        score_parts.append(f"CASE WHEN pl.product_name_raw ILIKE %({key})s ESCAPE '\\' THEN 2 ELSE 0 END")
-        score_parts.append(f"CASE WHEN CAST(i.specs AS text) ILIKE %({key})s ESCAPE '\\' THEN 1 ELSE 0 END")
-
-    text_where = f"({' OR '.join(match_clauses)})" if match_clauses else "TRUE"
-
-    sql = f"""
-      SELECT i.synergy_code AS "synergyId", COALESCE(pl.product_name_raw, '') AS "productName", i.grade AS "grade", i.status AS "status",
-        i.category_id AS "categoryId", c.label AS "categoryLabel", COALESCE(i.specs, %(empty_json)s::jsonb) AS "specs", COALESCE(i.price, 0) AS "price",
-        COALESCE(i.ebay_price, 0) AS "ebayPrice", ({' + '.join(score_parts)}) AS score,
-        i.last_printed_at as "lastPrintedAt", pl.upc AS "upc", pl.asin AS "asin"
-      FROM inventory_items i
-      LEFT JOIN po_lines pl ON pl.id = i.po_line_id
-      LEFT JOIN categories c ON c.id = i.category_id
-      WHERE {' AND '.join(where)} AND {text_where}
-      ORDER BY score DESC, COALESCE(i.posted_at, i.tested_date, i.tested_at) DESC NULLS LAST, i.synergy_code ASC
-      LIMIT %(limit)s
-    """
-
     with db() as (con, cur):
+        probe = extract_specs(cur, name, specs)
+        sql, params = build_similar_query(probe, name, grade, category_id, exclude_synergy, limit)
         cur.execute(sql, params)
-        return {"items": [dict(r) for r in cur.fetchall()]}
+        return {"items": [dict(r) for r in cur.fetchall()], "probe": probe}
 
 @router.post("/listings/link-ebay")
 def link_ebay_listing(body: AssocBody):
@@ -640,17 +894,9 @@ def ai_category_draft(po_id: str, body: Dict[str, Any] = Body(...)):
 @router.get("/rows/{synergy_id}/ebay-listing")
 def get_ebay_listing_data(
     synergy_id: str,
+    regenerate: bool = Query(False, description="Generate a new title/description even if the stored draft is current"),
     x_user_id: Optional[int] = Header(None, alias="X-User-ID")
 ):
-    def get_condition_label(grade):
-        g = (grade or "").upper()
-        if g == 'A': return "Excellent - Refurbished"
-        if g == 'B': return "Good - Used"
-        if g == 'C': return "Fair - Heavy Wear"
-        if g == 'D': return "Rough - Damaged"
-        if g == 'P': return "For Parts or Not Working"
-        return "Used"
-
     with db() as (con, cur):
         cur.execute("""
             SELECT 
@@ -663,12 +909,13 @@ def get_ebay_listing_data(
                 i.ebay_price,
                 i.ebay_sku,                
                 pl.unit_cost,
-                c.label AS category_label  
+                c.label AS category_label,
+                {photos} AS photos
             FROM inventory_items i
             LEFT JOIN po_lines pl ON i.po_line_id = pl.id
             LEFT JOIN categories c ON i.category_id = c.id
             WHERE i.synergy_code = %s
-        """, (synergy_id,))
+        """.format(photos=item_photos_sql("i")), (synergy_id,))
         
         row = cur.fetchone()
         
@@ -684,7 +931,8 @@ def get_ebay_listing_data(
                     0 as ebay_price,
                     NULL as ebay_sku,
                     pl.unit_cost,
-                    c.label as category_label
+                    c.label as category_label,
+                    '[]'::jsonb as photos
                 FROM po_lines pl
                 LEFT JOIN categories c ON pl.category_guess = c.id
                 WHERE pl.synergy_id = %s
@@ -695,7 +943,7 @@ def get_ebay_listing_data(
             raise HTTPException(404, "Item not found")
             
         item = dict(row)
-        item['condition'] = get_condition_label(item.get('grade'))
+        item['condition'] = condition_label(item.get('grade'))
 
         generated_sku = item.get('ebay_sku')
 
@@ -714,7 +962,9 @@ def get_ebay_listing_data(
         if not generated_sku:
             generated_sku = item.get('synergy_code')
 
-        content = generate_ebay_listing_content(item)
+        # Stored draft while the item's inputs are unchanged (listing_drafts.py);
+        # PO lines without an item are generated each time.
+        content = get_listing_draft(cur, synergy_id, regenerate) or generate_ebay_listing_content(item, cache=not regenerate)
         
         price = (item.get('ebay_price') or item.get('price') or 0)
         if price == 0:
@@ -726,61 +976,60 @@ def get_ebay_listing_data(
             "synergy_id": synergy_id,
             "title": content.get("title"),
             "description_html": content.get("html"),
+            "draft_generated_at": content.get("generated_at"),
             "price": round(float(price), 2),
             "qty": 1,
             "sku": generated_sku, 
-            "photos": []
+            "photos": item.get('photos') or []
         }
 
 @router.post("/rows/{synergy_id}/auto-link-photos")
 def auto_link_photos(synergy_id: str):
     with db() as (con, cur):
-        cur.execute("SELECT * FROM inventory_items WHERE synergy_code = %s", (synergy_id,))
+        cur.execute("""
+            SELECT i.item_id, i.grade, i.tester_comment, pl.product_name_raw,
+                   COALESCE(i.category_id, pl.category_guess) AS category_id
+            FROM inventory_items i
+            LEFT JOIN po_lines pl ON pl.id = i.po_line_id
+            WHERE i.synergy_code = %s
+        """, (synergy_id,))
         item = cur.fetchone()
         if not item: raise HTTPException(404, "Item not found")
 
-        p_name = item['product_name_raw'] or ""
-        grade = item['grade'] or ""
-        comment = (item['tester_comment'] or "").lower()
-        
-        search_terms = " | ".join(p_name.split()[:3]) 
-        
-        cur.execute("""
-            SELECT id, urls, product_name, grade, tags
-            FROM stock_photos
-            WHERE to_tsvector('english', product_name) @@ to_tsquery('english', %s)
-            ORDER BY 
-                (grade = %s) DESC, 
-                (grade = 'A') DESC, 
-                created_at DESC
-            LIMIT 1
-        """, (search_terms.replace(" ", " & "), grade))
-        
-        match = cur.fetchone()
-        
-        if match:
-            photo_objs = [{"url": u, "is_stock": True, "stock_id": str(match['id'])} for u in match['urls']]
-            
-            cur.execute("""
-                UPDATE inventory_items 
-                SET stock_photo_id = %s, 
-                    photos = %s::jsonb 
-                WHERE synergy_code = %s
-            """, (match['id'], json.dumps(photo_objs), synergy_id))
-            
-            return {
-                "ok": True, 
-                "linked_to": match['product_name'], 
-                "photo_count": len(match['urls'])
-            }
+        matches = match_photos(cur, item['product_name_raw'], item['grade'], item['tester_comment'],
+                               item['category_id'], limit=1, confident_only=True)
         
-        return {"ok": False, "message": "No confident match found"}
+        if not matches:
+            return {"ok": False, "message": "No confident match found"}
+        match = matches[0]
+
+        # Referenced, not copied: see item_photos.py
+        cur.execute("UPDATE inventory_items SET stock_photo_id = %s WHERE item_id = %s", (match['id'], item['item_id']))
+        txid = pending_row_changes(cur)
+
+    publish_row_changes(txid)
+    return {
+        "ok": True, 
+        "linked_to": match['product_name'], 
+        "photo_count": len(match['urls'] or [])
+    }
 
 @router.post("/rows/smart-match")
 def smart_match_inventory(body: SmartMatchRequest):
+    """
+    Top TESTED candidates for a product name, ranked by BM25 from the in-memory
+    match index. Uses the SQL token scorer until the index has been built.
+    """
+    with db() as (con, cur):
+        candidates = smart_match(cur, body.product_name)
+    if candidates is not None:
+        return {"candidates": candidates}
+    return _smart_match_sql(body.product_name)
+
+def _smart_match_sql(product_name: str):
     STOP_WORDS = {"and", "or", "the", "with", "for", "new", "used", "open", "box", "grade", "condition", "excellent", "good", "fair", "mint", "black", "white", "silver", "gray", "grey", "blue", "red", "gold", "tablet", "phone", "laptop"}
     
-    raw_tokens = re.findall(r'\w+', body.product_name.lower())
+    raw_tokens = re.findall(r'\w+', product_name.lower())
     search_tokens = {t for t in raw_tokens if len(t) > 2 and t not in STOP_WORDS}
     
     if not search_tokens:
@@ -1,11 +1,13 @@
+import os
 import re
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from datetime import datetime
 
 from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
+import psycopg2
 from db_utils import db
-from pubsub_utils import _broadcast
+from user_events import publish_to_users, online_users
 
 router = APIRouter(prefix="/messages", tags=["Messages"])
 SYNERGY_RE = re.compile(r"([A-Z0-9]{3,10}-\d{5})", re.IGNORECASE)
@@ -25,6 +27,164 @@ class GroupUpdateBody(BaseModel):
     subject: str
     avatar_url: str | None = None
 
+# ============================================================
+# READ STATE
+# ============================================================
+# Each participant keeps a pointer to the newest message they have read
+# (last_read_message_id, plus a copy of its created_at so comparisons stay
+# sargable on messages(thread_id, created_at, id)). Opening a thread moves the
+# pointer forward; unread counts are the messages from others after it.
+# Every forward move is also logged in message_read_marks, so a message's
+# read_at is when a reader's pointer first covered it, not when it last moved.
+# messages.read_at is no longer written; old values are still reported.
+MESSAGES_PAGE_SIZE = int(os.getenv("MESSAGES_PAGE_SIZE", "50"))
+# Unread counts stop at this many ("99+" in the UI) so a long-ignored thread
+# costs the same as any other.
+MESSAGES_UNREAD_CAP = int(os.getenv("MESSAGES_UNREAD_CAP", "100"))
+
+_READ_STATE_DDL = """
+CREATE INDEX IF NOT EXISTS messages_thread_created_idx ON messages (thread_id, created_at, id);
+CREATE INDEX IF NOT EXISTS message_thread_participants_user_idx ON message_thread_participants (user_id, thread_id);
+"""
+
+# Seed pointers from the legacy read_at flags: everything up to the newest
+# message the participant sent or that was marked read counts as read.
+_READ_STATE_BACKFILL = """
+UPDATE message_thread_participants p
+   SET (last_read_message_id, last_read_created_at) = (
+         SELECT m.id, m.created_at FROM messages m
+          WHERE m.thread_id = p.thread_id
+            AND (m.sender_id = p.user_id OR m.read_at IS NOT NULL)
+          ORDER BY m.created_at DESC, m.id DESC LIMIT 1),
+       last_read_at = now()
+ WHERE p.last_read_created_at IS NULL
+"""
+
+_READ_MARKS_DDL = """
+CREATE TABLE message_read_marks (
+  thread_id        {thread_type} NOT NULL REFERENCES message_threads (id) ON DELETE CASCADE,
+  user_id          integer NOT NULL,
+  up_to_created_at timestamptz NOT NULL,
+  up_to_id         {id_type} NOT NULL,
+  read_at          timestamptz NOT NULL DEFAULT now(),
+  PRIMARY KEY (thread_id, user_id, up_to_created_at, up_to_id)
+)
+"""
+
+# Pointers that predate the log: the time they last moved is all we know.
+_READ_MARKS_BACKFILL = """
+INSERT INTO message_read_marks (thread_id, user_id, up_to_created_at, up_to_id, read_at)
+SELECT thread_id, user_id, last_read_created_at, last_read_message_id, COALESCE(last_read_at, now())
+  FROM message_thread_participants
+ WHERE last_read_created_at IS NOT NULL AND last_read_message_id IS NOT NULL
+"""
+
+def ensure_message_read_state():
+    """Add the per-participant read pointer columns, their log and the paging index."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('message_read_state'))")
+        cur.execute(
+            "SELECT format_type(atttypid, atttypmod) AS id_type, "
+            "  (SELECT format_type(atttypid, atttypmod) FROM pg_attribute "
+            "    WHERE attrelid = 'message_threads'::regclass AND attname = 'id') AS thread_type, "
+            "  EXISTS (SELECT 1 FROM information_schema.columns "
+            "           WHERE table_name = 'message_thread_participants' AND column_name = 'last_read_message_id') AS present, "
+            "  to_regclass('message_read_marks') IS NOT NULL AS marks_present "
+            "FROM pg_attribute WHERE attrelid = 'messages'::regclass AND attname = 'id'"
+        )
+        row = cur.fetchone()
+        if not row["present"]:
+            cur.execute(
+                f"ALTER TABLE message_thread_participants "
+                f"ADD COLUMN last_read_message_id {row['id_type']} REFERENCES messages (id) ON DELETE SET NULL, "
+                f"ADD COLUMN last_read_created_at timestamptz, "
+                f"ADD COLUMN last_read_at timestamptz"
+            )
+        cur.execute(_READ_STATE_DDL)
+        if not row["present"]:
+            cur.execute(_READ_STATE_BACKFILL)
+        if not row["marks_present"]:
+            cur.execute(_READ_MARKS_DDL.format(thread_type=row["thread_type"], id_type=row["id_type"]))
+            cur.execute(_READ_MARKS_BACKFILL)
+        con.commit()
+
+# ============================================================
+# HOT SQL (also registered in plan_check.py)
+# ============================================================
+# Every per-thread lookup is a LATERAL probe of messages_thread_created_idx,
+# so the inbox costs O(threads), not O(messages).
+THREADS_ALL_SQL = """
+    SELECT
+        lm.thread_id, lm.sender_id, lm.body, lm.created_at,
+        t.is_group, t.subject, t.created_by_id, t.avatar_url,
+        dou.other_id, dou.other_name, dou.other_id as recipient_id,
+        unread.n AS unread_count
+    FROM message_thread_participants me
+    JOIN message_threads t ON t.id = me.thread_id
+    CROSS JOIN LATERAL (
+        SELECT m.thread_id, m.sender_id, m.body, m.created_at FROM messages m
+        WHERE m.thread_id = t.id
+        ORDER BY m.created_at DESC, m.id DESC LIMIT 1
+    ) lm
+    LEFT JOIN LATERAL (
+        SELECT u.id AS other_id, u.name AS other_name FROM message_thread_participants p
+        JOIN app_users u ON u.id = p.user_id
+        WHERE p.thread_id = t.id AND p.user_id <> %(me)s AND COALESCE(t.is_group, FALSE) = FALSE
+        LIMIT 1
+    ) dou ON TRUE
+    CROSS JOIN LATERAL (
+        SELECT COUNT(*) AS n FROM (
+            SELECT 1 FROM messages m
+            WHERE m.thread_id = t.id
+              AND m.created_at >= COALESCE(me.last_read_created_at, '-infinity')
+              AND (me.last_read_created_at IS NULL OR m.created_at > me.last_read_created_at OR m.id > me.last_read_message_id)
+              AND m.sender_id <> %(me)s
+            LIMIT %(unread_cap)s
+        ) x
+    ) unread
+    WHERE me.user_id = %(me)s
+    ORDER BY lm.created_at DESC
+"""
+
+# Newest first, one row past the page to tell whether older messages exist.
+# read_at: when another participant's pointer first covered the message, i.e.
+# the earliest of their read marks at or past it.
+THREAD_MESSAGES_PAGE_SQL = """
+    SELECT m.id, m.sender_id, m.body, m.created_at, COALESCE(m.read_at, r.read_at) AS read_at, u.name AS sender_name
+    FROM messages m
+    JOIN app_users u ON u.id = m.sender_id
+    LEFT JOIN LATERAL (
+        SELECT MIN(k.read_at) AS read_at FROM message_thread_participants p
+        CROSS JOIN LATERAL (
+            SELECT k.read_at FROM message_read_marks k
+            WHERE k.thread_id = p.thread_id AND k.user_id = p.user_id
+              AND (k.up_to_created_at, k.up_to_id) >= (m.created_at, m.id)
+            ORDER BY k.up_to_created_at, k.up_to_id
+            LIMIT 1
+        ) k
+        WHERE p.thread_id = m.thread_id AND p.user_id <> m.sender_id
+          AND (p.last_read_created_at, p.last_read_message_id) >= (m.created_at, m.id)
+    ) r ON TRUE
+    WHERE m.thread_id = %(thread)s {cursor}
+    ORDER BY m.created_at DESC, m.id DESC
+    LIMIT %(limit)s + 1
+"""
+PAGE_BEFORE_FILTER = "AND (m.created_at, m.id) < (%(before_at)s, %(before_id)s)"
+
+# Pointers only move forward; each move is logged as a read mark.
+MARK_READ_SQL = """
+    WITH moved AS (
+        UPDATE message_thread_participants
+           SET last_read_message_id = %(id)s, last_read_created_at = %(created_at)s, last_read_at = NOW()
+         WHERE thread_id = %(thread)s AND user_id = %(me)s
+           AND (last_read_created_at IS NULL OR (last_read_created_at, last_read_message_id) < (%(created_at)s, %(id)s))
+        RETURNING thread_id, user_id, last_read_created_at, last_read_message_id, last_read_at
+    )
+    INSERT INTO message_read_marks (thread_id, user_id, up_to_created_at, up_to_id, read_at)
+    SELECT thread_id, user_id, last_read_created_at, last_read_message_id, last_read_at FROM moved
+    ON CONFLICT DO NOTHING
+"""
+
 # ============================================================
 # HELPERS
 # ============================================================
@@ -78,11 +238,53 @@ def _serialize_thread_row(r: Dict[str, Any]) -> Dict[str, Any]:
         created = created.isoformat()
     return {"id": str(r.get("thread_id")), "sender_id": r.get("sender_id"), "recipient_id": r.get("recipient_id"), "body": r.get("body") or "", "created_at": created, "other_id": r.get("other_id"), "other_name": r.get("other_name"), "unread_count": r.get("unread_count") or 0, "is_group": bool(r.get("is_group", False)), "subject": r.get("subject"), "created_by_id": r.get("created_by_id"), "avatar_url": r.get("avatar_url"), "participants": r.get("participants", [])}
 
+def _participant_ids(cur, thread_id) -> List[int]:
+    cur.execute("SELECT user_id FROM message_thread_participants WHERE thread_id=%s", (thread_id,))
+    return [r["user_id"] for r in cur.fetchall()]
+
+def _mark_read(cur, thread_id, me: int, row: Dict[str, Any]):
+    cur.execute(MARK_READ_SQL, {"thread": thread_id, "me": me, "id": row["id"], "created_at": row["created_at"]})
+
+def _thread_page(cur, thread_id, me: int, before: Optional[str], limit: int) -> Dict[str, Any]:
+    """
+    One page of a thread, returned oldest-to-newest for display. Without a
+    `before` cursor this is the newest page and marks the thread read.
+    """
+    params = {"thread": thread_id, "limit": limit}
+    cursor_filter = ""
+    if before:
+        try:
+            cur.execute("SELECT id, created_at FROM messages WHERE thread_id=%s AND id=%s", (thread_id, before))
+        except psycopg2.DataError:
+            raise HTTPException(400, "Invalid 'before' cursor")
+        anchor_row = cur.fetchone()
+        if not anchor_row:
+            raise HTTPException(400, "Invalid 'before' cursor")
+        params.update(before_id=anchor_row["id"], before_at=anchor_row["created_at"])
+        cursor_filter = PAGE_BEFORE_FILTER
+    cur.execute(THREAD_MESSAGES_PAGE_SQL.format(cursor=cursor_filter), params)
+    rows = cur.fetchall() or []
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if rows and not before:
+        _mark_read(cur, thread_id, me, rows[0])
+    rows.reverse()
+    return {
+        "messages": [_serialize_message_row(r) for r in rows],
+        "has_more": has_more,
+        "next_before": str(rows[0]["id"]) if has_more else None,
+    }
+
 # ============================================================
 # ENDPOINTS
 # ============================================================
 @router.get("/with/{other_id}")
-def get_conversation(other_id: int, employee_id: int = Query(...)):
+def get_conversation(
+    other_id: int,
+    employee_id: int = Query(...),
+    before: Optional[str] = Query(None, description="message id; returns the page of older messages"),
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=200),
+):
     me = employee_id
     if me == other_id:
         raise HTTPException(400, "Cannot self-DM")
@@ -90,10 +292,7 @@ def get_conversation(other_id: int, employee_id: int = Query(...)):
         _ensure_user(cur, me)
         _ensure_user(cur, other_id)
         thread_id = _get_or_create_dm_thread(cur, me, other_id)
-        cur.execute("UPDATE messages SET read_at=NOW() WHERE thread_id=%s AND sender_id=%s AND read_at IS NULL", (thread_id, other_id))
-        cur.execute("SELECT m.id, m.sender_id, m.body, m.created_at, m.read_at, u.name AS sender_name FROM messages m JOIN app_users u ON u.id=m.sender_id WHERE m.thread_id=%s ORDER BY m.created_at ASC, m.id ASC", (thread_id,))
-        rows = cur.fetchall() or []
-    return {"messages": [_serialize_message_row(r) for r in rows]}
+        return _thread_page(cur, thread_id, me, before, limit)
 
 @router.post("")
 def send_message(payload: MessageCreateBody):
@@ -110,13 +309,15 @@ def send_message(payload: MessageCreateBody):
         thread_id = _get_or_create_dm_thread(cur, s, r)
         cur.execute("INSERT INTO messages (thread_id, sender_id, body) VALUES (%s,%s,%s) RETURNING id, sender_id, body, created_at", (thread_id, s, text))
         row = cur.fetchone()
+        _mark_read(cur, thread_id, s, row)
         created = row["created_at"].isoformat() if isinstance(row["created_at"], datetime) else str(row["created_at"])
         msg = {"id": str(row["id"]), "sender_id": row["sender_id"], "sender_name": sender_name, "recipient_id": r, "body": row["body"], "created_at": created}
         m = SYNERGY_RE.search(text)
         if m:
             msg["synergy_code"] = m.group(1).upper()
-        _broadcast("message.new", msg)
-        return msg
+        con.commit()
+    publish_to_users((s, r), "message.new", msg)
+    return msg
 
 @router.post("/groups")
 def create_group(data: dict):
@@ -143,19 +344,41 @@ def create_group(data: dict):
         if initial:
             cur.execute("INSERT INTO messages (thread_id,sender_id,body) VALUES (%s,%s,%s)", (thread_id, creator, initial))
         con.commit()
-    _broadcast("thread.created", {"thread_id": thread_id, "name": name})
+    publish_to_users(uniq, "thread.created", {"thread_id": thread_id, "name": name})
     return {"success": True, "thread_id": str(thread_id)}
 
 @router.get("/threads/{thread_id}/messages")
-def get_thread_messages(thread_id: str, employee_id: int = Query(...)):
+def get_thread_messages(
+    thread_id: str,
+    employee_id: int = Query(...),
+    before: Optional[str] = Query(None, description="message id; returns the page of older messages"),
+    limit: int = Query(MESSAGES_PAGE_SIZE, ge=1, le=200),
+):
     with db() as (con, cur):
         cur.execute("SELECT 1 FROM message_thread_participants WHERE thread_id=%s AND user_id=%s", (thread_id, employee_id))
         if not cur.fetchone():
             raise HTTPException(403, "Not in this thread")
-        cur.execute("UPDATE messages SET read_at=NOW() WHERE thread_id=%s AND sender_id <> %s AND read_at IS NULL", (thread_id, employee_id))
-        cur.execute("SELECT m.id, m.sender_id, m.body, m.created_at, m.read_at, u.name AS sender_name FROM messages m JOIN app_users u ON u.id=m.sender_id WHERE m.thread_id=%s ORDER BY m.created_at ASC, m.id ASC", (thread_id,))
-        rows = cur.fetchall() or []
-    return {"messages": [_serialize_message_row(r) for r in rows]}
+        return _thread_page(cur, thread_id, employee_id, before, limit)
+
+@router.post("/threads/{thread_id}/read")
+def mark_thread_read(thread_id: str, employee_id: int = Query(...), message_id: Optional[str] = Query(None)):
+    """Move the caller's read pointer up to `message_id` (default: the newest message)."""
+    with db() as (con, cur):
+        cur.execute("SELECT 1 FROM message_thread_participants WHERE thread_id=%s AND user_id=%s", (thread_id, employee_id))
+        if not cur.fetchone():
+            raise HTTPException(403, "Not in this thread")
+        try:
+            if message_id:
+                cur.execute("SELECT id, created_at FROM messages WHERE thread_id=%s AND id=%s", (thread_id, message_id))
+            else:
+                cur.execute("SELECT id, created_at FROM messages WHERE thread_id=%s ORDER BY created_at DESC, id DESC LIMIT 1", (thread_id,))
+        except psycopg2.DataError:
+            raise HTTPException(400, "Invalid message_id")
+        row = cur.fetchone()
+        if row:
+            _mark_read(cur, thread_id, employee_id, row)
+        con.commit()
+    return {"success": True}
 
 @router.post("/threads/{thread_id}/messages")
 def send_thread_message(thread_id: str, payload: ThreadMessageCreateBody, employee_id: int = Query(...)):
@@ -169,9 +392,11 @@ def send_thread_message(thread_id: str, payload: ThreadMessageCreateBody, employ
             raise HTTPException(403, "Not in this thread")
         cur.execute("INSERT INTO messages (thread_id, sender_id, body) VALUES (%s,%s,%s) RETURNING id, sender_id, body, created_at", (thread_id, employee_id, text))
         row = cur.fetchone()
+        _mark_read(cur, thread_id, employee_id, row)
+        recipients = _participant_ids(cur, thread_id)
         con.commit()
     msg = _serialize_message_row({**row, "sender_name": sender_name})
-    _broadcast("message.created", {"thread_id": thread_id, "message": msg})
+    publish_to_users(recipients, "message.created", {"thread_id": thread_id, "message": msg})
     return msg
 
 @router.put("/threads/{thread_id}")
@@ -183,9 +408,10 @@ def update_group_info(thread_id: str, payload: GroupUpdateBody, employee_id: int
         cur.execute("UPDATE message_threads SET subject = %s, avatar_url = %s WHERE id = %s AND created_by_id = %s RETURNING id", (subject, payload.avatar_url, thread_id, employee_id))
         if not cur.fetchone():
             raise HTTPException(403, "Only the group admin can edit this thread")
+        recipients = _participant_ids(cur, thread_id)
         con.commit()
     update_data = {"thread_id": thread_id, "subject": subject, "avatar_url": payload.avatar_url}
-    _broadcast("thread.updated", update_data)
+    publish_to_users(recipients, "thread.updated", update_data)
     return {"success": True, **update_data}
 
 @router.post("/threads/{thread_id}/participants")
@@ -228,45 +454,31 @@ def leave_group(thread_id: str, employee_id: int = Query(...)):
         con.commit()
     return {"success": True}
 
+@router.get("/presence")
+def get_presence(user_ids: Optional[str] = Query(None, description="comma-separated ids; default: everyone online")):
+    ids = None
+    if user_ids:
+        try:
+            ids = [int(u) for u in user_ids.split(",") if u.strip()]
+        except ValueError:
+            raise HTTPException(400, "user_ids must be integers")
+    return {"online": sorted(online_users(ids))}
+
 @router.get("/threads/all")
 def list_all_threads(employee_id: int = Query(...)):
     with db() as (con, cur):
-        cur.execute(
-            """
-            WITH my_threads AS (
-                SELECT t.id, t.is_group, t.subject, t.created_by_id, t.avatar_url FROM message_threads t
-                JOIN message_thread_participants p ON p.thread_id = t.id WHERE p.user_id = %(me)s
-            ), last_messages AS (
-                SELECT DISTINCT ON (m.thread_id) m.thread_id, m.sender_id, m.body, m.created_at FROM messages m
-                WHERE m.thread_id IN (SELECT id FROM my_threads)
-                ORDER BY m.thread_id, m.created_at DESC, m.id DESC
-            ), dm_other_user AS (
-                SELECT p.thread_id, u.id AS other_id, u.name AS other_name FROM message_thread_participants p
-                JOIN app_users u ON u.id = p.user_id JOIN message_threads t ON t.id = p.thread_id
-                WHERE p.thread_id IN (SELECT id FROM my_threads) AND COALESCE(t.is_group, FALSE) = FALSE AND p.user_id <> %(me)s
-            )
-            SELECT
-                lm.thread_id, lm.sender_id, lm.body, lm.created_at,
-                mt.is_group, mt.subject, mt.created_by_id, mt.avatar_url,
-                dou.other_id, dou.other_name, dou.other_id as recipient_id,
-                (SELECT COUNT(*) FROM messages m2 WHERE m2.thread_id = lm.thread_id AND m2.sender_id <> %(me)s AND m2.read_at IS NULL) AS unread_count
-            FROM last_messages lm
-            JOIN my_threads mt ON mt.id = lm.thread_id
-            LEFT JOIN dm_other_user dou ON dou.thread_id = lm.thread_id
-            ORDER BY lm.created_at DESC
-            """,
-            {"me": employee_id},
-        )
+        cur.execute(THREADS_ALL_SQL, {"me": employee_id, "unread_cap": MESSAGES_UNREAD_CAP})
         rows = cur.fetchall() or []
         if not rows: return {"threads": []}
         thread_ids = [row["thread_id"] for row in rows]
         cur.execute("SELECT p.thread_id, u.id, u.name FROM message_thread_participants p JOIN app_users u ON u.id = p.user_id WHERE p.thread_id = ANY(%s) ORDER BY p.thread_id, u.name", (thread_ids,))
         participants_rows = cur.fetchall() or []
+        online = online_users(p_row["id"] for p_row in participants_rows)
         participants_map = {}
         for p_row in participants_rows:
             tid = p_row['thread_id']
             if tid not in participants_map: participants_map[tid] = []
-            participants_map[tid].append({"id": int(p_row["id"]), "name": p_row["name"]})
+            participants_map[tid].append({"id": int(p_row["id"]), "name": p_row["name"], "online": int(p_row["id"]) in online})
         threads = []
         for row in rows:
             row_data = dict(row)
@@ -290,9 +502,10 @@ def delete_thread(thread_id: str, employee_id: int = Query(...)):
             raise HTTPException(403, "Only the group admin can delete this group")
         if not thread_info['is_group'] and not is_participant_in_dm:
              raise HTTPException(403, "You cannot delete a DM you are not a part of")
+        recipients = _participant_ids(cur, thread_id)
         cur.execute("DELETE FROM messages WHERE thread_id=%s", (thread_id,))
         cur.execute("DELETE FROM message_thread_participants WHERE thread_id=%s", (thread_id,))
         cur.execute("DELETE FROM message_threads WHERE id=%s", (thread_id,))
         con.commit()
-    _broadcast("thread.deleted", {"thread_id": thread_id})
+    publish_to_users(recipients, "thread.deleted", {"thread_id": thread_id})
     return {"success": True}
\ No newline at end of file
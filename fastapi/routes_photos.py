@@ -1,15 +1,17 @@
 
 import time
-import json
-import re
 from typing import List, Optional, Dict, Any
 from uuid import UUID
-from fastapi import APIRouter, HTTPException, Query, Body, Depends
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Query, Body, Depends
 from pydantic import BaseModel
 import psycopg2.extras
 
 from config import HAVE_CLOUDINARY, CLOUDINARY_API_SECRET, CLOUDINARY_API_KEY, CLOUDINARY_CLOUD_NAME
 from db_utils import db, _uuid_list
+from photo_match import match_photos
+from cloudinary_cleanup import enqueue_cloudinary_deletes, process_cloudinary_deletes
+from photo_tags import suggest_tags as suggest_photo_tags, PHOTO_TOTAL_SQL
+from item_photos import STOCK_PHOTOS_JSON_SQL
 
 router = APIRouter(prefix="/photos", tags=["Photo Gallery"])
 
@@ -152,10 +154,9 @@ def search_photos(body: PhotoSearchBody):
         if tokens:
             text_parts = []
             for t in tokens:
-                # Search product name OR tags text
-                text_parts.append("(product_name ILIKE %s OR array_to_string(tags, ' ') ILIKE %s)")
-                params.append(f"%{t}%")
-                params.append(f"%{t}%")
+                # Search product name OR tags text (trigram-indexed, see photo_match.py)
+                text_parts.append("search_text LIKE %s")
+                params.append(f"%{t.lower()}%")
             where_clauses.append(f"({' AND '.join(text_parts)})")
 
     if body.grade:
@@ -173,52 +174,64 @@ def search_photos(body: PhotoSearchBody):
             where_clauses.append("tags @> %s::text[]")
             params.append(search_tags)
 
+    where_sql = ' AND '.join(where_clauses)
+    # Page and total in one statement. The total is a plain count (no window
+    # buffering every match), or the maintained one when nothing is filtered;
+    # the page walks the created_at index.
+    total_sql = PHOTO_TOTAL_SQL if not params else f"SELECT COUNT(*) AS n FROM stock_photos sp WHERE {where_sql}"
     sql = f"""
-        SELECT sp.id, sp.product_name, sp.grade, sp.tags, sp.urls, sp.cloudinary_ids, sp.created_at,
+        WITH total AS (
+            {total_sql}
+        ), page AS (
+            SELECT sp.id, sp.created_at
+            FROM stock_photos sp
+            WHERE {where_sql}
+            ORDER BY sp.created_at DESC, sp.id LIMIT %s OFFSET %s
+        )
+        SELECT t.n AS "__total", sp.id, sp.product_name, sp.grade, sp.tags, sp.urls, sp.cloudinary_ids, sp.created_at,
             sp.category_id, c.label as category_label, u.name as uploader_name
-        FROM stock_photos sp
+        FROM total t
+        LEFT JOIN (page pg JOIN stock_photos sp ON sp.id = pg.id) ON true
         LEFT JOIN categories c ON c.id = sp.category_id
         LEFT JOIN app_users u ON u.id = sp.created_by
-        WHERE {' AND '.join(where_clauses)}
-        ORDER BY sp.created_at DESC LIMIT %s OFFSET %s
+        ORDER BY pg.created_at DESC, pg.id
     """
-    params.append(body.limit)
-    params.append(body.offset)
 
     with db() as (con, cur):
-        cur.execute(sql, params)
+        cur.execute(sql, params + params + [body.limit, body.offset])
         rows = [dict(r) for r in cur.fetchall()]
-        cur.execute(f"SELECT COUNT(*) as total FROM stock_photos sp WHERE {' AND '.join(where_clauses)}", params[:-2]) 
-        total = cur.fetchone()['total']
+    total = rows[0].pop("__total") if rows else 0
+    rows = [r for r in rows if r["id"] is not None]
+    for row in rows:
+        row.pop("__total", None)
 
     return {"items": rows, "total": total}
 
 @router.delete("/{photo_id}")
-def delete_photo(photo_id: str):
+def delete_photo(photo_id: str, background: BackgroundTasks):
     if not HAVE_CLOUDINARY: raise HTTPException(503, "Cloudinary not configured")
-    import cloudinary.uploader
     with db() as (con, cur):
         cur.execute("SELECT cloudinary_ids FROM stock_photos WHERE id = %s", (photo_id,))
         row = cur.fetchone()
         if not row: raise HTTPException(404, "Photo not found")
+        cur.execute("UPDATE inventory_items SET stock_photo_id = NULL WHERE stock_photo_id = %s", (photo_id,))
         cur.execute("DELETE FROM stock_photos WHERE id = %s", (photo_id,))
-        c_ids = row.get('cloudinary_ids') or []
-        if c_ids:
-            try:
-                for cid in c_ids: cloudinary.uploader.destroy(cid)
-            except Exception: pass
+        # Images go through the outbox once this commits (cloudinary_cleanup.py)
+        queued = enqueue_cloudinary_deletes(cur, row.get('cloudinary_ids') or [])
+    if queued:
+        background.add_task(process_cloudinary_deletes)
     return {"ok": True}
 
 # --- Tags & Categories Helpers ---
 
 @router.get("/tags/suggest")
-def suggest_tags():
-    """Returns all unique tags used in the system (lowercase)."""
+def suggest_tags(
+    q: Optional[str] = Query(None, description="Only tags starting with this, most used first"),
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+):
+    """Returns unique tags used in the system (lowercase), from the tag dictionary (photo_tags.py)."""
     with db() as (con, cur):
-        # Return distinct lowercase tags to ensure clean suggestions
-        cur.execute("SELECT DISTINCT LOWER(unnest(tags)) as tag FROM stock_photos ORDER BY tag")
-        rows = cur.fetchall()
-        return [r['tag'] for r in rows if r['tag']]
+        return suggest_photo_tags(cur, q or "", limit)
 
 @router.get("/categories/counts")
 def get_category_counts():
@@ -230,20 +243,28 @@ def get_category_counts():
 def assign_photo_to_inventory(body: PhotoAssignBody):
     if not body.synergy_ids: return {"ok": True, "updated": 0}
     with db() as (con, cur):
-        cur.execute("SELECT id, urls, cloudinary_ids FROM stock_photos WHERE id = %s", (body.stock_photo_id,))
+        cur.execute("SELECT id FROM stock_photos WHERE id = %s", (body.stock_photo_id,))
         photo = cur.fetchone()
         if not photo: raise HTTPException(404, "Stock photo not found")
         
-        urls = photo.get("urls") or []
-        cids = photo.get("cloudinary_ids") or []
-        photo_objs = [{"url": u, "id": cids[i] if i < len(cids) else "", "is_stock": True, "stock_id": str(photo['id'])} for i, u in enumerate(urls)]
-        
-        where_clause = "synergy_id = ANY(%s)" if all(len(x) > 20 for x in body.synergy_ids) else "synergy_code = ANY(%s)"
-        sql = f"UPDATE inventory_items SET photos = %s::jsonb, stock_photo_id = %s WHERE {where_clause}"
+        # Items reference the stock photo; its images are resolved at read time (item_photos.py).
+        # 'replace' also drops the item's own photos. 'append' keeps them, and an item can
+        # reference one stock photo only, so a different one it already had is copied into
+        # its own photos first: it keeps showing both, as when links copied the images.
+        where_clause = "i.synergy_id = ANY(%(ids)s)" if all(len(x) > 20 for x in body.synergy_ids) else "i.synergy_code = ANY(%(ids)s)"
+        sql = f"UPDATE inventory_items i SET photos = NULL, stock_photo_id = %(photo)s WHERE {where_clause}"
         if body.mode != 'replace':
-             sql = f"UPDATE inventory_items SET photos = COALESCE(photos, '[]'::jsonb) || %s::jsonb, stock_photo_id = %s WHERE {where_clause}"
+            sql = f"""
+                UPDATE inventory_items i
+                   SET photos = CASE WHEN i.stock_photo_id IS NOT NULL AND i.stock_photo_id <> %(photo)s::uuid
+                                     THEN COALESCE(i.photos, '[]'::jsonb)
+                                          || (SELECT {STOCK_PHOTOS_JSON_SQL} FROM stock_photos b WHERE b.id = i.stock_photo_id)
+                                     ELSE i.photos END,
+                       stock_photo_id = %(photo)s
+                 WHERE {where_clause}
+            """
         
-        cur.execute(sql, (json.dumps(photo_objs), body.stock_photo_id, body.synergy_ids))
+        cur.execute(sql, {"photo": body.stock_photo_id, "ids": body.synergy_ids})
         updated = cur.rowcount
     return {"ok": True, "updated": updated}
 
@@ -254,79 +275,21 @@ def smart_match_photos(body: SmartMatchRequest):
     1. Name Similarity (Token overlap)
     2. Grade Matching (Bonus for exact grade match)
     3. Issue/Tag Matching (Extracts keywords from comments)
+    Candidates come from the indexed search_vector and are ranked in SQL (photo_match.py).
     """
-    
-    # 1. Normalize Inputs
-    search_tokens = set(re.findall(r'\w+', body.product_name.lower()))
-    
-    # Extract potential tags from tester comments (e.g., "Silver", "Space Gray", "Scratches")
-    # You can expand this "Issue Dictionary" over time
-    issue_keywords = []
-    if body.tester_comment:
-        comment_lower = body.tester_comment.lower()
-        common_tags = ["silver", "gray", "grey", "black", "white", "gold", "rose", "scratch", "dent", "cracked"]
-        issue_keywords = [t for t in common_tags if t in comment_lower]
-
     with db() as (con, cur):
-        # 2. Fetch Candidates (Broad Search)
-        # We fetch anything that shares the Category OR looks somewhat similar
-        sql = """
-            SELECT id, product_name, grade, tags, urls, category_id
-            FROM stock_photos
-            WHERE category_id = %s 
-               OR product_name ILIKE %s
-        """
-        # Create a loose search term (first 2 words of product name)
-        loose_name = " ".join(body.product_name.split()[:2]) + "%"
-        
-        cur.execute(sql, (body.category_id, loose_name))
-        candidates = cur.fetchall()
-
-        scored_results = []
-
-        for photo in candidates:
-            score = 0
-            p_name_tokens = set(re.findall(r'\w+', photo['product_name'].lower()))
-            
-            # A. Name Similarity Score (Jaccard-ish)
-            intersection = search_tokens.intersection(p_name_tokens)
-            score += len(intersection) * 10  # 10 points per matching word
-            
-            # B. Grade Score
-            # Perfect match = big bonus. 
-            # "A" photos are okay for "B" items, but not vice versa usually.
-            p_grade = (photo['grade'] or "").upper()
-            i_grade = (body.grade or "").upper()
-            
-            if p_grade == i_grade:
-                score += 20
-            elif p_grade == 'A' and i_grade == 'B':
-                score += 10 # Allow using Grade A photos for Grade B items
-            
-            # C. Tag/Comment Matching
-            # If stock photo has tags that match keywords found in tester comments (e.g. "Silver")
-            p_tags = set(t.lower() for t in (photo['tags'] or []))
-            for k in issue_keywords:
-                if k in p_tags:
-                    score += 15 # Bonus for matching color/condition tags
-            
-            # D. Penalties
-            # If photo is "Rose Gold" but item text says "Silver", massive penalty
-            for tag in p_tags:
-                if tag in ["silver", "gray", "grey", "gold", "rose"] and tag not in issue_keywords and len(issue_keywords) > 0:
-                     # Only penalize if we actually FOUND a color in the tester notes to contradict it
-                     pass 
-
-            scored_results.append({
-                **dict(photo),
-                "score": score,
-                "match_reason": f"Matched {len(intersection)} words" + (", Grade Match" if p_grade == i_grade else "")
-            })
-
-        # 3. Sort by Score
-        scored_results.sort(key=lambda x: x['score'], reverse=True)
-        
-        return {
-            "best_match": scored_results[0] if scored_results else None,
-            "candidates": scored_results[:5] # Return top 5
-        }
\ No newline at end of file
+        matches = match_photos(cur, body.product_name, body.grade, body.tester_comment, body.category_id)
+
+    i_grade = (body.grade or "").upper()
+    scored_results = [
+        {
+            "id": m["id"], "product_name": m["product_name"], "grade": m["grade"], "tags": m["tags"],
+            "urls": m["urls"], "category_id": m["category_id"], "score": m["score"],
+            "match_reason": f"Matched {m['name_hits']} words" + (", Grade Match" if (m["grade"] or "").upper() == i_grade else ""),
+        }
+        for m in matches
+    ]
+    return {
+        "best_match": scored_results[0] if scored_results else None,
+        "candidates": scored_results
+    }
\ No newline at end of file
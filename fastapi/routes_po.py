@@ -4,15 +4,19 @@ import json
 from uuid import UUID
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, Query, Body, Path, Header
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Body, Path, Header
+from fastapi.responses import JSONResponse, StreamingResponse
 import psycopg2.extras
 from pydantic import BaseModel
 from ebay_utils import _summarize_sales_for_legacy_id 
 
-from db_utils import db, _uuid_list, _resolve_po_id, is_uuid_like, to_num
+from fast_json import FastJSONResponse
+from db_utils import db, _uuid_list, _resolve_po_id, is_uuid_like, to_num, copy_stream, iter_rows, stream_json
 
-from pubsub_utils import _broadcast
+from inventory_read import pending_row_changes, publish_row_changes
+from etags import resource_version, make_etag, etag_matches, not_modified, cache_headers
+from auth_cache import get_user_auth
+from photo_match import auto_link_po
 
 router = APIRouter()
 
@@ -40,23 +44,123 @@ class BulkUpdatePayload(BaseModel):
     line_ids: List[str]
     updates: LineUpdate   
 
-BROADCAST_SQL = """
-    SELECT i.synergy_code AS "synergyId", COALESCE(pl.product_name_raw, '') AS "productName",
-           i.category_id AS "categoryId", i.status AS "status",
-           COALESCE(i.cost_unit, 0) AS "purchaseCost", COALESCE(pl.qty, 1) AS "qty",
-           COALESCE(i.msrp, pl.msrp, 0) AS "msrp",
-           i.purchase_order_id AS "poId", i.po_line_id AS "lineId",
-           i.grade AS "grade", i.tested_by AS "testedBy", i.tested_date AS "testedDate",
-           i.tester_comment AS "testerComment", i.posted_at AS "postedAt",
-           i.posted_by::text AS "postedBy", i.ebay_item_url AS "ebayItemUrl",
-           COALESCE(i.specs, '{}'::jsonb) AS "specs",
-           COALESCE(i.price, 0) AS "price", COALESCE(i.ebay_price, 0) AS "ebayPrice",
-           c.label AS "categoryLabel", c.prefix AS "categoryPrefix",
-           i.last_printed_at as "lastPrintedAt"
-    FROM public.inventory_items i
+# --- Hot SQL (also registered in plan_check.py) ---
+# Page of POs first, then per-PO aggregates through the purchase_order_id
+# indexes, instead of grouping every line and item in the database.
+PO_SUMMARIES_SQL = """
+    SELECT 
+        p.id, 
+        p.po_number, 
+        v.name AS vendor_name, 
+        p.created_at,
+        COALESCE(s.line_count, 0) AS line_count,
+        COALESCE(s.minted_any, false) AS minted_any,
+        COALESCE(s.minted_all, false) AS minted_all,
+        COALESCE(s.total_lines_qty, 0) AS total_lines_qty,
+        COALESCE(s.est_cost, 0) AS est_cost,
+        COALESCE(inv.posted_count, 0) as posted_count,
+        COALESCE(inv.inventory_count, 0) as inventory_count
+    FROM (
+        SELECT id, po_number, vendor_id, created_at FROM purchase_orders
+        ORDER BY created_at DESC NULLS LAST, id DESC LIMIT 200
+    ) p
+    LEFT JOIN vendors v ON v.id = p.vendor_id
+    LEFT JOIN LATERAL (
+        SELECT
+            COUNT(*) AS line_count,
+            COALESCE(SUM(qty), 0) AS total_lines_qty,
+            COALESCE(SUM(qty * unit_cost), 0) AS est_cost,
+            BOOL_OR(synergy_id IS NOT NULL) AS minted_any,
+            BOOL_AND(synergy_id IS NOT NULL) AS minted_all
+        FROM po_lines
+        WHERE purchase_order_id = p.id
+    ) s ON true
+    LEFT JOIN LATERAL (
+        SELECT
+            COUNT(*) as inventory_count,
+            COUNT(*) FILTER (WHERE posted_at IS NOT NULL OR (ebay_item_url IS NOT NULL AND ebay_item_url <> '')) as posted_count
+        FROM inventory_items
+        WHERE purchase_order_id = p.id
+    ) inv ON true
+    ORDER BY p.created_at DESC NULLS LAST, p.id DESC
+"""
+
+# Weekly pulse reads the trigger-maintained daily_sales_facts (sales_facts.py);
+# raw sold rows are only touched through half-open sold_at ranges.
+WEEKLY_PULSE_TOTALS_SQL = """
+    SELECT 
+        COALESCE(SUM(units), 0) as total_items,
+        COALESCE(SUM(revenue), 0) as total_revenue
+    FROM daily_sales_facts
+    WHERE day >= sales_today() - 6 AND day < sales_today() + 1
+"""
+
+WEEKLY_PULSE_CHART_SQL = """
+    SELECT 
+        TO_CHAR(day, 'Mon DD') as day_label,
+        TO_CHAR(day, 'YYYY-MM-DD') as date_sort,
+        SUM(revenue) as daily_rev
+    FROM daily_sales_facts
+    WHERE day >= sales_today() - 6 AND day < sales_today() + 1
+    GROUP BY day
+    HAVING SUM(units) <> 0
+    ORDER BY day ASC
+"""
+
+WEEKLY_PULSE_TOP_ITEMS_SQL = """
+    SELECT 
+        pl.product_name_raw as name,
+        COUNT(*) as qty,
+        SUM(i.sold_price) as rev,
+        MAX(i.ebay_thumbnail) as thumbnail
+    FROM inventory_items i
+    JOIN po_lines pl ON i.po_line_id = pl.id
+    WHERE i.status = 'SOLD' 
+      AND i.sold_at >= sales_day_start(sales_today() - 29) -- Widened window for 'Top Movers' context
+      AND i.sold_at < sales_day_start(sales_today() + 1)
+    GROUP BY pl.product_name_raw
+    ORDER BY rev DESC
+    LIMIT 4
+"""
+
+DAILY_SALES_TOTALS_SQL = """
+    SELECT 
+        COALESCE(SUM(units), 0) as total_items,
+        COALESCE(SUM(revenue), 0) as total_revenue
+    FROM daily_sales_facts
+    WHERE day = sales_today()
+"""
+
+DAILY_SALES_TOP_POS_SQL = """
+    SELECT 
+        p.id as po_id,
+        p.po_number,
+        COUNT(*) as items_sold,
+        COALESCE(SUM(COALESCE(i.sold_price, i.ebay_price, i.price, 0)), 0) as revenue
+    FROM inventory_items i
+    JOIN purchase_orders p ON p.id = i.purchase_order_id
+    WHERE i.status = 'SOLD' 
+      AND i.sold_at >= sales_day_start(sales_today())
+      AND i.sold_at < sales_day_start(sales_today() + 1)
+    GROUP BY p.id, p.po_number
+    ORDER BY revenue DESC
+    LIMIT 5
+"""
+
+DAILY_SALES_RECENT_SQL = """
+    SELECT 
+        COALESCE(pl.product_name_raw, 'Unknown Item') as title,
+        COALESCE(i.sold_price, i.ebay_price, i.price, 0) as amount,
+        to_char(i.sold_at, 'HH12:MI AM') as time,
+        p.po_number
+    FROM inventory_items i
     LEFT JOIN po_lines pl ON pl.id = i.po_line_id
-    LEFT JOIN categories c ON c.id = i.category_id
-    WHERE pl.id = %s
+    LEFT JOIN purchase_orders p ON p.id = i.purchase_order_id
+    WHERE i.status = 'SOLD' 
+      AND i.sold_at >= sales_day_start(sales_today())
+      AND i.sold_at < sales_day_start(sales_today() + 1)
+    ORDER BY i.sold_at DESC
+    LIMIT 50
 """
 
 def require_manager_role(x_user_id: int = Header(None, alias="X-User-ID")):
@@ -73,28 +177,34 @@ def require_manager_role(x_user_id: int = Header(None, alias="X-User-ID")):
     if not x_user_id:
         raise HTTPException(status_code=401, detail="Missing User Identity")
         
-    with db() as (con, cur):
-        cur.execute("SELECT roles FROM app_users WHERE id = %s", (x_user_id,))
-        row = cur.fetchone()
-        
-        if not row:
-            if is_debug:
-                return x_user_id
-            raise HTTPException(status_code=403, detail="User not found")
-        
-        user_roles = [r.lower() for r in (row.get('roles') or [])]
-        
-        if "manager" not in user_roles and "admin" not in user_roles:
-            if is_debug:
-                return x_user_id
-            raise HTTPException(status_code=403, detail="Insufficient Permissions")
+    user = get_user_auth(x_user_id)
+
+    if not user:
+        if is_debug:
+            return x_user_id
+        raise HTTPException(status_code=403, detail="User not found")
+
+    if "manager" not in user["roles"] and "admin" not in user["roles"]:
+        if is_debug:
+            return x_user_id
+        raise HTTPException(status_code=403, detail="Insufficient Permissions")
             
     return x_user_id
 
 # === SNAPSHOT: summary + first page ===
 @router.get("/pos/{po_id}/snapshot")
-def po_snapshot(po_id: UUID, limit: int = Query(200, ge=50, le=1000), offset: int = 0) -> Dict[str, Any]:
+def po_snapshot(
+    po_id: UUID,
+    limit: int = Query(200, ge=50, le=1000),
+    offset: int = 0,
+    if_none_match: Optional[str] = Header(None),
+) -> Dict[str, Any]:
     with db() as (con, cur):
+        # Pollers that already hold this page get a 304 off one key lookup.
+        etag = make_etag("po", po_id, resource_version(cur, f"po:{po_id}"), limit, offset)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
+
         cur.execute("""
             SELECT
               COUNT(*)::int AS line_count,
@@ -116,9 +226,10 @@ def po_snapshot(po_id: UUID, limit: int = Query(200, ge=50, le=1000), offset: in
             FROM po_lines WHERE purchase_order_id = %s
             ORDER BY id ASC LIMIT %s OFFSET %s
         """, (str(po_id), limit, offset))
-        rows = [dict(r) for r in cur.fetchall()]
+        rows = cur.fetchall()
 
-        return {"summary": summary, "page": {"limit": limit, "offset": offset, "rows": rows}}
+        return FastJSONResponse({"summary": summary, "page": {"limit": limit, "offset": offset, "rows": rows}},
+                                headers=cache_headers(etag))
 
 # --- PO CRUD ---
 @router.post("/purchase_orders", status_code=201)
@@ -195,42 +306,7 @@ def po_summaries(
     _auth: int = Depends(require_manager_role) 
 ):
     with db() as (con, cur):
-        cur.execute("""
-            SELECT 
-                p.id, 
-                p.po_number, 
-                v.name AS vendor_name, 
-                p.created_at,
-                COALESCE(s.line_count, 0) AS line_count,
-                COALESCE(s.minted_any, false) AS minted_any,
-                COALESCE(s.minted_all, false) AS minted_all,
-                COALESCE(s.total_lines_qty, 0) AS total_lines_qty,
-                COALESCE(s.est_cost, 0) AS est_cost,
-                COALESCE(inv.posted_count, 0) as posted_count,
-                COALESCE(inv.inventory_count, 0) as inventory_count
-            FROM purchase_orders p
-            LEFT JOIN vendors v ON v.id = p.vendor_id
-            LEFT JOIN (
-                SELECT
-                    purchase_order_id,
-                    COUNT(*) AS line_count,
-                    COALESCE(SUM(qty), 0) AS total_lines_qty,
-                    COALESCE(SUM(qty * unit_cost), 0) AS est_cost,
-                    BOOL_OR(synergy_id IS NOT NULL) AS minted_any,
-                    BOOL_AND(synergy_id IS NOT NULL) AS minted_all
-                FROM po_lines
-                GROUP BY purchase_order_id
-            ) s ON s.purchase_order_id = p.id
-            LEFT JOIN (
-                SELECT
-                    purchase_order_id,
-                    COUNT(*) as inventory_count,
-                    COUNT(*) FILTER (WHERE posted_at IS NOT NULL OR (ebay_item_url IS NOT NULL AND ebay_item_url <> '')) as posted_count
-                FROM inventory_items
-                GROUP BY purchase_order_id
-            ) inv ON inv.purchase_order_id = p.id
-            ORDER BY p.created_at DESC NULLS LAST, p.id DESC LIMIT 200
-        """)
+        cur.execute(PO_SUMMARIES_SQL)
         return [dict(r) for r in cur.fetchall()]
 
 @router.get("/pos/{po_id}/summary")
@@ -259,27 +335,68 @@ def po_summary(po_id: str):
         return {**po, **lines_agg, "inventory_counts": inv_agg}
 
 # --- PO Lines ---
+PO_LINES_SQL = """
+    SELECT
+        id,
+        product_name_raw,
+        upc,
+        asin,
+        qty,
+        unit_cost,
+        msrp,
+        synergy_id,
+        category_guess AS category_id{raw}
+    FROM po_lines
+    WHERE purchase_order_id = %s
+    ORDER BY id ASC
+"""
+
 @router.get("/pos/{po_id}/lines")
-def get_po_lines(po_id: UUID):
+def get_po_lines(
+    po_id: UUID,
+    include_raw: bool = Query(True, description="Include the raw_json import blob"),
+    stream: Optional[str] = Query(None, pattern="^(ndjson|json)$"),
+):
+    """
+    All lines on a PO. `stream=json` keeps the {"rows": [...]} shape but
+    encodes it from a server-side cursor; `stream=ndjson` emits one line per row.
+    """
+    sql = PO_LINES_SQL.format(raw=", raw_json" if include_raw else "")
+    params = (str(po_id),)
+    if stream:
+        return StreamingResponse(
+            stream_json(iter_rows(sql, params), stream, wrap_key="rows"),
+            media_type="application/x-ndjson" if stream == "ndjson" else "application/json",
+        )
     with db() as (con, cur):
-        # Added raw_json to SELECT
-        cur.execute("""
-            SELECT
-                id,
-                product_name_raw,
-                upc,
-                asin,
-                qty,
-                unit_cost,
-                msrp,
-                synergy_id,
-                category_guess AS category_id,
-                raw_json 
-            FROM po_lines
-            WHERE purchase_order_id = %s
-            ORDER BY id ASC
-        """, (str(po_id),))
-        return {"rows": [dict(r) for r in cur.fetchall()]}
+        cur.execute(sql, params)
+        return FastJSONResponse({"rows": cur.fetchall()})
+
+PO_LINES_EXPORT_SQL = """
+    SELECT
+        pl.id, p.po_number, pl.synergy_id, pl.product_name_raw, pl.upc, pl.asin,
+        pl.qty, pl.unit_cost, pl.msrp, c.label AS category
+    FROM po_lines pl
+    JOIN purchase_orders p ON p.id = pl.purchase_order_id
+    LEFT JOIN categories c ON c.id = pl.category_guess
+    WHERE pl.purchase_order_id = %(po_id)s
+    ORDER BY pl.id
+"""
+
+@router.get("/pos/{po_id}/lines/export")
+def export_po_lines(
+    po_id: UUID,
+    format: str = Query("csv", pattern="^(csv|csv.gz)$"),
+    _user: int = Depends(require_manager_role),
+):
+    """Stream a PO's lines as CSV (or gzip CSV) via COPY."""
+    gz = format == "csv.gz"
+    filename = f"po_{po_id}_lines.csv" + (".gz" if gz else "")
+    return StreamingResponse(
+        copy_stream(PO_LINES_EXPORT_SQL, {"po_id": str(po_id)}, gzip=gz),
+        media_type="application/gzip" if gz else "text/csv; charset=utf-8",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 @router.post("/pos/{po_id}/lines")
 def create_po_line(po_id: str, body: Dict[str, Any] = Body(...)):
@@ -355,29 +472,53 @@ def patch_po_line(line_id: str, body: LineUpdate):
                     tuple(inv_vals),
                 )
 
-        cur.execute(BROADCAST_SQL, (line_id,))
-        affected_items = cur.fetchall()
+        txid = pending_row_changes(cur)
         con.commit()
 
-        for item in affected_items:
-            _broadcast("row.upserted", dict(item))
-
-        return dict(updated_row)
+    publish_row_changes(txid)
+    return dict(updated_row)
     
 @router.delete("/pos/lines/{line_id}")
 def delete_po_line(line_id: str):
     with db() as (con, cur):
         cur.execute("DELETE FROM inventory_items WHERE po_line_id = %s", (line_id,))
-        
-        _broadcast("row.bulk_upserted", {"reason": "deleted"})
-        
         cur.execute("DELETE FROM po_lines WHERE id = %s", (line_id,))
+        txid = pending_row_changes(cur)
+    publish_row_changes(txid)
     return {"ok": True}
 
+ENRICH_FROM_EBAY_SQL = """
+    UPDATE inventory_items i
+       SET ebay_price     = COALESCE(%(price)s, i.ebay_price),
+           ebay_thumbnail = COALESCE(%(thumbnail)s, i.ebay_thumbnail),
+           status         = CASE WHEN %(ended)s THEN 'SOLD' ELSE i.status END,
+           tested_date    = CASE WHEN %(ended)s THEN COALESCE(i.tested_date, NOW()) ELSE i.tested_date END,
+           posted_at      = CASE WHEN %(ended)s THEN COALESCE(i.posted_at, NOW()) ELSE i.posted_at END,
+           sold_at        = CASE WHEN %(ended)s THEN COALESCE(i.sold_at, NOW()) ELSE i.sold_at END
+     WHERE i.po_line_id = ANY(%(line_ids)s::uuid[])
+       AND i.ebay_item_url = %(url)s
+"""
+
+def enrich_lines_from_ebay(line_ids: List[str], legacy_id: str, url: str):
+    """
+    Background step of bulk_update_lines: look the listing up on eBay outside
+    any transaction, then write price / thumbnail / SOLD back and broadcast.
+    Rows whose URL was changed again in the meantime are left alone.
+    """
+    from ebay_utils import browse_listing_state
+
+    state = browse_listing_state(legacy_id)
+    if not state:
+        return
+    with db() as (con, cur):
+        cur.execute(ENRICH_FROM_EBAY_SQL, {**state, "line_ids": line_ids, "url": url})
+        txid = pending_row_changes(cur) if cur.rowcount else None
+    publish_row_changes(txid)
+
 @router.post("/pos/lines/bulk_update")
-def bulk_update_lines(payload: BulkUpdatePayload):
+def bulk_update_lines(payload: BulkUpdatePayload, background_tasks: BackgroundTasks):
     # Local imports to ensure dependencies exist
-    from ebay_utils import _parse_ebay_legacy_id, _ebay_app_access_token, session, EBAY_MARKETPLACE_ID
+    from ebay_utils import _parse_ebay_legacy_id
     
     line_ids = _uuid_list(payload.line_ids)
     if not line_ids: return {"updated": 0}
@@ -420,41 +561,17 @@ def bulk_update_lines(payload: BulkUpdatePayload):
             new_url = inv_updates.get("ebay_item_url")
             
             new_thumbnail = None
-            
+
             if new_url:
                 # 1. Try parsing as URL
                 legacy_id = _parse_ebay_legacy_id(new_url)
                 # 2. Fallback: If parsing failed but string is numeric, treat as raw ID
                 if not legacy_id and str(new_url).strip().isdigit():
                     legacy_id = str(new_url).strip()
-
+                # Price / thumbnail / sold state come from eBay after commit, so
+                # the row locks taken below are never held across that call.
                 if legacy_id:
-                    try:
-                        token = _ebay_app_access_token()
-                        r = session.get(
-                            "https://api.ebay.com/buy/browse/v1/item/get_item_by_legacy_id",
-                            params={"legacy_item_id": legacy_id},
-                            headers={
-                                "Authorization": f"Bearer {token}",
-                                "Accept": "application/json",
-                                "X-EBAY-C-MARKETPLACE-ID": EBAY_MARKETPLACE_ID
-                            },
-                            timeout=5
-                        )
-                        if r.status_code == 200:
-                            data = r.json()
-                            
-                            val = (data.get("price") or {}).get("value")
-                            if val: new_price = float(val)
-                            
-                            img = (data.get("image") or {}).get("imageUrl")
-                            if img: new_thumbnail = img
-                                
-                            avail = ((data.get("availability") or {}).get("status") or "").upper()
-                            if avail in ["OUT_OF_STOCK", "UNAVAILABLE", "ENDED"]:
-                                new_status = "SOLD"
-                    except Exception as e:
-                        print(f"[Bulk Update] eBay sync error: {e}")
+                    background_tasks.add_task(enrich_lines_from_ebay, line_ids, legacy_id, new_url)
 
             upsert_sql = """
             INSERT INTO inventory_items (
@@ -508,10 +625,11 @@ def bulk_update_lines(payload: BulkUpdatePayload):
             inv_count = cur.rowcount
             if count == 0: count = inv_count
 
-        if count > 0:
-            _broadcast("row.bulk_upserted", {"count": count})
+        txid = pending_row_changes(cur) if count > 0 else None
+
+    publish_row_changes(txid)
+    return {"updated": count, "ebayEnrichmentQueued": bool(background_tasks.tasks)}
 
-        return {"updated": count}
 @router.post("/pos/lines/bulk_category")
 def bulk_set_category(payload: dict = Body(...)):
     raw_ids = payload.get("line_ids") or []
@@ -548,10 +666,9 @@ def bulk_set_category(payload: dict = Body(...)):
             (new_category_id, ids_to_change),
         )
         updated_count = cur.rowcount
-        
-        if updated_count > 0:
-            _broadcast("row.bulk_upserted", {"count": updated_count})
+        txid = pending_row_changes(cur) if updated_count > 0 else None
 
+    publish_row_changes(txid)
     return {"updated": updated_count}
 
 # --- PO Groups ---
@@ -684,6 +801,24 @@ def unified_po_profit(po_ref: str):
 
         return final_payload
 
+@router.post("/pos/{po_ref}/auto-link-photos")
+def auto_link_po_photos(po_ref: str, overwrite: bool = Query(False, description="Relink items that already have a stock photo")):
+    """Link the best confident stock photo to every item of a PO in one statement (see photo_match.py)."""
+    with db() as (con, cur):
+        po_id = _resolve_po_id(cur, po_ref)
+        linked = auto_link_po(cur, po_id, overwrite=overwrite)
+        txid = pending_row_changes(cur)
+    publish_row_changes(txid)
+    return {
+        "ok": True,
+        "linked": len(linked),
+        "items": [
+            {"synergy_code": r["synergy_code"], "stock_photo_id": str(r["stock_photo_id"]),
+             "linked_to": r["product_name"], "score": r["score"]}
+            for r in linked
+        ],
+    }
+
 @router.post("/pos/{po_id}/reconcile-sales")
 def reconcile_po_sales(po_id: str):
     """
@@ -882,52 +1017,19 @@ def analytics_daily_sales(
     _auth: int = Depends(require_manager_role)
 ):
     with db() as (con, cur):
-        # 1. Totals for "Today" (UTC/Server Time)
-        cur.execute("""
-            SELECT 
-                COUNT(*) as total_items,
-                COALESCE(SUM(COALESCE(sold_price, ebay_price, price, 0)), 0) as total_revenue
-            FROM inventory_items 
-            WHERE status = 'SOLD' 
-              AND sold_at::date = CURRENT_DATE
-        """)
+        # 1. Totals for "Today" (SALES_TIMEZONE calendar day)
+        cur.execute(DAILY_SALES_TOTALS_SQL)
         totals = cur.fetchone()
         
         if not totals:
             totals = {"total_items": 0, "total_revenue": 0}
 
         # 2. Top POs
-        cur.execute("""
-            SELECT 
-                p.id as po_id,
-                p.po_number,
-                COUNT(*) as items_sold,
-                COALESCE(SUM(COALESCE(i.sold_price, i.ebay_price, i.price, 0)), 0) as revenue
-            FROM inventory_items i
-            JOIN purchase_orders p ON p.id = i.purchase_order_id
-            WHERE i.status = 'SOLD' 
-              AND i.sold_at::date = CURRENT_DATE
-            GROUP BY p.id, p.po_number
-            ORDER BY revenue DESC
-            LIMIT 5
-        """)
+        cur.execute(DAILY_SALES_TOP_POS_SQL)
         top_pos = [dict(r) for r in cur.fetchall()]
 
         # 3. Recent Sales Feed
-        cur.execute("""
-            SELECT 
-                COALESCE(pl.product_name_raw, 'Unknown Item') as title,
-                COALESCE(i.sold_price, i.ebay_price, i.price, 0) as amount,
-                to_char(i.sold_at, 'HH12:MI AM') as time,
-                p.po_number
-            FROM inventory_items i
-            LEFT JOIN po_lines pl ON pl.id = i.po_line_id
-            LEFT JOIN purchase_orders p ON p.id = i.purchase_order_id
-            WHERE i.status = 'SOLD' 
-              AND i.sold_at::date = CURRENT_DATE
-            ORDER BY i.sold_at DESC
-            LIMIT 50
-        """)
+        cur.execute(DAILY_SALES_RECENT_SQL)
         recent_sales = [dict(r) for r in cur.fetchall()]
 
         return {
@@ -981,46 +1083,16 @@ def run_global_ebay_sync():
 def analytics_weekly_pulse(_auth: int = Depends(require_manager_role)):
     with db() as (con, cur):
         # 1. Weekly Totals
-        cur.execute("""
-            SELECT 
-                COUNT(*) as total_items,
-                COALESCE(SUM(sold_price), 0) as total_revenue
-            FROM inventory_items 
-            WHERE status = 'SOLD' 
-              AND sold_at >= CURRENT_DATE - INTERVAL '6 days'
-        """)
+        cur.execute(WEEKLY_PULSE_TOTALS_SQL)
         totals = cur.fetchone()
 
         # 2. Daily Breakdown (Ensuring all 7 days are represented is better done in frontend or complex SQL, keeping simple here)
-        cur.execute("""
-            SELECT 
-                TO_CHAR(sold_at, 'Mon DD') as day_label,
-                TO_CHAR(sold_at, 'YYYY-MM-DD') as date_sort,
-                SUM(sold_price) as daily_rev
-            FROM inventory_items
-            WHERE status = 'SOLD' 
-              AND sold_at >= CURRENT_DATE - INTERVAL '6 days'
-            GROUP BY 1, 2
-            ORDER BY 2 ASC
-        """)
+        cur.execute(WEEKLY_PULSE_CHART_SQL)
         chart_data = [dict(r) for r in cur.fetchall()]
 
         # 3. Top Sellers (Now with Image!)
         # We use MAX(ebay_thumbnail) to pick one image for the product group
-        cur.execute("""
-            SELECT 
-                pl.product_name_raw as name,
-                COUNT(*) as qty,
-                SUM(i.sold_price) as rev,
-                MAX(i.ebay_thumbnail) as thumbnail
-            FROM inventory_items i
-            JOIN po_lines pl ON i.po_line_id = pl.id
-            WHERE i.status = 'SOLD' 
-              AND i.sold_at >= CURRENT_DATE - INTERVAL '30 days' -- Widened window for 'Top Movers' context
-            GROUP BY pl.product_name_raw
-            ORDER BY rev DESC
-            LIMIT 4
-        """)
+        cur.execute(WEEKLY_PULSE_TOP_ITEMS_SQL)
         top_items = [dict(r) for r in cur.fetchall()]
 
         return {
@@ -613,6 +613,17 @@ def prefix_set(prefix: str, body: Dict[str, Any] = Body(...)):
 
         return {"ok": True, "next": nxt}
     
+# --- Hot SQL (also registered in plan_check.py) ---
+SYNERGY_OVERVIEW_STATS_SQL = """
+    SELECT
+      prefix,
+      COUNT(*) FILTER (WHERE event_type = 'mint') AS minted_count,
+      MAX(seq)  FILTER (WHERE event_type = 'mint') AS max_minted_seq,
+      MAX(created_at) FILTER (WHERE event_type = 'mint') AS last_minted_at
+    FROM synergy_id_events
+    GROUP BY prefix
+"""
+
 @router.get("/synergy-id/overview")
 def synergy_id_overview():
     """
@@ -632,17 +643,7 @@ def synergy_id_overview():
         by_prefix = {row["prefix"]: row for row in prefix_rows}
 
         # 2) Aggregated mint stats from the audit log
-        cur.execute(
-            """
-            SELECT
-              prefix,
-              COUNT(*) FILTER (WHERE event_type = 'mint') AS minted_count,
-              MAX(seq)  FILTER (WHERE event_type = 'mint') AS max_minted_seq,
-              MAX(created_at) FILTER (WHERE event_type = 'mint') AS last_minted_at
-            FROM synergy_id_events
-            GROUP BY prefix
-            """
-        )
+        cur.execute(SYNERGY_OVERVIEW_STATS_SQL)
         stats_rows = cur.fetchall() or []
         stats_by_prefix = {row["prefix"]: row for row in stats_rows}
 
@@ -0,0 +1,308 @@
+# sales_facts.py
+"""
+Pre-aggregated sales: one daily_sales_facts row per (day, category, channel)
+with units, revenue, cost and fees.
+
+Statement triggers on inventory_items add the net contribution of every
+write that touches a sold item (status 'SOLD' with a sold_at), so marking an
+item sold, correcting its price or un-selling it all keep the facts exact.
+Sold items fall back to their PO line's category and cost, so po_lines has
+triggers too: editing a line's unit_cost / category_guess, or deleting the
+line, moves its sold items' contribution to the new values.
+reconcile_sales_facts() recomputes recent days on a schedule, logs any drift
+and rewrites from the first drifted day.
+Days are calendar days in SALES_TIMEZONE (default: the database's TimeZone),
+fixed when ensure_sales_facts() installs the functions. sales_today() and
+sales_day_start(day) give the matching bounds for half-open range filters
+on sold_at.
+
+Revenue is COALESCE(sold_price, ebay_price, price); cost prefers the item's
+cost_unit over the PO line's unit_cost. There is no fee column, so eBay fees
+are estimated at EBAY_FEE_RATE of revenue; store sales carry none.
+
+    python sales_facts.py --backfill                 # everything
+    python sales_facts.py --backfill --since 2024-01-01
+    python sales_facts.py --reconcile                # check, log and fix drift
+"""
+import os
+import argparse
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from db_utils import db
+
+log = logging.getLogger(__name__)
+
+SALES_TIMEZONE = os.getenv("SALES_TIMEZONE")
+EBAY_FEE_RATE = float(os.getenv("EBAY_FEE_RATE", "0.1325"))
+SALES_FACTS_RECONCILE_HOURS = float(os.getenv("SALES_FACTS_RECONCILE_HOURS", "6"))
+# Days back the scheduled reconcile checks (0 = all of history).
+SALES_FACTS_RECONCILE_DAYS = int(os.getenv("SALES_FACTS_RECONCILE_DAYS", "400"))
+
+_FACTS_DDL = """
+CREATE TABLE IF NOT EXISTS daily_sales_facts (
+  day         date NOT NULL,
+  category_id uuid,
+  channel     text NOT NULL,
+  units       bigint NOT NULL DEFAULT 0,
+  revenue     numeric(14, 2) NOT NULL DEFAULT 0,
+  cost        numeric(14, 2) NOT NULL DEFAULT 0,
+  fees        numeric(14, 2) NOT NULL DEFAULT 0,
+  CONSTRAINT daily_sales_facts_key UNIQUE NULLS NOT DISTINCT (day, category_id, channel)
+);
+CREATE INDEX IF NOT EXISTS inventory_items_sold_at_idx ON public.inventory_items (sold_at) WHERE status = 'SOLD';
+CREATE INDEX IF NOT EXISTS inventory_items_sold_line_idx ON public.inventory_items (po_line_id) WHERE status = 'SOLD';
+"""
+
+# Per-item contribution of a sold row `i`, resolved against the PO lines in
+# `lines`; `d` is +1 / -1. An inner join limits it to items of those lines.
+_CONTRIB = """
+    SELECT (i.sold_at AT TIME ZONE {tz})::date AS day,
+           COALESCE(i.category_id, pl.category_guess) AS category_id,
+           CASE WHEN i.ebay_item_id IS NOT NULL OR COALESCE(i.ebay_item_url, '') <> '' THEN 'ebay' ELSE 'store' END AS channel,
+           {d} AS d,
+           COALESCE(i.sold_price, i.ebay_price, i.price, 0) AS revenue,
+           COALESCE(NULLIF(i.cost_unit, 0), pl.unit_cost, 0) AS cost
+    FROM {src} i
+    {join} JOIN {lines} pl ON pl.id = i.po_line_id
+    WHERE i.status = 'SOLD' AND i.sold_at IS NOT NULL
+"""
+
+
+def _contrib(tz: str, d: str, src: str, lines: str = "po_lines", join: str = "LEFT") -> str:
+    return _CONTRIB.format(tz=tz, d=d, src=src, lines=lines, join=join)
+
+
+
+_APPLY = """
+    INSERT INTO daily_sales_facts AS f (day, category_id, channel, units, revenue, cost, fees)
+    SELECT day, category_id, channel, SUM(d), SUM(d * revenue), SUM(d * cost),
+           COALESCE(SUM(d * revenue) FILTER (WHERE channel = 'ebay') * {fee_rate}, 0)
+      FROM ({src}) s
+     GROUP BY day, category_id, channel
+    HAVING SUM(d) <> 0 OR SUM(d * revenue) <> 0 OR SUM(d * cost) <> 0
+     ORDER BY day, category_id, channel
+    ON CONFLICT ON CONSTRAINT daily_sales_facts_key DO UPDATE
+       SET units = f.units + EXCLUDED.units,
+           revenue = f.revenue + EXCLUDED.revenue,
+           cost = f.cost + EXCLUDED.cost,
+           fees = f.fees + EXCLUDED.fees;
+"""
+
+# Facts that differ from a recount over the same days.
+_DRIFT_SQL = """
+WITH truth AS (
+  SELECT day, category_id, channel, COUNT(*) AS units, SUM(revenue) AS revenue, SUM(cost) AS cost
+  FROM ({src}) s
+  WHERE day >= %(since)s
+  GROUP BY day, category_id, channel
+), facts AS (
+  SELECT day, category_id, channel, units, revenue, cost FROM daily_sales_facts WHERE day >= %(since)s
+)
+SELECT COALESCE(t.day, f.day) AS day, COALESCE(t.category_id, f.category_id) AS category_id,
+       COALESCE(t.channel, f.channel) AS channel,
+       COALESCE(f.units, 0) AS units, COALESCE(t.units, 0) AS expected_units,
+       COALESCE(f.revenue, 0) AS revenue, COALESCE(t.revenue, 0) AS expected_revenue,
+       COALESCE(f.cost, 0) AS cost, COALESCE(t.cost, 0) AS expected_cost
+FROM truth t
+FULL JOIN facts f
+  ON f.day = t.day AND f.channel = t.channel
+ AND COALESCE(f.category_id, '00000000-0000-0000-0000-000000000000') = COALESCE(t.category_id, '00000000-0000-0000-0000-000000000000')
+WHERE COALESCE(f.units, 0) <> COALESCE(t.units, 0)
+   OR COALESCE(f.revenue, 0) <> COALESCE(t.revenue, 0)
+   OR COALESCE(f.cost, 0) <> COALESCE(t.cost, 0)
+ORDER BY 1, 2, 3
+"""
+
+_BACKFILL_SQL = """
+LOCK TABLE daily_sales_facts IN EXCLUSIVE MODE;
+DELETE FROM daily_sales_facts WHERE day >= %(since)s;
+INSERT INTO daily_sales_facts (day, category_id, channel, units, revenue, cost, fees)
+SELECT day, category_id, channel, COUNT(*), SUM(revenue), SUM(cost),
+       COALESCE(SUM(revenue) FILTER (WHERE channel = 'ebay') * {fee_rate}, 0)
+FROM ({src}) s
+WHERE day >= %(since)s
+GROUP BY day, category_id, channel;
+"""
+
+# Same calendar as the facts, for half-open ranges on sold_at.
+_DAY_FNS = """
+CREATE OR REPLACE FUNCTION sales_today() RETURNS date
+LANGUAGE sql STABLE AS $fn$ SELECT (now() AT TIME ZONE {tz})::date $fn$;
+
+CREATE OR REPLACE FUNCTION sales_day_start(day date) RETURNS timestamptz
+LANGUAGE sql STABLE AS $fn$ SELECT day::timestamp AT TIME ZONE {tz} $fn$;
+"""
+
+_TRIGGERS = [
+    ("daily_sales_facts_ins", "INSERT", "NEW TABLE AS new_rows"),
+    ("daily_sales_facts_upd", "UPDATE", "OLD TABLE AS old_rows NEW TABLE AS new_rows"),
+    ("daily_sales_facts_del", "DELETE", "OLD TABLE AS old_rows"),
+]
+
+# po_lines rows whose cost / category changed, as the old or new version.
+_CHANGED_LINES = """(
+    SELECT {side}.* FROM new_lines n JOIN old_lines o ON o.id = n.id
+    WHERE n.unit_cost IS DISTINCT FROM o.unit_cost OR n.category_guess IS DISTINCT FROM o.category_guess
+)"""
+
+
+def _literal(cur, value: str) -> str:
+    return cur.mogrify("%s", (value,)).decode()
+
+
+def _trigger_fn(tz: str) -> str:
+    new = _contrib(tz, "1", "new_rows")
+    old = _contrib(tz, "-1", "old_rows")
+    apply = lambda src: _APPLY.format(src=src, fee_rate=EBAY_FEE_RATE)
+    return f"""
+CREATE OR REPLACE FUNCTION daily_sales_facts_trg() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    {apply(new)}
+  ELSIF TG_OP = 'UPDATE' THEN
+    {apply(new + " UNION ALL " + old)}
+  ELSE
+    {apply(old)}
+  END IF;
+  RETURN NULL;
+END
+$fn$;
+"""
+
+
+def _line_trigger_fns(tz: str) -> str:
+    items = "public.inventory_items"
+    apply = lambda src: _APPLY.format(src=src, fee_rate=EBAY_FEE_RATE)
+    moved = (_contrib(tz, "1", items, _CHANGED_LINES.format(side="n"), join="")
+             + " UNION ALL " + _contrib(tz, "-1", items, _CHANGED_LINES.format(side="o"), join=""))
+    # Row-level BEFORE DELETE: the FK's SET NULL on inventory_items runs after
+    # the line is gone, when its items can no longer be resolved against it.
+    line = "(SELECT OLD.id AS id, OLD.category_guess AS category_guess, OLD.unit_cost AS unit_cost)"
+    unlinked = "(SELECT OLD.id AS id, NULL::uuid AS category_guess, NULL::numeric AS unit_cost)"
+    dropped = (_contrib(tz, "1", items, unlinked, join="")
+               + " UNION ALL " + _contrib(tz, "-1", items, line, join=""))
+    return f"""
+CREATE OR REPLACE FUNCTION daily_sales_facts_line_upd() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  {apply(moved)}
+  RETURN NULL;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION daily_sales_facts_line_del() RETURNS trigger
+LANGUAGE plpgsql AS $fn$
+BEGIN
+  {apply(dropped)}
+  RETURN OLD;
+END
+$fn$;
+"""
+
+
+def _timezone(cur) -> str:
+    if SALES_TIMEZONE:
+        return SALES_TIMEZONE
+    cur.execute("SELECT current_setting('TimeZone') AS tz")
+    return cur.fetchone()["tz"]
+
+
+def _backfill(cur, since: Optional[date] = None) -> int:
+    tz = _literal(cur, _timezone(cur))
+    src = _contrib(tz, "1", "public.inventory_items")
+    cur.execute(_BACKFILL_SQL.format(src=src, fee_rate=EBAY_FEE_RATE), {"since": since or date.min})
+    return cur.rowcount
+
+
+def _drift(cur, since: Optional[date] = None) -> List[Dict[str, Any]]:
+    tz = _literal(cur, _timezone(cur))
+    src = _contrib(tz, "1", "public.inventory_items")
+    cur.execute(_DRIFT_SQL.format(src=src), {"since": since or date.min})
+    return [dict(r) for r in cur.fetchall()]
+
+
+def ensure_sales_facts():
+    """Create the facts table, day functions and triggers; backfill when the table is new."""
+    with db() as (con, cur):
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('daily_sales_facts'))")
+        cur.execute("SELECT to_regclass('daily_sales_facts') IS NULL AS missing")
+        missing = cur.fetchone()["missing"]
+        cur.execute(_FACTS_DDL)
+        tz = _literal(cur, _timezone(cur))
+        cur.execute(_DAY_FNS.format(tz=tz))
+        cur.execute(_trigger_fn(tz))
+        for name, event, referencing in _TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name} ON public.inventory_items")
+            cur.execute(
+                f"CREATE TRIGGER {name} AFTER {event} ON public.inventory_items "
+                f"REFERENCING {referencing} FOR EACH STATEMENT EXECUTE FUNCTION daily_sales_facts_trg()"
+            )
+        cur.execute(_line_trigger_fns(tz))
+        cur.execute("DROP TRIGGER IF EXISTS daily_sales_facts_line_upd ON public.po_lines")
+        cur.execute(
+            "CREATE TRIGGER daily_sales_facts_line_upd AFTER UPDATE ON public.po_lines "
+            "REFERENCING OLD TABLE AS old_lines NEW TABLE AS new_lines "
+            "FOR EACH STATEMENT EXECUTE FUNCTION daily_sales_facts_line_upd()"
+        )
+        cur.execute("DROP TRIGGER IF EXISTS daily_sales_facts_line_del ON public.po_lines")
+        cur.execute(
+            "CREATE TRIGGER daily_sales_facts_line_del BEFORE DELETE ON public.po_lines "
+            "FOR EACH ROW EXECUTE FUNCTION daily_sales_facts_line_del()"
+        )
+        if missing:
+            log.info("Backfilling daily_sales_facts")
+            _backfill(cur)
+        con.commit()
+
+
+def backfill_sales_facts(since: Optional[date] = None) -> int:
+    """Recompute facts for every day >= since (all days when None). Returns rows written."""
+    with db() as (con, cur):
+        return _backfill(cur, since)
+
+
+def reconcile_sales_facts(since: Optional[date] = None) -> List[Dict[str, Any]]:
+    """
+    Scheduled / on demand: recount days >= since (default: the last
+    SALES_FACTS_RECONCILE_DAYS) and rewrite from the first drifted day.
+    Returns the keys that had drifted.
+    """
+    if since is None and SALES_FACTS_RECONCILE_DAYS:
+        since = date.today() - timedelta(days=SALES_FACTS_RECONCILE_DAYS)
+    with db() as (con, cur):
+        # Writers apply their delta before committing; waiting for them keeps the recount exact.
+        cur.execute("LOCK TABLE daily_sales_facts IN EXCLUSIVE MODE")
+        drift = _drift(cur, since)
+        if drift:
+            _backfill(cur, drift[0]["day"])
+    if drift:
+        log.warning("daily_sales_facts drift corrected on %d keys from %s: %s", len(drift), drift[0]["day"], drift[:20])
+    return drift
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="maintain daily_sales_facts")
+    ap.add_argument("--backfill", action="store_true", help="recompute facts from inventory_items")
+    ap.add_argument("--reconcile", action="store_true", help="recount, report and fix drifted days")
+    ap.add_argument("--since", type=date.fromisoformat, help="only days on or after YYYY-MM-DD")
+    args = ap.parse_args(argv)
+    if not (args.backfill or args.reconcile):
+        ap.print_help()
+        return 2
+    ensure_sales_facts()
+    if args.reconcile:
+        drift = reconcile_sales_facts(args.since or date.min)
+        for d in drift:
+            print(d)
+        print(f"{len(drift)} drifted fact rows corrected")
+        return 0
+    n = backfill_sales_facts(args.since)
+    print(f"{n} fact rows written")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,204 @@
+# spec_extract.py
+"""
+Deterministic key-spec extractor: CPU family/model, RAM GB, storage GB/type
+and screen size from a product name plus its specs JSON.
+
+The rules live in SQL (IMMUTABLE functions), so inventory_read computes the
+typed columns on every write through its refresh triggers, and probes in
+similarity queries go through exactly the same code.
+
+    python spec_extract.py --check spec_fixtures.json
+"""
+import json
+import argparse
+from typing import Any, Dict, List, Optional, Sequence
+
+# Bump when the rules below change; ensure_inventory_read() then recomputes
+# the typed columns for every row.
+SPEC_EXTRACTOR_VERSION = 1
+
+SPEC_ATTRS = ("cpu_family", "cpu_model", "ram_gb", "storage_gb", "storage_type", "screen_in")
+
+SPEC_FUNCTIONS_SQL = r"""
+CREATE OR REPLACE FUNCTION spec_cpu(name text, specs jsonb, OUT family text, OUT model text)
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $fn$
+DECLARE
+  t text := lower(concat_ws(' ', specs->>'processor', specs->>'cpu', name));
+  m text[];
+BEGIN
+  m := regexp_match(t, '\m(?:core\s*)?(i[3579])(?:\s*-\s*|\s+)?(\d{3,5}[a-z]{0,2}\d?)?\M');
+  IF m IS NOT NULL THEN
+    family := m[1];
+    model := CASE WHEN m[2] IS NOT NULL THEN m[1] || '-' || m[2] END;
+    RETURN;
+  END IF;
+
+  m := regexp_match(t, '\mryzen\s*([3579])(?:\s*pro)?(?:\s+(\d{4}[a-z]{0,2}))?\M');
+  IF m IS NOT NULL THEN
+    family := 'ryzen ' || m[1];
+    model := CASE WHEN m[2] IS NOT NULL THEN family || ' ' || m[2] END;
+    RETURN;
+  END IF;
+
+  IF t ~ '\m(apple|mac|macbook|imac|ipad)' THEN
+    m := regexp_match(t, '\m(m[1-4])(?:\s+(pro|max|ultra))?\M');
+    IF m IS NOT NULL THEN
+      family := m[1];
+      model := m[1] || COALESCE(' ' || m[2], '');
+      RETURN;
+    END IF;
+  END IF;
+
+  m := regexp_match(t, '\m(celeron|pentium|xeon|atom|athlon|snapdragon|exynos)(?:\s+(?:silver|gold))?(?:\s+([a-z]{0,2}-?\d{3,5}[a-z]{0,2}))?\M');
+  IF m IS NOT NULL THEN
+    family := m[1];
+    model := CASE WHEN m[2] IS NOT NULL THEN m[1] || ' ' || m[2] END;
+  END IF;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION spec_ram_gb(name text, specs jsonb) RETURNS int
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $fn$
+DECLARE
+  t text := lower(COALESCE(specs->>'ram', specs->>'memory', ''));
+  m text[];
+BEGIN
+  m := regexp_match(t, '^\s*(\d{1,3})\s*(?:gb)?\M');
+  IF m IS NOT NULL THEN RETURN m[1]::int; END IF;
+
+  t := lower(COALESCE(name, ''));
+  m := regexp_match(t, '\m(\d{1,3})\s*gb\s*(?:ddr\d\w*\s*)?(?:ram|memory|ddr)');
+  IF m IS NOT NULL THEN RETURN m[1]::int; END IF;
+  m := regexp_match(t, '\m(?:ram|memory)\s*:?\s*(\d{1,3})\s*gb');
+  IF m IS NOT NULL THEN RETURN m[1]::int; END IF;
+  -- "16GB/512GB", "8GB 256GB SSD": the smaller leading figure is RAM
+  m := regexp_match(t, '\m(\d{1,2})\s*gb\s*[/,+]?\s*\d{1,4}(?:\.\d+)?\s*(?:gb|tb)');
+  IF m IS NOT NULL AND m[1]::int <= 64 THEN RETURN m[1]::int; END IF;
+  RETURN NULL;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION spec_storage_gb(name text, specs jsonb) RETURNS int
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $fn$
+DECLARE
+  t text := lower(concat_ws(' ', specs->>'storage', specs->>'ssd', specs->>'hdd'));
+  m text[];
+  best numeric;
+BEGIN
+  m := regexp_match(t, '(\d+(?:\.\d+)?)\s*(gb|tb)\M');
+  IF m IS NULL THEN
+    t := lower(COALESCE(name, ''));
+    m := regexp_match(t, '(\d+(?:\.\d+)?)\s*(gb|tb)\s*(?:(?:pcie|nvme|m\.2|sata)\s*)*(?:ssd|hdd|emmc|nvme|flash|storage|hard drive)');
+  END IF;
+  IF m IS NOT NULL THEN
+    RETURN round(m[1]::numeric * CASE m[2] WHEN 'tb' THEN 1000 ELSE 1 END)::int;
+  END IF;
+
+  -- Otherwise the largest size in the name, if it is big enough to be storage.
+  SELECT max(x[1]::numeric * CASE x[2] WHEN 'tb' THEN 1000 ELSE 1 END) INTO best
+  FROM regexp_matches(t, '(\d+(?:\.\d+)?)\s*(gb|tb)\M(?!\s*(?:ram|memory|ddr))', 'g') AS x;
+  RETURN CASE WHEN best >= 32 THEN round(best)::int END;
+END
+$fn$;
+
+CREATE OR REPLACE FUNCTION spec_storage_type(name text, specs jsonb) RETURNS text
+LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $fn$
+  SELECT CASE
+    WHEN t ~ '\m(ssd|nvme|m\.2|pcie)' THEN 'ssd'
+    WHEN t ~ '\memmc\M' THEN 'emmc'
+    WHEN t ~ '\m(hdd|hard drive|\d{4}\s*rpm)' THEN 'hdd'
+  END
+  FROM (SELECT lower(concat_ws(' ', specs->>'storage', specs->>'ssd', specs->>'hdd', name)) AS t) s
+$fn$;
+
+CREATE OR REPLACE FUNCTION spec_screen_in(name text, specs jsonb) RETURNS numeric
+LANGUAGE plpgsql IMMUTABLE PARALLEL SAFE AS $fn$
+DECLARE
+  t text := lower(COALESCE(specs->>'screen', ''));
+  m text[];
+  v numeric;
+BEGIN
+  m := regexp_match(t, '^\s*(\d{1,2}(?:\.\d{1,2})?)\s*(?:"|''{1,2}|”|in\M|inch|$)');
+  IF m IS NULL THEN
+    t := lower(COALESCE(name, '') || ' ' || t);
+    m := regexp_match(t, '(?:^|[^\d.])(\d{1,2}(?:\.\d{1,2})?)\s*(?:"|''{1,2}|”|-?\s*inch(?:es)?\M|-?\s*in\M)');
+  END IF;
+  IF m IS NULL THEN RETURN NULL; END IF;
+  v := m[1]::numeric;
+  RETURN CASE WHEN v BETWEEN 5 AND 40 THEN round(v, 1) END;
+END
+$fn$;
+"""
+
+# Column source expressions for inventory_read (over i / pl).
+SPEC_READ_COLUMNS = [
+    ("cpu_family",   "(spec_cpu(pl.product_name_raw, i.specs)).family",          "cpuFamily"),
+    ("cpu_model",    "(spec_cpu(pl.product_name_raw, i.specs)).model",           "cpuModel"),
+    ("ram_gb",       "spec_ram_gb(pl.product_name_raw, i.specs)",                "ramGb"),
+    ("storage_gb",   "spec_storage_gb(pl.product_name_raw, i.specs)",            "storageGb"),
+    ("storage_type", "spec_storage_type(pl.product_name_raw, i.specs)",          "storageType"),
+    ("screen_in",    "spec_screen_in(pl.product_name_raw, i.specs)",             "screenIn"),
+]
+
+PROBE_SQL = """
+    SELECT (c).family AS cpu_family, (c).model AS cpu_model,
+           spec_ram_gb(n, s) AS ram_gb, spec_storage_gb(n, s) AS storage_gb,
+           spec_storage_type(n, s) AS storage_type, spec_screen_in(n, s) AS screen_in
+    FROM (SELECT %(name)s::text AS n, %(specs)s::jsonb AS s) x,
+         LATERAL (SELECT spec_cpu(x.n, x.s) AS c) y
+"""
+
+
+def extract_specs(cur, name: Optional[str], specs: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run the extractor on an arbitrary name/specs pair (e.g. a similarity probe)."""
+    cur.execute(PROBE_SQL, {"name": name or "", "specs": json.dumps(specs or {})})
+    row = dict(cur.fetchone())
+    if row.get("screen_in") is not None:
+        row["screen_in"] = float(row["screen_in"])
+    return row
+
+
+def check(cur, cases: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    cases: [{"name", "specs"?, "expect": {attr: value}}]. Only the attrs listed
+    in `expect` are compared (null means "must not extract anything").
+    """
+    failures = []
+    for case in cases:
+        got = extract_specs(cur, case.get("name"), case.get("specs"))
+        diff = {k: {"expected": v, "got": got.get(k)} for k, v in case["expect"].items() if got.get(k) != v}
+        if diff:
+            failures.append({"name": case.get("name"), "specs": case.get("specs"), "diff": diff})
+    return failures
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    from psycopg2.extras import RealDictCursor
+    from db_utils import db_conn
+
+    ap = argparse.ArgumentParser(description="check the spec extractor against labelled manifest strings")
+    ap.add_argument("--check", required=True, help="fixtures JSON (see check())")
+    args = ap.parse_args(argv)
+
+    with open(args.check) as fh:
+        cases = json.load(fh)
+    con = db_conn()
+    try:
+        cur = con.cursor(cursor_factory=RealDictCursor)
+        # Check the rules in this file, not whatever the database has installed.
+        cur.execute(SPEC_FUNCTIONS_SQL)
+        failures = check(cur, cases)
+    finally:
+        con.rollback()
+        con.close()
+
+    for f in failures:
+        print(f"[FAIL] {f['name']!r}")
+        for attr, d in f["diff"].items():
+            print(f"         {attr}: expected {d['expected']!r}, got {d['got']!r}")
+    print(f"\n{len(cases) - len(failures)}/{len(cases)} passed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
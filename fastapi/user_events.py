@@ -0,0 +1,188 @@
+# user_events.py
+"""
+Per-user event delivery for SSE clients, plus presence.
+
+Chat events (new messages, thread changes) concern only the thread's
+participants, so they are published to one Redis channel per user
+("user_events:<id>") instead of going through _broadcast to every client.
+Each worker subscribes to exactly the channels of the users connected to it,
+so a message costs one delivery per participant, wherever they are connected.
+
+Presence lives in the PRESENCE_KEY sorted set: one "<user>@<worker>" member
+per worker holding a stream for that user, scored with the last refresh time.
+A user is online while any of their members is fresher than
+PRESENCE_TTL_SECONDS; workers refresh theirs every third of that and remove
+them when the user's last stream on the worker closes.
+
+Without Redis, delivery and presence are limited to this process.
+"""
+import os
+import json
+import time
+import socket
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from config import get_redis
+
+log = logging.getLogger(__name__)
+
+USER_CHANNEL_PREFIX = "user_events:"
+PRESENCE_KEY = "presence:users"
+PRESENCE_TTL_SECONDS = float(os.getenv("PRESENCE_TTL_SECONDS", "45"))
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+# user id -> [(queue, loop that owns it)]
+_local: Dict[int, List[Tuple[asyncio.Queue, asyncio.AbstractEventLoop]]] = {}
+_lock = threading.Lock()
+_changed = threading.Event()
+_listener: Optional[threading.Thread] = None
+
+
+def _channel(user_id: int) -> str:
+    return f"{USER_CHANNEL_PREFIX}{user_id}"
+
+
+def _member(user_id: int) -> str:
+    return f"{user_id}@{WORKER_ID}"
+
+
+def attach(user_id: int, q: asyncio.Queue):
+    """Route `user_id`'s events to an SSE queue. Call from the queue's event loop."""
+    loop = asyncio.get_running_loop()
+    with _lock:
+        _local.setdefault(user_id, []).append((q, loop))
+    _changed.set()
+
+
+def detach(user_id: int, q: asyncio.Queue):
+    with _lock:
+        conns = [c for c in _local.get(user_id, []) if c[0] is not q]
+        if conns:
+            _local[user_id] = conns
+        else:
+            _local.pop(user_id, None)
+    _changed.set()
+
+
+def _deliver_local(user_id: int, payload: Dict[str, Any]):
+    with _lock:
+        targets = list(_local.get(user_id, ()))
+    for q, loop in targets:
+        try:
+            loop.call_soon_threadsafe(q.put_nowait, payload)
+        except RuntimeError:
+            pass  # loop already closed; detach() is on its way
+
+
+def publish_to_users(user_ids: Iterable[Any], evt_type: str, data: Optional[Dict[str, Any]] = None):
+    """Send an SSE event to every stream of the given users, on any worker."""
+    ids = sorted({int(u) for u in user_ids if u is not None})
+    if not ids:
+        return
+    payload = {"type": evt_type, "data": data or {}}
+    if _listener is not None:
+        try:
+            body = json.dumps(payload, default=str)
+            pipe = get_redis().pipeline(transaction=False)
+            for uid in ids:
+                pipe.publish(_channel(uid), body)
+            pipe.execute()
+            return
+        except Exception as e:
+            log.warning("user events not published, delivering locally only: %s", e)
+    for uid in ids:
+        _deliver_local(uid, payload)
+
+
+def online_users(user_ids: Optional[Iterable[Any]] = None) -> Set[int]:
+    """Users with a live stream on any worker (restricted to `user_ids` if given)."""
+    online: Optional[Set[int]] = None
+    if _listener is not None:
+        try:
+            members = get_redis().zrangebyscore(PRESENCE_KEY, time.time() - PRESENCE_TTL_SECONDS, "+inf")
+            online = {int((m.decode() if isinstance(m, bytes) else str(m)).split("@", 1)[0]) for m in members}
+        except Exception as e:
+            log.warning("presence lookup failed, using local streams: %s", e)
+    if online is None:
+        with _lock:
+            online = set(_local)
+    if user_ids is not None:
+        online &= {int(u) for u in user_ids}
+    return online
+
+
+def _sync(r, pubsub, subscribed: Set[int]) -> Set[int]:
+    """Match this worker's subscriptions and presence members to _local."""
+    with _lock:
+        wanted = set(_local)
+    added, removed = wanted - subscribed, subscribed - wanted
+    if added:
+        pubsub.subscribe(*[_channel(u) for u in added])
+        r.zadd(PRESENCE_KEY, {_member(u): time.time() for u in added})
+    if removed:
+        pubsub.unsubscribe(*[_channel(u) for u in removed])
+        r.zrem(PRESENCE_KEY, *[_member(u) for u in removed])
+    return wanted
+
+
+def _refresh_presence(r, subscribed: Set[int]):
+    now = time.time()
+    pipe = r.pipeline(transaction=False)
+    if subscribed:
+        pipe.zadd(PRESENCE_KEY, {_member(u): now for u in subscribed})
+    pipe.zremrangebyscore(PRESENCE_KEY, "-inf", now - PRESENCE_TTL_SECONDS)
+    pipe.execute()
+
+
+def _listen():
+    refresh_every = PRESENCE_TTL_SECONDS / 3
+    while True:
+        subscribed: Set[int] = set()
+        try:
+            r = get_redis()
+            pubsub = r.pubsub(ignore_subscribe_messages=True)
+            next_refresh = 0.0
+            while True:
+                if _changed.is_set():
+                    _changed.clear()
+                    subscribed = _sync(r, pubsub, subscribed)
+                if time.monotonic() >= next_refresh:
+                    _refresh_presence(r, subscribed)
+                    next_refresh = time.monotonic() + refresh_every
+                if not subscribed:
+                    _changed.wait(1.0)
+                    continue
+                msg = pubsub.get_message(timeout=0.2)
+                if not msg or msg.get("type") != "message":
+                    continue
+                channel = msg.get("channel")
+                channel = channel.decode() if isinstance(channel, bytes) else str(channel)
+                data = msg.get("data")
+                data = data.decode("utf-8", "ignore") if isinstance(data, bytes) else str(data)
+                try:
+                    payload = json.loads(data)
+                except ValueError:
+                    continue
+                _deliver_local(int(channel[len(USER_CHANNEL_PREFIX):]), payload)
+        except Exception as e:
+            log.warning("user events listener reconnecting: %s", e)
+            # Resubscribe everything on the new connection.
+            _changed.set()
+            time.sleep(5)
+
+
+def start_user_events_listener():
+    """Start the per-worker Redis subscriber thread once (no-op without Redis)."""
+    global _listener
+    if _listener is not None:
+        return
+    try:
+        get_redis()
+    except Exception as e:
+        log.warning("user events running without Redis (this worker only): %s", e)
+        return
+    _listener = threading.Thread(target=_listen, name="user-events", daemon=True)
+    _listener.start()
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Bytes on the wire, time-to-first-byte and serialization time for the largest
+API responses.
+
+    API_URL=http://localhost:8000 API_TOKEN=... \
+        python scripts/bench_responses.py --po <po uuid> [--rows-limit 1000] [--repeat 3]
+
+For each endpoint and Accept-Encoding (identity, gzip, br) it prints TTFB,
+total time and compressed / decoded size, then times stdlib json against
+orjson on the decoded payload. Pass --server-pid to also report the API
+process's peak RSS (Linux VmHWM) after the run.
+
+--conditional re-polls the ETag'd endpoints with If-None-Match and checks
+that they answer 304 with an empty body, comparing latency with the full 200.
+
+The "narrow" rows use a `fields=` projection. `python fastapi/plan_check.py
+--only rows.list_` prints the matching buffer counts; EXPLAIN does not detoast
+output columns, so the specs savings only show up in the timings here.
+"""
+import os, sys, json, time, argparse, statistics
+import requests
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+API_URL = os.getenv("API_URL", "http://localhost:8000").rstrip("/")
+API_TOKEN = os.getenv("API_TOKEN")
+ENCODINGS = ("identity", "gzip", "br")
+
+def endpoints(po_id, rows_limit):
+    eps = [
+        ("rows", f"/rows?limit={rows_limit}"),
+        ("rows narrow", f"/rows?limit={rows_limit}&fields=productName,status"),
+        ("rows stream", f"/rows?limit={rows_limit * 10}&stream=ndjson"),
+        ("rows stream narrow", f"/rows?limit={rows_limit * 10}&stream=ndjson&fields=productName,status"),
+    ]
+    if po_id:
+        eps += [
+            ("po snapshot", f"/pos/{po_id}/snapshot?limit=1000"),
+            ("po lines", f"/pos/{po_id}/lines"),
+            ("po lines no raw", f"/pos/{po_id}/lines?include_raw=false"),
+            ("po lines stream", f"/pos/{po_id}/lines?include_raw=false&stream=ndjson"),
+        ]
+    return eps
+
+def fetch(path, encoding):
+    headers = {"Accept-Encoding": encoding}
+    if API_TOKEN:
+        headers["Authorization"] = f"Bearer {API_TOKEN}"
+    t0 = time.perf_counter()
+    r = requests.get(API_URL + path, headers=headers, stream=True, timeout=300)
+    r.raise_for_status()
+    wire, ttfb = 0, None
+    for chunk in r.raw.stream(64 * 1024, decode_content=False):
+        if ttfb is None:
+            ttfb = time.perf_counter() - t0
+        wire += len(chunk)
+    total = time.perf_counter() - t0
+    return {
+        "ttfb": ttfb or total, "total": total, "wire": wire,
+        "encoding": r.headers.get("Content-Encoding", "identity"),
+    }
+
+def conditional(paths, repeat):
+    """(name, 200 ms, 304 ms, status) for a plain fetch vs an If-None-Match re-poll."""
+    headers = {"Authorization": f"Bearer {API_TOKEN}"} if API_TOKEN else {}
+    out = []
+    for name, path in paths:
+        full, revalidated, status = [], [], None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            r = requests.get(API_URL + path, headers=headers, timeout=300)
+            full.append(time.perf_counter() - t0)
+            etag = r.headers.get("ETag")
+            if not etag:
+                status = "no etag"
+                break
+            t0 = time.perf_counter()
+            r2 = requests.get(API_URL + path, headers={**headers, "If-None-Match": etag}, timeout=300)
+            revalidated.append(time.perf_counter() - t0)
+            status = r2.status_code if not r2.content else f"{r2.status_code} with body"
+        out.append((name, statistics.median(full) * 1000,
+                    statistics.median(revalidated) * 1000 if revalidated else float("nan"), status))
+    return out
+
+def decoded(path):
+    headers = {"Authorization": f"Bearer {API_TOKEN}"} if API_TOKEN else {}
+    r = requests.get(API_URL + path, headers=headers, timeout=300)
+    r.raise_for_status()
+    if "ndjson" in r.headers.get("Content-Type", ""):
+        return [json.loads(line) for line in r.text.splitlines() if line]
+    return r.json()
+
+def time_it(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn()
+        runs.append(time.perf_counter() - t0)
+    return statistics.median(runs), len(out)
+
+def peak_rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--po", help="PO id for the /pos/{id}/... endpoints")
+    ap.add_argument("--rows-limit", type=int, default=1000)
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--server-pid", type=int)
+    ap.add_argument("--conditional", action="store_true", help="only check ETag / 304 re-polls")
+    args = ap.parse_args()
+
+    if args.conditional:
+        paths = [("rows", f"/rows?limit={args.rows_limit}"), ("categories", "/categories"), ("vendors", "/vendors")]
+        if args.po:
+            paths.append(("po snapshot", f"/pos/{args.po}/snapshot?limit=1000"))
+        print(f"{'endpoint':<20} {'200 ms':>9} {'304 ms':>9}  re-poll")
+        results = conditional(paths, args.repeat)
+        for name, full, reval, status in results:
+            print(f"{name:<20} {full:>9.1f} {reval:>9.1f}  {status}")
+        sys.exit(0 if all(r[3] == 304 for r in results) else 1)
+
+    print(f"{'endpoint':<20} {'enc':<9} {'ttfb ms':>9} {'total ms':>9} {'wire KB':>10}")
+    for name, path in endpoints(args.po, args.rows_limit):
+        for enc in ENCODINGS:
+            runs = [fetch(path, enc) for _ in range(args.repeat)]
+            print(f"{name:<20} {runs[0]['encoding']:<9} "
+                  f"{statistics.median(r['ttfb'] for r in runs) * 1000:>9.1f} "
+                  f"{statistics.median(r['total'] for r in runs) * 1000:>9.1f} "
+                  f"{runs[0]['wire'] / 1024:>10.1f}")
+
+    print()
+    print(f"{'endpoint':<20} {'json ms':>9} {'orjson ms':>10} {'decoded KB':>11}")
+    for name, path in endpoints(args.po, args.rows_limit):
+        payload = decoded(path)
+        t_std, size = time_it(lambda: json.dumps(payload).encode(), args.repeat)
+        t_or = time_it(lambda: orjson.dumps(payload), args.repeat)[0] if orjson else float("nan")
+        print(f"{name:<20} {t_std * 1000:>9.1f} {t_or * 1000:>10.1f} {size / 1024:>11.1f}")
+
+    if args.server_pid:
+        rss = peak_rss_mb(args.server_pid)
+        print(f"\nserver peak RSS: {rss:.1f} MB" if rss is not None else "\nserver peak RSS unavailable")
+
+if __name__ == "__main__":
+    main()
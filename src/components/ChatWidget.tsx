@@ -115,6 +115,15 @@ const getGroupMeta = (messages: Message[], index: number, me: BasicUser) => {
   return { mine, isFirst: !sameAsPrev };
 };
 
+// A poll returns the newest page only: keep the older pages already loaded in
+// front of it. null when the page no longer reaches back to them (too many new
+// messages since), so the caller starts over from the page.
+const mergeLatestPage = (prev: Message[], page: Message[]): Message[] | null => {
+  if (!page.length) return null;
+  const at = prev.findIndex(m => m.id === page[0].id);
+  return at < 0 ? null : [...prev.slice(0, at), ...page];
+};
+
 const getParticipantListString = (participants: Participant[], currentUser: BasicUser): string => {
   if (!participants || participants.length === 0) return "No members";
   const otherParticipants = participants.filter(p => String(p.id) !== currentUser.id).map(p => p.name.split(' ')[0]);
@@ -147,10 +156,14 @@ export const ChatWidget: React.FC<{ user: BasicUser }> = ({ user }) => {
   const [showDeleteDialog, setShowDeleteDialog] = useState(false);
   const [threadToDelete, setThreadToDelete] = useState<string | null>(null);
   const [showScrollButton, setShowScrollButton] = useState(false);
+  const [hasOlder, setHasOlder] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
 
   const messagesEndRef = useRef<HTMLDivElement>(null);
   const scrollContainerRef = useRef<HTMLDivElement>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  const messagesRef = useRef<Message[]>([]);
+  const threadIdRef = useRef<string | null>(null);
   
   const API_URL = useMemo(() => ((import.meta as any).env?.VITE_API_URL || "/backend").replace(/\/+$/, ""), []);
   const unreadTotal = useMemo(() => threads.reduce((sum, t) => sum + t.unread_count, 0), [threads]);
@@ -193,23 +206,32 @@ export const ChatWidget: React.FC<{ user: BasicUser }> = ({ user }) => {
     } catch (err) { console.error("loadThreads error:", err); }
   }, [API_URL, user.id]);
 
+  const messagesUrl = useCallback((thread: ThreadSummary) => (
+    thread.is_group ? `${API_URL}/messages/threads/${thread.id}/messages?employee_id=${user.id}` : `${API_URL}/messages/with/${thread.other_id}?employee_id=${user.id}`
+  ), [API_URL, user.id]);
+
   const loadConversation = useCallback(async (thread: ThreadSummary, isPolling: boolean = false) => {
     if (!user?.id) return;
     
     // Only set these on initial user click, not during polling
     if (!isPolling) {
+        threadIdRef.current = thread.id;
         setActiveThread(thread);
         setView("conversation");
         setMessages([]); // Clear previous messages to show loading or prevent flash
+        setHasOlder(false);
     }
 
     try {
-      const url = thread.is_group ? `${API_URL}/messages/threads/${thread.id}/messages?employee_id=${user.id}` : `${API_URL}/messages/with/${thread.other_id}?employee_id=${user.id}`;
-      const res = await fetch(url, { credentials: "include" });
+      const res = await fetch(messagesUrl(thread), { credentials: "include" });
       if (!res.ok) throw new Error("Failed to load messages");
       const json = await res.json();
+      if (threadIdRef.current !== thread.id) return; // switched threads meanwhile
       
-      const newMessages = (json.messages || []).map((m: any) => ({ ...m, id: String(m.id) }));
+      const page: Message[] = (json.messages || []).map((m: any) => ({ ...m, id: String(m.id) }));
+      const merged = isPolling ? mergeLatestPage(messagesRef.current, page) : null;
+      const newMessages = merged ?? page;
+      if (!merged) setHasOlder(!!json.has_more);
       
       setMessages(prev => {
         // Prevent state update if data hasn't changed (stops unnecessary effect triggers)
@@ -224,7 +246,31 @@ export const ChatWidget: React.FC<{ user: BasicUser }> = ({ user }) => {
           setTimeout(() => messagesEndRef.current?.scrollIntoView({ behavior: "auto", block: "end" }), 50);
       }
     } catch (err) { console.error("loadConversation error:", err); }
-  }, [API_URL, user.id, loadThreads]);
+  }, [user.id, messagesUrl, loadThreads]);
+
+  const loadOlder = useCallback(async () => {
+    const thread = activeThread;
+    const oldest = messagesRef.current[0];
+    if (!thread || !oldest || loadingOlder) return;
+    setLoadingOlder(true);
+    const el = scrollContainerRef.current;
+    const fromBottom = el ? el.scrollHeight - el.scrollTop : 0;
+    try {
+      const res = await fetch(`${messagesUrl(thread)}&before=${encodeURIComponent(oldest.id)}`, { credentials: "include" });
+      if (!res.ok) throw new Error("Failed to load older messages");
+      const json = await res.json();
+      if (threadIdRef.current !== thread.id) return;
+      const page: Message[] = (json.messages || []).map((m: any) => ({ ...m, id: String(m.id) }));
+      setMessages(prev => {
+        const have = new Set(prev.map(m => m.id));
+        return [...page.filter(m => !have.has(m.id)), ...prev];
+      });
+      setHasOlder(!!json.has_more);
+      // Keep the message that was on top where it was.
+      setTimeout(() => { if (el) el.scrollTop = el.scrollHeight - fromBottom; }, 0);
+    } catch (err) { console.error("loadOlder error:", err); }
+    finally { setLoadingOlder(false); }
+  }, [activeThread, loadingOlder, messagesUrl]);
 
   const loadEmployees = useCallback(async () => {
     if (employees.length > 0) return;
@@ -354,6 +400,8 @@ export const ChatWidget: React.FC<{ user: BasicUser }> = ({ user }) => {
   useEffect(() => { if (open) loadThreads(); }, [open, loadThreads]);
   useEffect(() => { if (view === "new" || view === "add_members") loadEmployees(); }, [view, loadEmployees]);
   
+  useEffect(() => { messagesRef.current = messages; }, [messages]);
+
   // Watch messages for updates
   useEffect(() => { 
       if (view === "conversation") { 
@@ -513,6 +561,13 @@ export const ChatWidget: React.FC<{ user: BasicUser }> = ({ user }) => {
                     ref={scrollContainerRef}
                 >
                   <div className="px-4 pt-4 pb-4">
+                    {hasOlder && (
+                      <div className="flex justify-center pb-2">
+                        <Button variant="ghost" size="sm" className="h-7 text-xs text-gray-500" disabled={loadingOlder} onClick={loadOlder}>
+                          {loadingOlder ? "Loading..." : "Load older messages"}
+                        </Button>
+                      </div>
+                    )}
                     {messages.map((m, i) => {
                       const { mine, isFirst } = getGroupMeta(messages, i, user);
                       return (
@@ -6,6 +6,11 @@ export type LiveHandlers = {
   onCategoryDeleted?: (cat: { id: string; label: string; prefix: string }) => void;
   onRowUpserted?: (row: any) => void;
   onRowBulkUpserted?: (count: number) => void;
+  onRowsUpserted?: (rows: any[]) => void;
+  // Partial deltas { synergyId, ...changedFields } from row.changed and
+  // /rows/changes: merge into rows already held (mergeRowDeltas) and fetch
+  // the rest in full (fetchRowsByCodes), never add them as rows.
+  onRowsChanged?: (deltas: any[]) => void;
   onRowDeleted?: (synergyId: string) => void;
   onPrefixSet?: (data: { prefix: string; next: number }) => void;
   onMessageNew?: (msg: any) => void;
@@ -17,6 +22,39 @@ const API_BASE =
 // Must match the key used in AuthPage.tsx / api.ts
 const USER_KEY = "synergy_user";
 
+/**
+ * Merge partial deltas into the rows a view holds. Returns the merged list and
+ * the codes it does not hold, which need a full fetch before they can show.
+ */
+export function mergeRowDeltas<T extends { synergyId: string }>(
+  rows: T[], deltas: any[], map: (row: any) => T = (row) => row
+): { rows: T[]; missing: string[] } {
+  const pending = new Map<string, any>(deltas.map((d) => [d.synergyId, d]));
+  const merged = rows.map((r) => {
+    const d = pending.get(r.synergyId);
+    if (!d) return r;
+    pending.delete(r.synergyId);
+    return map({ ...r, ...d });
+  });
+  return { rows: merged, missing: Array.from(pending.keys()) };
+}
+
+/** Full rows for `codes` under the view's own /rows filters, so only rows that belong in it come back. */
+export async function fetchRowsByCodes(
+  get: (path: string) => Promise<any>, codes: string[], viewParams?: URLSearchParams
+): Promise<any[]> {
+  const out: any[] = [];
+  for (let i = 0; i < codes.length; i += 200) {
+    const p = new URLSearchParams(viewParams);
+    ["offset", "total", "limit"].forEach((k) => p.delete(k));
+    p.set("codes", codes.slice(i, i + 200).join(","));
+    p.set("limit", "200");
+    const res = await get(`/rows?${p.toString()}`);
+    out.push(...(Array.isArray(res) ? res : res?.rows ?? []));
+  }
+  return out;
+}
+
 export function connectLive(apiBase = API_BASE, h: LiveHandlers = {}) {
   const base = (apiBase || "").replace(/\/+$/, "");
 
@@ -54,12 +92,51 @@ export function connectLive(apiBase = API_BASE, h: LiveHandlers = {}) {
     const p = parse(e as MessageEvent); if (p) h.onCategoryDeleted?.(p);
   });
 
+  // Row deltas: { version, changes: [{ version, synergyId, op, fields }] } or
+  // { version, truncated: true } when too many rows changed at once.
+  let lastVersion: number | null = null;
+  const applyChanges = (changes: any[]) => {
+    const deltas: any[] = [];
+    for (const c of changes || []) {
+      if (c.op === "delete") h.onRowDeleted?.(c.synergyId);
+      else deltas.push({ synergyId: c.synergyId, ...(c.fields || {}) });
+    }
+    if (deltas.length) h.onRowsChanged?.(deltas);
+  };
+  const catchUp = async () => {
+    if (lastVersion == null) return;
+    try {
+      let hasMore = true;
+      while (hasMore) {
+        const res = await fetch(`${base}/rows/changes?since=${lastVersion}`, { credentials: "include" });
+        const j = await res.json();
+        if (j.reset) { lastVersion = j.next; h.onRowBulkUpserted?.(0); return; }
+        applyChanges(j.changes);
+        hasMore = !!j.hasMore && j.next > lastVersion;
+        lastVersion = j.next;
+      }
+    } catch {}
+  };
+  ev.addEventListener("row.changed", (e) => {
+    const p = parse(e as MessageEvent); if (!p) return;
+    if (p.truncated) { if (lastVersion == null) h.onRowBulkUpserted?.(p.count ?? 0); else void catchUp(); }
+    else applyChanges(p.changes);
+    if (lastVersion == null || p.version > lastVersion) lastVersion = p.version;
+  });
+  // EventSource reconnects on its own; replay what we missed meanwhile.
+  ev.addEventListener("open", () => { void catchUp(); });
+
   ev.addEventListener("row.upserted", (e) => {
     const p = parse(e as MessageEvent); if (p) h.onRowUpserted?.(p);
   });
-  ev.addEventListener("row.bulkUpserted", (e) => {
-    const p = parse(e as MessageEvent); h.onRowBulkUpserted?.(p?.count ?? 0);
-  });
+  const onBulk = (e: Event) => {
+    const p = parse(e as MessageEvent);
+    // Batch PATCH ships the updated rows so views can merge instead of refetching.
+    if (Array.isArray(p?.rows) && h.onRowsUpserted) { h.onRowsUpserted(p.rows); return; }
+    h.onRowBulkUpserted?.(p?.count ?? 0);
+  };
+  ev.addEventListener("row.bulkUpserted", onBulk);
+  ev.addEventListener("row.bulk_upserted", onBulk);
   ev.addEventListener("row.deleted", (e) => {
     const p = parse(e as MessageEvent); if (p?.synergyId) h.onRowDeleted?.(p.synergyId);
   });
@@ -390,7 +390,7 @@ export default function AdminTools() {
   async function loadInventory() {
     if (!API_URL) return log("VITE_API_URL is not set.", "warn");
     try {
-      const r = await fetch(`${API_URL}/rows?limit=100000`);
+      const r = await fetch(`${API_URL}/rows?limit=100000&stream=json`);
       const rows: Row[] = await r.json();
       if (!Array.isArray(rows)) throw new Error("Unexpected /rows response");
       setInvRows(rows);
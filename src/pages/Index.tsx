@@ -1,4 +1,4 @@
-import React, { useMemo, useState, useEffect, useCallback } from "react";
+import React, { useMemo, useState, useEffect, useCallback, useRef } from "react";
 import { apiGet, apiPost, apiPatch } from "@/lib/api";
 import { Input } from "@/components/ui/input";
 import { Button } from "@/components/ui/button";
@@ -35,7 +35,7 @@ import {
 import { cn } from "@/lib/utils";
 import AuthPage from "@/components/AuthPage";
 import { type InventoryRow } from "@/lib/dataClient";
-import { connectLive } from "@/lib/live";
+import { connectLive, mergeRowDeltas, fetchRowsByCodes } from "@/lib/live";
 import { ChatWidget } from "@/components/ChatWidget";
 import { UserProfile } from "@/components/UserProfile";
 import { SortControl, type SortConfig } from "@/components/ui/SortControl";
@@ -344,6 +344,8 @@ export default function InventoryDashboard() {
   }, [API_URL]);
 
   const [rows, setRows] = useState<InventoryRow[]>([]);
+  const rowsRef = useRef<InventoryRow[]>(rows);
+  useEffect(() => { rowsRef.current = rows; }, [rows]);
 
  useEffect(() => {
     let alive = true;
@@ -523,6 +525,26 @@ export default function InventoryDashboard() {
           return prev;
         });
       },
+      onRowsChanged: (deltas) => {
+        // Deltas only carry the changed fields: merge them into rows we hold and
+        // judge anything new on its full row.
+        const { missing } = mergeRowDeltas(rowsRef.current, deltas);
+        setRows((prev) =>
+          mergeRowDeltas(prev, deltas, (r) => addConditionLabel(r as InventoryRow)).rows
+            .filter((r) => r.status !== "INTAKE")
+        );
+        if (!missing.length) return;
+        fetchRowsByCodes(apiGet, missing, new URLSearchParams({ status: "ALL" }))
+          .then((full) => {
+            const fresh = full.filter(isReadyForPosting).map(addConditionLabel) as InventoryRow[];
+            if (!fresh.length) return;
+            setRows((prev) => {
+              const held = new Set(prev.map((r) => r.synergyId));
+              return [...fresh.filter((r) => !held.has(r.synergyId)), ...prev];
+            });
+          })
+          .catch(() => {});
+      },
       onRowDeleted: (id) => {
         setRows((prev) => prev.filter((r) => r.synergyId !== id));
       },
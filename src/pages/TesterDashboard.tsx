@@ -15,7 +15,7 @@ import { UserProfile } from "@/components/UserProfile";
 import { ChatWidget } from "@/components/ChatWidget";
 import TesterIntakeModal from "@/components/TesterIntakeModal";
 import AuthPage from "@/components/AuthPage";
-import { connectLive } from "@/lib/live";
+import { connectLive, mergeRowDeltas, fetchRowsByCodes } from "@/lib/live";
 import { dataClient } from "@/lib/dataClient";
 import type { Grade } from "@/lib/grades";
 import { apiGet, apiPost, apiPatch } from "@/lib/api";
@@ -181,24 +181,36 @@ function TesterDashboardInner({ user, onLogout }: { user: any; onLogout: () => v
     return () => window.removeEventListener("keydown", handleGlobalKeyDown);
   }, []);
 
+  // The current view's /rows filters (the live handler reads them through viewParamsRef).
+  const viewParams = () => {
+    const params = new URLSearchParams();
+    if (deferredQuery) params.set("q", deferredQuery);
+    if (selectedGrade) params.set("grade", selectedGrade);
+    if (viewMode === "category" && selectedCategory && selectedCategory !== "all") params.set("category", selectedCategory);
+    if (viewMode === "po" && selectedPoId) {
+      params.set("po_id", selectedPoId);
+      if (selectedPoSubId) params.set("categoryId", selectedPoSubId);
+    }
+    if (statusFilter === "INCOMPLETE") params.set("status", "incomplete");
+    else if (statusFilter === "READY") params.set("status", "ready");
+    else if (statusFilter === "SCRAP") params.set("status", "SCRAP"); 
+    else if (statusFilter === "ALL") params.set("status", "ALL");
+    return params;
+  };
+  const viewParamsRef = useRef(viewParams);
+  viewParamsRef.current = viewParams;
+
   const fetchPage = async (offset: number) => {
     setLoadingRows(true);
     try {
-      const params = new URLSearchParams({ limit: String(settings.itemsPerPage), offset: String(offset) });
-      if (deferredQuery) params.set("q", deferredQuery);
-      if (selectedGrade) params.set("grade", selectedGrade);
-      if (viewMode === "category" && selectedCategory && selectedCategory !== "all") params.set("category", selectedCategory);
-      if (viewMode === "po" && selectedPoId) {
-        params.set("po_id", selectedPoId);
-        if (selectedPoSubId) params.set("categoryId", selectedPoSubId);
-      }
-      if (statusFilter === "INCOMPLETE") params.set("status", "incomplete");
-      else if (statusFilter === "READY") params.set("status", "ready");
-      else if (statusFilter === "SCRAP") params.set("status", "SCRAP"); 
-      else if (statusFilter === "ALL") params.set("status", "ALL");
+      const params = viewParams();
+      params.set("limit", String(settings.itemsPerPage));
+      params.set("offset", String(offset));
+      if (offset === 0) params.set("total", "auto");
 
       const res = await apiGet<any>(`/rows?${params.toString()}`);
       const arr = extractRows(res);
+      if (res && typeof res.total === "number") setTotalDbCount(res.total);
       const mapped = arr.map(mapApiRow).map(withGrade);
       setRows(prev => {
         const seen = new Set(prev.map(r => r.synergyId));
@@ -235,15 +247,15 @@ function TesterDashboardInner({ user, onLogout }: { user: any; onLogout: () => v
 
   const handleManualRefresh = async () => {
     setRefreshing(true); setRows([]); setNextOffset(0);
-    try { await Promise.all([ fetchPage(0), fetchTotalCount(), fetchStatusCounts(), fetchCategories(), fetchPOs(), selectedPoId ? fetchPoGroups(selectedPoId) : Promise.resolve() ]); } finally { setRefreshing(false); }
+    try { await Promise.all([ fetchPage(0), fetchStatusCounts(), fetchCategories(), fetchPOs(), selectedPoId ? fetchPoGroups(selectedPoId) : Promise.resolve() ]); } finally { setRefreshing(false); }
   };
 
   const recordPrintForRow = async (synergyId: string) => { await apiPost(`/rows/${synergyId}/record-print`, {}); setRows(prev => prev.map(r => r.synergyId === synergyId ? { ...r, lastPrintedAt: new Date().toISOString() } : r)); };
   const saveDraft = async (fromIntakePayload?: any) => { const current = draftRef.current ?? draft; if (!current) return; setSavingRows(true); try { if (!fromIntakePayload) { const patch = forApiPatch(current as any); await apiPatch(`/rows/${current.synergyId}`, patch); } if (settings.soundOnSave) { const ctx = new AudioContext(); const osc = ctx.createOscillator(); osc.connect(ctx.destination); osc.start(); osc.stop(ctx.currentTime + 0.1); } setRows([]); setNextOffset(0); fetchPage(0); setIntakeOpen(false); } catch (e: any) { } finally { setSavingRows(false); } };
 
   useEffect(() => { fetch(`${API_BASE}/health`).then(r => setDbConnected(r.ok)).catch(() => setDbConnected(false)); fetchCategories(); fetchPOs(); fetchTotalCount(); fetchStatusCounts(); fetchPage(0); }, []);
-  useEffect(() => { setRows([]); setNextOffset(0); fetchPage(0); fetchTotalCount(); }, [deferredQuery, selectedCategory, selectedPoId, selectedPoSubId, selectedGrade, statusFilter, viewMode]);
-  useEffect(() => { return connectLive(API_BASE, { onRowUpserted: (r) => { const g = withGrade(r as any); setRows(p => { const i = p.findIndex(x => x.synergyId === g.synergyId); if (i < 0) return [...p, g]; const n = [...p]; n[i] = { ...n[i], ...g }; return n; }); fetchTotalCount(); fetchStatusCounts(); }, onRowBulkUpserted: () => { fetchPage(0); fetchTotalCount(); fetchStatusCounts(); } }); }, []);
+  useEffect(() => { setRows([]); setNextOffset(0); fetchPage(0); }, [deferredQuery, selectedCategory, selectedPoId, selectedPoSubId, selectedGrade, statusFilter, viewMode]);
+  useEffect(() => { return connectLive(API_BASE, { onRowUpserted: (r) => { const g = withGrade(r as any); setRows(p => { const i = p.findIndex(x => x.synergyId === g.synergyId); if (i < 0) return [...p, g]; const n = [...p]; n[i] = { ...n[i], ...g }; return n; }); fetchTotalCount(); fetchStatusCounts(); }, onRowsUpserted: (rs) => { const gs = rs.map(r => withGrade(r as any)); setRows(p => { const n = [...p]; gs.forEach(g => { const i = n.findIndex(x => x.synergyId === g.synergyId); if (i < 0) n.push(g); else n[i] = { ...n[i], ...g }; }); return n; }); fetchTotalCount(); fetchStatusCounts(); }, onRowsChanged: (deltas) => { const toRow = (r: any) => withGrade(mapApiRow(r)); const { missing } = mergeRowDeltas(rowsRef.current, deltas); setRows(p => mergeRowDeltas(p, deltas, toRow).rows); if (missing.length) fetchRowsByCodes(apiGet, missing, viewParamsRef.current()).then(full => { if (!full.length) return; const gs = full.map(toRow); setRows(p => { const n = [...p]; gs.forEach(g => { const i = n.findIndex(x => x.synergyId === g.synergyId); if (i < 0) n.push(g); else n[i] = g; }); return n; }); }).catch(() => {}); fetchTotalCount(); fetchStatusCounts(); }, onRowBulkUpserted: () => { fetchPage(0); fetchTotalCount(); fetchStatusCounts(); } }); }, []);
 
   const createWorkspaceFromRow = (row: ListRow) => { const id = `ws-${Date.now()}`; const ws: Workspace = { id, title: row.productName, productName: row.productName, criteria: { productName: row.productName, categoryId: null }, seedRow: row, patch: { grade: row.grade, testedBy: user.name, specs: { ...row.specs } }, flags: { grade: true, testedBy: true, testedDate: true, testerComment: false, specs: true, price: false, ebayPrice: false, categoryId: false }, selection: rows.filter(r => r.synergyId !== row.synergyId && r.productName === row.productName).map(r => r.synergyId) }; setWorkspaces(p => [ws, ...p]); setActiveWsId(id); setWorkspaceOpen(true); };
 